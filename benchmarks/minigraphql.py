@@ -0,0 +1,300 @@
+"""
+Minimal GraphQL parser and executor for the mock GitHub API (see mock_github.py)
+
+Supports what the maintainer_v4 queries use: operations with variable definitions, aliases, arguments (variables,
+strings, numbers, booleans, null, enums, lists and input objects), named fragments, fragment spreads, inline
+fragments with type conditions and __typename. Fields are resolved from plain Python objects: a method is called
+with the field arguments, any other attribute is read as is. The query cost is estimated the way GitHub does,
+from the number of connection requests (see https://developer.github.com/v4/guides/resource-limitations/), and
+queries returning more nodes than an optional node limit fail with MAX_NODE_LIMIT_EXCEEDED.
+"""
+import math
+import re
+
+TOKEN = re.compile(r'''
+    (?P<ignored>[\s,]+|\#[^\n]*) |
+    (?P<spread>\.\.\.) |
+    (?P<punctuator>[!$():=@\[\]{}|]) |
+    (?P<name>[_A-Za-z][_0-9A-Za-z]*) |
+    (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?) |
+    (?P<string>"(?:[^"\\]|\\.)*")
+''', re.VERBOSE)
+
+
+class GraphQLError(Exception):
+    """
+    Query error, reported in the 'errors' list of the response
+    """
+
+
+def tokenize(source):
+    """
+    List of (kind, value) tokens of a GraphQL document
+    """
+    tokens, pos = [], 0
+    while pos < len(source):
+        match = TOKEN.match(source, pos)
+        if match is None:
+            raise GraphQLError(f"Syntax error at {pos}: {source[pos:pos + 20]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind != 'ignored':
+            tokens.append((kind, match.group(kind)))
+    tokens.append(('eof', None))
+
+    return tokens
+
+
+class Parser(object):
+    """
+    Recursive descent parser producing plain tuples/dicts
+    Field: ('field', alias, name, arguments, selections)
+    Fragment spread: ('spread', name)
+    Inline fragment: ('inline', type condition or None, selections)
+    """
+    def __init__(self, source):
+        self.tokens = tokenize(source)
+        self.pos = 0
+
+    def peek(self, value=None):
+        kind, token = self.tokens[self.pos]
+        return token if value is None else token == value
+
+    def take(self, value=None):
+        kind, token = self.tokens[self.pos]
+        if value is not None and token != value:
+            raise GraphQLError(f"Expected {value!r}, found {token!r}")
+        if kind == 'eof':
+            raise GraphQLError("Unexpected end of query")
+        self.pos += 1
+        return kind, token
+
+    def document(self):
+        """
+        :return: (operation selections, {fragment name: (type condition, selections)})
+        """
+        operation, fragments = None, {}
+        while self.tokens[self.pos][0] != 'eof':
+            if self.peek('fragment'):
+                self.take('fragment')
+                name = self.take()[1]
+                self.take('on')
+                fragments[name] = (self.take()[1], self.selection_set())
+            else:
+                if self.peek() in ('query', 'mutation'):
+                    self.take()
+                    if self.tokens[self.pos][0] == 'name':
+                        self.take()
+                    if self.peek('('):
+                        self.variable_definitions()
+                operation = self.selection_set()
+        if operation is None:
+            raise GraphQLError("No operation in the document")
+
+        return operation, fragments
+
+    def variable_definitions(self):
+        self.take('(')
+        while not self.peek(')'):
+            self.take('$')
+            self.take()
+            self.take(':')
+            self.type_reference()
+            if self.peek('='):
+                self.take('=')
+                self.value()
+        self.take(')')
+
+    def type_reference(self):
+        if self.peek('['):
+            self.take('[')
+            self.type_reference()
+            self.take(']')
+        else:
+            self.take()
+        if self.peek('!'):
+            self.take('!')
+
+    def selection_set(self):
+        self.take('{')
+        selections = []
+        while not self.peek('}'):
+            selections.append(self.selection())
+        self.take('}')
+
+        return selections
+
+    def selection(self):
+        if self.peek('...'):
+            self.take('...')
+            if self.peek('on'):
+                self.take('on')
+                return ('inline', self.take()[1], self.selection_set())
+            if self.peek('{'):
+                return ('inline', None, self.selection_set())
+            return ('spread', self.take()[1])
+        alias = name = self.take()[1]
+        if self.peek(':'):
+            self.take(':')
+            name = self.take()[1]
+        arguments = self.arguments() if self.peek('(') else {}
+        selections = self.selection_set() if self.peek('{') else None
+
+        return ('field', alias, name, arguments, selections)
+
+    def arguments(self):
+        self.take('(')
+        arguments = {}
+        while not self.peek(')'):
+            name = self.take()[1]
+            self.take(':')
+            arguments[name] = self.value()
+        self.take(')')
+
+        return arguments
+
+    def value(self):
+        kind, token = self.take()
+        if token == '$':
+            return ('variable', self.take()[1])
+        if kind == 'number':
+            return float(token) if any(char in token for char in '.eE') else int(token)
+        if kind == 'string':
+            return bytes(token[1:-1], 'utf-8').decode('unicode_escape')
+        if token == '[':
+            values = []
+            while not self.peek(']'):
+                values.append(self.value())
+            self.take(']')
+            return values
+        if token == '{':
+            fields = {}
+            while not self.peek('}'):
+                name = self.take()[1]
+                self.take(':')
+                fields[name] = self.value()
+            self.take('}')
+            return fields
+        # Keywords and enum values
+        return {'true': True, 'false': False, 'null': None}.get(token, token)
+
+
+def substitute(value, variables):
+    """
+    Argument value with its variables replaced
+    """
+    if isinstance(value, tuple) and value[0] == 'variable':
+        return variables.get(value[1])
+    if isinstance(value, list):
+        return [substitute(item, variables) for item in value]
+    if isinstance(value, dict):
+        return {name: substitute(item, variables) for name, item in value.items()}
+    return value
+
+
+def type_matches(obj, condition):
+    """
+    True if an object satisfies a fragment type condition (its type, or one of its interfaces/unions)
+    """
+    return condition is None or condition == obj.typename or condition in getattr(obj, 'implements', ())
+
+
+class Executor(object):
+    """
+    Executes one query against a root object
+    """
+    def __init__(self, fragments, variables):
+        self.fragments = fragments
+        self.variables = variables or {}
+        # Connection requests and nodes, multiplied by the page sizes of their parent connections; like GitHub's,
+        # the estimate is static, each connection selection (path of aliases) is counted once
+        self.requests = 0
+        self.nodes = 0
+        self.counted = set()
+
+    def collect_fields(self, obj, selections, fields=None):
+        """
+        Flatten the selections that apply to obj (fragments included), merging repeated fields
+        """
+        fields = {} if fields is None else fields
+        for selection in selections:
+            if selection[0] == 'field':
+                _, alias, name, arguments, subselections = selection
+                if alias in fields and subselections:
+                    fields[alias][3].extend(subselections)
+                elif alias not in fields:
+                    fields[alias] = [alias, name, arguments, list(subselections) if subselections else None]
+            elif selection[0] == 'spread':
+                condition, subselections = self.fragments[selection[1]]
+                if type_matches(obj, condition):
+                    self.collect_fields(obj, subselections, fields)
+            elif type_matches(obj, selection[1]):
+                self.collect_fields(obj, selection[2], fields)
+
+        return fields
+
+    def execute(self, obj, selections, multiplier=1, path=()):
+        """
+        Resolve selections against obj
+        :return: dict of the selected fields
+        """
+        result = {}
+        for alias, name, arguments, subselections in self.collect_fields(obj, selections).values():
+            if name == '__typename':
+                result[alias] = obj.typename
+                continue
+            attribute = getattr(obj, name, None)
+            arguments = {key: substitute(value, self.variables) for key, value in arguments.items()}
+            value = attribute(**arguments) if callable(attribute) else attribute
+
+            child_multiplier = multiplier
+            if getattr(value, 'is_connection', False):
+                if path + (alias,) not in self.counted:
+                    self.counted.add(path + (alias,))
+                    self.requests += multiplier
+                    self.nodes += multiplier * value.page_size
+                child_multiplier = multiplier * max(1, value.page_size)
+            result[alias] = self.complete(value, subselections, child_multiplier, path + (alias,))
+
+        return result
+
+    def complete(self, value, selections, multiplier, path=()):
+        if value is None or selections is None:
+            return value
+        if isinstance(value, (list, tuple)):
+            return [self.complete(item, selections, multiplier, path) for item in value]
+        return self.execute(value, selections, multiplier, path)
+
+    def cost(self):
+        """
+        Rate limit cost of the executed query: connection requests / 100, at least 1
+        """
+        return max(1, math.ceil(self.requests / 100))
+
+
+def execute(root, query, variables=None, rate_limit=None, node_limit=None):
+    """
+    Parse and execute a query
+    :param root: Query object the top level fields are resolved from
+    :param rate_limit: callable(cost) -> RateLimit object, resolved for the rateLimit field once the cost is known
+    :param node_limit: most nodes a query may return, None for no limit (GitHub: 500,000)
+    :return: (response dict with 'data' or 'errors', cost)
+    """
+    try:
+        selections, fragments = Parser(query).document()
+        executor = Executor(fragments, variables)
+        rate_limit_fields = [selection for selection in selections if selection[0] == 'field' and selection[2] == 'rateLimit']
+        data = executor.execute(root, [selection for selection in selections if selection not in rate_limit_fields])
+        if node_limit is not None and executor.nodes > node_limit:
+            # GitHub rejects the query before running it, nothing is charged
+            return {'errors': [{'type': 'MAX_NODE_LIMIT_EXCEEDED',
+                                'message': f"This query would return {executor.nodes} nodes, over {node_limit}"}]}, 0
+        cost = executor.cost()
+        if rate_limit is not None:
+            limit = rate_limit(cost)
+            for field in rate_limit_fields:
+                data[field[1]] = executor.execute(limit, field[4])
+    except GraphQLError as err:
+        return {'errors': [{'message': str(err)}]}, 1
+
+    return {'data': data}, cost
@@ -0,0 +1,696 @@
+"""
+Offline stand-in for the GitHub REST v3 / GraphQL v4 APIs and the Initial State events API
+
+Serves a synthetic organization (N repos with M PRs each, generated deterministically from a seed) through the
+endpoints maintainer_stats.py calls, with configurable latency, error rates and per-token rate limits, so runs
+can be measured and regression-tested without network access:
+
+- REST: /rate_limit, /orgs/:org, /orgs/:org/repos, /repos/:owner/:repo, traffic views/clones/referrers,
+  contributors (with Link rel="last"); ETags are sent and If-None-Match is answered with a free 304
+- GraphQL: POST /graphql, executed by a minimal resolver (see minigraphql.py) with GitHub's cost model and an
+  optional node limit (--node-limit), to exercise the adaptive query sizing of maintainer_v4.py
+- Initial State: POST /api/buckets, POST /api/events
+- Recorded responses (--recordings) are replayed verbatim before the synthetic ones
+- GET /__mock/stats returns the request counters as JSON, POST /__mock/reset clears them
+
+Usage:
+    python benchmarks/mock_github.py --repos 100 --prs 20 --port 8000 [--latency 50] [--error-rate 0.01]
+    python maintainer_stats.py --api-url http://127.0.0.1:8000 --iss-url http://127.0.0.1:8000/api -t mock ...
+"""
+import argparse
+import base64
+import datetime
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import minigraphql
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_ORG = 'mock-org'
+DEFAULT_RATE_LIMIT = 5000
+# PR timeline event types, in the order they happen
+PR_EVENT_TYPES = ('ReviewRequestedEvent', 'ReadyForReviewEvent', 'ReopenedEvent', 'MergedEvent', 'ReviewDismissedEvent')
+
+
+def iso(timestamp):
+    """
+    GitHub timestamp (2019-10-24T03:29:08Z) of epoch seconds
+    """
+    return datetime.datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# SYNTHETIC ORGANIZATION
+
+
+class SyntheticPullRequest(object):
+    def __init__(self, rng, number, now):
+        self.number = number
+        self.created_at = now - rng.uniform(1, 365) * 86400
+        self.state = rng.choices(('OPEN', 'CLOSED', 'MERGED'), weights=(2, 1, 7))[0]
+        self.events = []
+        when = self.created_at
+        if rng.random() < 0.8:
+            when += rng.uniform(0, 2) * 86400
+            self.events.append(('ReviewRequestedEvent', when))
+        if self.state == 'MERGED':
+            when += rng.uniform(0.1, 10) * 86400
+            self.events.append(('MergedEvent', when))
+        elif rng.random() < 0.1:
+            when += rng.uniform(0.1, 5) * 86400
+            self.events.append(('ReviewDismissedEvent', when))
+        self.updated_at = min(now, when + rng.uniform(0, 3) * 86400)
+
+
+class SyntheticRepo(object):
+    def __init__(self, rng, idx, prs, now):
+        self.name = f"repo-{idx:05d}"
+        self.id = 100000 + idx
+        self.stars = int(rng.paretovariate(1.2) * 5)
+        self.forks = self.stars // rng.randint(3, 10)
+        self.archived = rng.random() < 0.05
+        self.fork = rng.random() < 0.1
+        self.visibility = rng.choices(('PUBLIC', 'PRIVATE', 'INTERNAL'), weights=(6, 3, 1))[0]
+        self.topics = rng.sample(('python', 'instrument', 'driver', 'docs', 'ci', 'examples'), rng.randint(0, 3))
+        self.commits = rng.randint(1, 5000)
+        self.last_commit = now - rng.uniform(0, 400) * 86400
+        self.pushed_at = self.last_commit
+        self.created_at = now - rng.uniform(400, 3000) * 86400
+        self.open_issues = rng.randint(0, 50)
+        self.contributors = rng.randint(0, 200)
+        self.pull_requests = [SyntheticPullRequest(rng, number, now) for number in range(1, prs + 1)]
+        today = datetime.datetime.utcfromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.views = [(today - datetime.timedelta(days=day), rng.randint(0, 200), rng.randint(0, 40)) for day in range(14, 0, -1)]
+        self.clones = [(today - datetime.timedelta(days=day), rng.randint(0, 30), rng.randint(0, 10)) for day in range(14, 0, -1)]
+        self.referrers = [(site, rng.randint(1, 500), rng.randint(1, 100))
+                          for site in rng.sample(('github.com', 'google.com', 'tek.com', 'pypi.org', 'bing.com'), rng.randint(0, 5))]
+
+
+class SyntheticOrg(object):
+    """
+    Deterministic synthetic organization: the same (repos, prs, seed) always generates the same data
+    """
+    def __init__(self, login=DEFAULT_ORG, repos=10, prs=10, seed=0):
+        rng = random.Random(seed)
+        now = time.time()
+        self.login = login
+        self.repos = [SyntheticRepo(rng, idx, prs, now) for idx in range(repos)]
+        self.by_name = {repo.name: repo for repo in self.repos}
+
+
+# GRAPHQL SCHEMA OBJECTS
+
+
+class LazySequence(object):
+    """
+    Sequence of length items built on access, for connections over large counts (stargazers, commits)
+    """
+    def __init__(self, length, factory):
+        self.length = length
+        self.factory = factory
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return [self.factory(idx) for idx in range(*index.indices(self.length))]
+
+
+class PageInfo(object):
+    typename = 'PageInfo'
+
+    def __init__(self, start, end, total):
+        self.startCursor = Connection.cursor(start) if end > start else None
+        self.endCursor = Connection.cursor(end - 1) if end > start else None
+        self.hasNextPage = end < total
+        self.hasPreviousPage = start > 0
+
+
+class Edge(object):
+    typename = 'Edge'
+
+    def __init__(self, node, cursor):
+        self.node = node
+        self.cursor = cursor
+
+
+class Connection(object):
+    """
+    Cursor-paginated connection with first/last/after/before
+    """
+    typename = 'Connection'
+    is_connection = True
+
+    def __init__(self, items, first=None, last=None, after=None, before=None, **_):
+        total = len(items)
+        start = self.offset(after) + 1 if after else 0
+        end = self.offset(before) if before else total
+        if first is not None:
+            end = min(end, start + first)
+        if last is not None:
+            start = max(start, end - last)
+        self.page_size = first or last or 0
+        self.totalCount = total
+        self.page = items[start:end] if (first is not None or last is not None) else []
+        self.start = start
+        self.pageInfo = PageInfo(start, start + len(self.page), total)
+
+    @staticmethod
+    def cursor(idx):
+        return base64.b64encode(f"cursor:{idx}".encode()).decode()
+
+    @staticmethod
+    def offset(cursor):
+        return int(base64.b64decode(cursor).decode().split(':')[1])
+
+    @property
+    def nodes(self):
+        return list(self.page)
+
+    @property
+    def edges(self):
+        return [Edge(node, self.cursor(self.start + idx)) for idx, node in enumerate(self.page)]
+
+
+class RateLimitNode(object):
+    typename = 'RateLimit'
+
+    def __init__(self, limit, cost, remaining, reset):
+        self.limit = limit
+        self.cost = cost
+        self.remaining = remaining
+        self.used = limit - remaining
+        self.resetAt = iso(reset)
+        self.nodeCount = 0
+
+
+class UserNode(object):
+    typename = 'User'
+    implements = ('RequestedReviewer', 'Actor', 'Node')
+
+    def __init__(self, login):
+        self.login = login
+
+
+class Topic(object):
+    typename = 'Topic'
+
+    def __init__(self, name):
+        self.name = name
+
+
+class RepositoryTopic(object):
+    typename = 'RepositoryTopic'
+
+    def __init__(self, name):
+        self.topic = Topic(name)
+
+
+class TimelineEvent(object):
+    implements = ('PullRequestTimelineItems', 'Node')
+
+    def __init__(self, typename, created_at):
+        self.typename = typename
+        self.createdAt = iso(created_at)
+        self.requestedReviewer = UserNode('reviewer') if typename == 'ReviewRequestedEvent' else None
+
+
+class PullRequestNode(object):
+    typename = 'PullRequest'
+    implements = ('Node',)
+
+    def __init__(self, pull_request):
+        self.pr = pull_request
+        self.id = f"PR_{pull_request.number}"
+        self.number = pull_request.number
+        self.title = f"Pull request #{pull_request.number}"
+        self.createdAt = iso(pull_request.created_at)
+        self.updatedAt = iso(pull_request.updated_at)
+        self.state = pull_request.state
+
+    def timelineItems(self, itemTypes=None, **page):
+        typenames = {''.join(word.capitalize() for word in item_type.split('_')) for item_type in itemTypes or []}
+        events = [TimelineEvent(typename, when) for typename, when in self.pr.events
+                  if not typenames or typename in typenames]
+        return Connection(events, **page)
+
+
+class CommitNode(object):
+    typename = 'Commit'
+    implements = ('GitObject', 'Node')
+
+    def __init__(self, repo, idx=0):
+        self.repo = repo
+        self.idx = idx
+        self.committedDate = iso(repo.last_commit - idx * 3600)
+        self.commitUrl = f"https://github.com/{repo.name}/commit/{idx:040x}"
+        self.oid = f"{idx:040x}"
+
+    def history(self, **page):
+        return Connection(LazySequence(self.repo.commits, lambda idx: CommitNode(self.repo, idx)), **page)
+
+
+class RefNode(object):
+    typename = 'Ref'
+
+    def __init__(self, repo):
+        self.name = 'main'
+        self.target = CommitNode(repo)
+
+
+class RepositoryNode(object):
+    typename = 'Repository'
+    implements = ('Node',)
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.name = repo.name
+        self.isArchived = repo.archived
+        self.isFork = repo.fork
+        self.visibility = repo.visibility
+        self.pushedAt = iso(repo.pushed_at)
+        self.forkCount = repo.forks
+        self.defaultBranchRef = RefNode(repo)
+
+    def object(self, expression=None):
+        return CommitNode(self.repo)
+
+    def stargazers(self, **page):
+        return Connection(LazySequence(self.repo.stars, lambda idx: UserNode(f"stargazer-{idx}")), **page)
+
+    def mentionableUsers(self, **page):
+        return Connection(LazySequence(self.repo.contributors, lambda idx: UserNode(f"user-{idx}")), **page)
+
+    def issues(self, states=None, **page):
+        return Connection(LazySequence(self.repo.open_issues, lambda idx: None), **page)
+
+    def pullRequests(self, states=None, orderBy=None, **page):
+        states = [states] if isinstance(states, str) else states
+        pull_requests = [pr for pr in self.repo.pull_requests if not states or pr.state in states]
+        if orderBy:
+            key = {'UPDATED_AT': 'updated_at', 'CREATED_AT': 'created_at'}.get(orderBy.get('field'), 'created_at')
+            pull_requests.sort(key=lambda pr: getattr(pr, key), reverse=orderBy.get('direction') == 'DESC')
+        return Connection([PullRequestNode(pr) for pr in pull_requests], **page)
+
+    def repositoryTopics(self, **page):
+        return Connection([RepositoryTopic(name) for name in self.repo.topics], **page)
+
+
+class OrganizationNode(object):
+    typename = 'Organization'
+
+    def __init__(self, org):
+        self.org = org
+        self.login = org.login
+
+    def repositories(self, isFork=None, orderBy=None, privacy=None, isArchived=None, **page):
+        repos = [repo for repo in self.org.repos if (isFork is None or repo.fork == isFork)
+                 and (isArchived is None or repo.archived == isArchived)]
+        if orderBy:
+            key = {'PUSHED_AT': 'pushed_at', 'CREATED_AT': 'created_at', 'NAME': 'name'}.get(orderBy.get('field'), 'name')
+            repos.sort(key=lambda repo: getattr(repo, key), reverse=orderBy.get('direction') == 'DESC')
+        return Connection([RepositoryNode(repo) for repo in repos], **page)
+
+
+class QueryRoot(object):
+    typename = 'Query'
+
+    def __init__(self, org):
+        self.org = org
+        self.viewer = UserNode('mock-user')
+
+    def repository(self, owner=None, name=None):
+        repo = self.org.by_name.get(name) if owner == self.org.login else None
+        return RepositoryNode(repo) if repo else None
+
+    def organization(self, login=None):
+        return OrganizationNode(self.org) if login == self.org.login else None
+
+
+# REST PAYLOADS
+
+
+def repo_json(base_url, org, repo):
+    return {
+        'id': repo.id, 'name': repo.name, 'full_name': f"{org.login}/{repo.name}",
+        'owner': {'login': org.login, 'type': 'Organization', 'url': f"{base_url}/users/{org.login}"},
+        'private': repo.visibility != 'PUBLIC', 'fork': repo.fork, 'archived': repo.archived,
+        'url': f"{base_url}/repos/{org.login}/{repo.name}", 'html_url': f"https://github.com/{org.login}/{repo.name}",
+        'stargazers_count': repo.stars, 'watchers_count': repo.stars, 'forks_count': repo.forks,
+        'open_issues_count': repo.open_issues, 'default_branch': 'main', 'visibility': repo.visibility.lower(),
+        'pushed_at': iso(repo.pushed_at), 'created_at': iso(repo.created_at), 'updated_at': iso(repo.pushed_at),
+        'topics': repo.topics,
+    }
+
+
+def traffic_json(buckets, key):
+    return {'count': sum(count for _, count, _ in buckets), 'uniques': sum(uniques for _, _, uniques in buckets),
+            key: [{'timestamp': day.strftime("%Y-%m-%dT%H:%M:%SZ"), 'count': count, 'uniques': uniques}
+                  for day, count, uniques in buckets]}
+
+
+class MockState(object):
+    """
+    Synthetic data, failure injection settings, rate limits and request counters shared by the handler threads
+    """
+    def __init__(self, org, latency=0.0, jitter=0.0, error_rate=0.0, secondary_rate=0.0, rate_limit=DEFAULT_RATE_LIMIT,
+                 window=3600, recordings=None, seed=0, node_limit=None):
+        self.org = org
+        self.root = QueryRoot(org)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.secondary_rate = secondary_rate
+        self.rate_limit = rate_limit
+        self.window = window
+        self.recordings = recordings or []
+        self.node_limit = node_limit
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.resolve_lock = threading.Lock()
+        # (token, resource): [remaining, reset epoch]
+        self.limits = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = dict(requests=0, rest=0, graphql=0, iss=0, graphql_cost=0, not_modified=0, errors=0,
+                              rate_limited=0, node_limited=0, events=0, status={})
+
+    def count(self, kind, status, cost=0):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats[kind] += 1
+            self.stats['graphql_cost'] += cost
+            self.stats['status'][str(status)] = self.stats['status'].get(str(status), 0) + 1
+
+    def spend(self, token, resource, cost):
+        """
+        Spend cost points of a token's budget
+        :return: (allowed, rate limit headers)
+        """
+        now = time.time()
+        with self.lock:
+            state = self.limits.get((token, resource))
+            if state is None or state[1] <= now:
+                state = self.limits[(token, resource)] = [self.rate_limit, int(now + self.window)]
+            allowed = state[0] >= cost
+            if allowed:
+                state[0] -= cost
+            remaining, reset = state
+        return allowed, {'X-RateLimit-Limit': str(self.rate_limit), 'X-RateLimit-Remaining': str(remaining),
+                         'X-RateLimit-Reset': str(reset), 'X-RateLimit-Used': str(self.rate_limit - remaining),
+                         'X-RateLimit-Resource': resource}
+
+    def peek(self, token, resource):
+        with self.lock:
+            state = self.limits.get((token, resource))
+            if state is None or state[1] <= time.time():
+                return self.rate_limit, int(time.time() + self.window)
+            return tuple(state)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    One request of the mock APIs; the MockState is attached to the server
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def token(self):
+        authorization = self.headers.get('Authorization') or ''
+        return authorization.split()[-1] if authorization else 'anonymous'
+
+    def send_json(self, status, body, headers=None):
+        data = b'' if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def inject_failure(self, headers):
+        """
+        Send an injected 502 or secondary rate limit 403
+        :return: status sent, None if the request goes through
+        """
+        state = self.state
+        with state.lock:
+            roll = state.rng.random()
+            if roll < state.error_rate + state.secondary_rate:
+                state.stats['errors'] += 1
+        if roll < state.error_rate:
+            self.send_json(502, {'message': 'Server Error'}, headers)
+            return 502
+        if roll < state.error_rate + state.secondary_rate:
+            self.send_json(403, {'message': 'You have exceeded a secondary rate limit. Please wait a few minutes.'},
+                           dict(headers, **{'Retry-After': '1'}))
+            return 403
+        return None
+
+    def delay(self):
+        state = self.state
+        if state.latency or state.jitter:
+            time.sleep(max(0.0, state.latency + state.rng.uniform(-state.jitter, state.jitter)))
+
+    def recorded(self, method, path, body=b''):
+        for recording in self.state.recordings:
+            if recording.get('method', 'GET') == method and recording['path'] in (self.path, path) and \
+                    recording.get('query_contains', '') in body.decode('utf-8', 'replace'):
+                self.send_json(recording.get('status', 200), recording.get('body'), recording.get('headers'))
+                return recording.get('status', 200)
+        return None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/__mock/stats':
+            with self.state.lock:
+                self.send_json(200, self.state.stats)
+            return
+        self.delay()
+        status = self.recorded('GET', url.path)
+        if status is None:
+            status = self.rest(url.path, {key: values[-1] for key, values in parse_qs(url.query).items()})
+        self.state.count('rest', status)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.read_body()
+        if url.path == '/__mock/reset':
+            self.state.reset_stats()
+            self.send_json(204, None)
+            return
+        self.delay()
+        if url.path.startswith('/api/'):
+            events = json.loads(body or b'[]')
+            if url.path == '/api/events':
+                with self.state.lock:
+                    self.state.stats['events'] += len(events)
+            status = 204 if url.path == '/api/events' else 201
+            self.send_json(status, None)
+            self.state.count('iss', status)
+            return
+        status = self.recorded('POST', url.path, body)
+        cost = 0
+        if status is None and url.path == '/graphql':
+            status, cost = self.graphql(json.loads(body or b'{}'))
+        elif status is None:
+            self.send_json(404, {'message': 'Not Found'})
+            status = 404
+        self.state.count('graphql', status, cost)
+
+    def graphql(self, request):
+        state = self.state
+        token = self.token()
+        remaining, reset = state.peek(token, 'graphql')
+        headers = {'X-RateLimit-Limit': str(state.rate_limit), 'X-RateLimit-Remaining': str(remaining),
+                   'X-RateLimit-Reset': str(reset), 'X-RateLimit-Resource': 'graphql'}
+        failure = self.inject_failure(headers)
+        if failure:
+            return failure, 0
+
+        charged = {}
+
+        def rate_limit(cost):
+            charged['allowed'], charged['headers'] = state.spend(token, 'graphql', cost)
+            return RateLimitNode(state.rate_limit, cost, int(charged['headers']['X-RateLimit-Remaining']),
+                                 int(charged['headers']['X-RateLimit-Reset']))
+
+        with state.resolve_lock:
+            # Queries are resolved one at a time, the synthetic data is not thread-safe to page through
+            response, cost = minigraphql.execute(state.root, request.get('query', ''), request.get('variables'),
+                                                 rate_limit, state.node_limit)
+        if any(error.get('type') == 'MAX_NODE_LIMIT_EXCEEDED' for error in response.get('errors', [])):
+            with state.lock:
+                state.stats['node_limited'] += 1
+        if not charged.get('allowed', True):
+            with state.lock:
+                state.stats['rate_limited'] += 1
+            self.send_json(403, {'message': 'API rate limit exceeded'}, charged['headers'])
+            return 403, 0
+        self.send_json(200, response, charged.get('headers', headers))
+        return 200, cost
+
+    def rest(self, path, params):
+        state = self.state
+        org = state.org
+        base_url = self.server.base_url
+        token = self.token()
+
+        if path == '/rate_limit':
+            # Not counted against the rate limit
+            resources = {}
+            for resource in ('core', 'graphql', 'search'):
+                remaining, reset = state.peek(token, resource)
+                resources[resource] = {'limit': state.rate_limit, 'remaining': remaining, 'reset': reset,
+                                       'used': state.rate_limit - remaining}
+            self.send_json(200, {'resources': resources, 'rate': resources['core']})
+            return 200
+
+        allowed, headers = state.spend(token, 'core', 1)
+        if not allowed:
+            with state.lock:
+                state.stats['rate_limited'] += 1
+            self.send_json(403, {'message': 'API rate limit exceeded'}, headers)
+            return 403
+        failure = self.inject_failure(headers)
+        if failure:
+            return failure
+
+        status, body, extra = self.route(path, params, org, base_url)
+        headers.update(extra)
+        if status == 200:
+            etag = '"' + hashlib.md5(json.dumps(body, sort_keys=True).encode()).hexdigest() + '"'
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                # Conditional requests answered with 304 are free: give the point back
+                with state.lock:
+                    state.limits[(token, 'core')][0] += 1
+                    state.stats['not_modified'] += 1
+                headers['X-RateLimit-Remaining'] = str(int(headers['X-RateLimit-Remaining']) + 1)
+                self.send_json(304, None, headers)
+                return 304
+        self.send_json(status, body, headers)
+        return status
+
+    def route(self, path, params, org, base_url):
+        """
+        (status, body, extra headers) of a REST endpoint
+        """
+        not_found = (404, {'message': 'Not Found'}, {})
+        match = re.match(r'^/orgs/([^/]+)(/repos)?$', path)
+        if match:
+            if match.group(1) != org.login:
+                return not_found
+            if not match.group(2):
+                return 200, {'login': org.login, 'id': 1, 'type': 'Organization', 'url': f"{base_url}/orgs/{org.login}",
+                             'repos_url': f"{base_url}/orgs/{org.login}/repos", 'public_repos': len(org.repos)}, {}
+            per_page, page = int(params.get('per_page', 30)), int(params.get('page', 1))
+            last = max(1, math.ceil(len(org.repos) / per_page))
+            repos = org.repos[(page - 1) * per_page:page * per_page]
+            links = []
+            if page < last:
+                links.append(f'<{base_url}{path}?per_page={per_page}&page={page + 1}>; rel="next"')
+                links.append(f'<{base_url}{path}?per_page={per_page}&page={last}>; rel="last"')
+            return 200, [repo_json(base_url, org, repo) for repo in repos], {'Link': ', '.join(links)} if links else {}
+
+        match = re.match(r'^/repos/([^/]+)/([^/]+)(/.*)?$', path)
+        if not match or match.group(1) != org.login or match.group(2) not in org.by_name:
+            return not_found
+        repo = org.by_name[match.group(2)]
+        endpoint = match.group(3) or ''
+        if endpoint == '':
+            return 200, repo_json(base_url, org, repo), {}
+        if endpoint == '/traffic/views':
+            return 200, traffic_json(repo.views, 'views'), {}
+        if endpoint == '/traffic/clones':
+            return 200, traffic_json(repo.clones, 'clones'), {}
+        if endpoint == '/traffic/popular/referrers':
+            return 200, [{'referrer': site, 'count': count, 'uniques': uniques} for site, count, uniques in repo.referrers], {}
+        if endpoint == '/contributors':
+            if not repo.contributors:
+                return 204, None, {}
+            per_page, page = int(params.get('per_page', 30)), int(params.get('page', 1))
+            last = max(1, math.ceil(repo.contributors / per_page))
+            first = (page - 1) * per_page
+            body = [{'login': f"user-{idx}", 'id': idx, 'type': 'User', 'contributions': 1}
+                    for idx in range(first, min(repo.contributors, first + per_page))]
+            url = f"{base_url}{path}"
+            links = {}
+            if page < last:
+                links['Link'] = f'<{url}?per_page={per_page}&page={page + 1}>; rel="next", ' \
+                                f'<{url}?per_page={per_page}&page={last}>; rel="last"'
+            return 200, body, links
+        return not_found
+
+
+def serve(state, host='127.0.0.1', port=0, verbose=False):
+    """
+    Start the mock server in a background thread
+    :return: the server (server.base_url, stopped with shutdown())
+    """
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.state = state
+    server.verbose = verbose
+    server.base_url = f"http://{host}:{server.server_port}"
+    threading.Thread(target=server.serve_forever, name='mock-github', daemon=True).start()
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline mock GitHub / Initial State server')
+    parser.add_argument('--org', default=DEFAULT_ORG, help='organization login (default: %(default)s)')
+    parser.add_argument('--repos', type=int, default=10, help='number of synthetic repos (default: %(default)s)')
+    parser.add_argument('--prs', type=int, default=10, help='PRs per repo (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='synthetic data seed (default: %(default)s)')
+    parser.add_argument('--host', default='127.0.0.1', help='listen address (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8000, help='listen port (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0, help='mean added latency per request, ms (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0, help='latency jitter, +/- ms (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of 502 responses (default: 0)')
+    parser.add_argument('--secondary-rate', type=float, default=0,
+                        help='fraction of secondary rate limit 403 responses (default: 0)')
+    parser.add_argument('--rate-limit', type=int, default=DEFAULT_RATE_LIMIT,
+                        help='points per token, resource and window (default: %(default)s)')
+    parser.add_argument('--window', type=int, default=3600, help='rate limit window, seconds (default: %(default)s)')
+    parser.add_argument('--node-limit', type=int, help='most nodes a GraphQL query may return (default: no limit)')
+    parser.add_argument('--recordings', help='JSON list of recorded responses {method, path, status, headers, body, '
+                                             'query_contains} served before the synthetic ones')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    recordings = None
+    if args.recordings:
+        with open(args.recordings) as recordings_file:
+            recordings = json.load(recordings_file)
+    state = MockState(SyntheticOrg(args.org, args.repos, args.prs, args.seed), args.latency / 1000, args.jitter / 1000,
+                      args.error_rate, args.secondary_rate, args.rate_limit, args.window, recordings, args.seed,
+                      args.node_limit)
+    server = serve(state, args.host, args.port, args.verbose)
+    print(f"Mock GitHub serving {args.repos} repos of {args.org} on {server.base_url} (Ctrl-C to stop)", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
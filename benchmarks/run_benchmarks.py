@@ -0,0 +1,183 @@
+"""
+Benchmark suite of maintainer_stats.py against the offline mock GitHub server (see mock_github.py)
+
+For every org size, a synthetic organization is served by an in-process mock server and maintainer_stats.py
+collects all of its repos in a subprocess. Wall time, peak RSS of the collector, API requests, GraphQL cost and
+Initial State events are recorded; with --baseline, a metric that grew by more than --threshold over the
+baseline fails the run (exit code 1), so the suite can gate changes in CI. A run that failed any repo (from its
+--metrics-json export) or produced no events fails as well: a fast run that collected nothing is not a speedup.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--sizes 10,100,1000] [--prs 10] [--latency 20] [--args "-w 8"]
+                                        [--output results.json] [--baseline baseline.json] [--threshold 0.2]
+"""
+import argparse
+import json
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import mock_github
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCRIPT = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'maintainer_stats.py')
+# Metrics compared with the baseline, lower is better
+GATED_METRICS = ('wall_s', 'peak_rss_mb', 'requests', 'graphql_cost')
+
+
+def failed_repos(metrics_path):
+    """
+    Repos that failed in a maintainer_stats.py run, from its --metrics-json export
+    :return: count, None when the run exported no metrics
+    """
+    try:
+        with open(metrics_path) as metrics_file:
+            counters = json.load(metrics_file)['counters']
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return sum(entry['value'] for entry in counters.get('maintainer_repos_total', [])
+               if entry['labels'].get('result') == 'failed')
+
+
+def run_once(script, org, extra_args, mock_args, verbose=False):
+    """
+    Serve org from a fresh mock server and collect it with one maintainer_stats.py run
+    :return: dict of the measured metrics
+    """
+    state = mock_github.MockState(org, **mock_args)
+    server = mock_github.serve(state)
+    try:
+        with tempfile.TemporaryDirectory() as state_dir, tempfile.TemporaryFile() as stderr_file:
+            env = dict(os.environ, GITHUB_TOKEN='mock-token', GITHUB_API_URL=server.base_url,
+                       ISS_URL=server.base_url + '/api', ISS_BUCKET_NAME='benchmark', ISS_BUCKET_KEY='benchmark',
+                       ISS_ACCESS_KEY='benchmark')
+            metrics_path = os.path.join(state_dir, 'metrics.json')
+            # --metrics-json last, it wins over one in extra_args
+            command = [sys.executable, script, '-o', org.login, '--all-repos', '-s', '--state-dir', state_dir] + \
+                extra_args + ['--metrics-json', metrics_path]
+            start = time.perf_counter()
+            # stderr goes to a file: a full pipe would block the child while it is waited for
+            child = subprocess.Popen(command, env=env, stdout=None if verbose else subprocess.DEVNULL,
+                                     stderr=None if verbose else stderr_file)
+            # wait4 reports the resource usage of this child only (RUSAGE_CHILDREN accumulates every run)
+            _, status, usage = os.wait4(child.pid, 0)
+            wall = time.perf_counter() - start
+            child.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status >> 8
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode(errors='replace')
+            failed = failed_repos(metrics_path)
+        with urllib.request.urlopen(server.base_url + '/__mock/stats') as response:
+            stats = json.load(response)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if child.returncode:
+        print(f"{os.path.basename(script)} exited with {child.returncode}:\n{stderr[-2000:]}", file=sys.stderr)
+    elif failed is None:
+        print(f"{os.path.basename(script)} exported no metrics:\n{stderr[-2000:]}", file=sys.stderr)
+    elif failed:
+        print(f"{os.path.basename(script)} failed {failed} of {len(org.repos)} repos:\n{stderr[-2000:]}", file=sys.stderr)
+    elif not stats['events']:
+        print(f"{os.path.basename(script)} produced no events", file=sys.stderr)
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak_rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+    return dict(exit_code=child.returncode, failed=bool(child.returncode or failed is None or failed or not stats['events']),
+                failed_repos=failed, wall_s=round(wall, 3), peak_rss_mb=round(peak_rss, 1),
+                requests=stats['rest'] + stats['graphql'], rest=stats['rest'], graphql=stats['graphql'],
+                graphql_cost=stats['graphql_cost'], not_modified=stats['not_modified'], errors=stats['errors'],
+                rate_limited=stats['rate_limited'], node_limited=stats['node_limited'], events=stats['events'],
+                event_batches=stats['iss'])
+
+
+def run_size(args, size, extra_args, mock_args):
+    """
+    Median of --repeat runs against an org of size repos
+    """
+    org = mock_github.SyntheticOrg(mock_github.DEFAULT_ORG, size, args.prs, args.seed)
+    runs = [run_once(args.script, org, extra_args, mock_args, args.verbose) for _ in range(args.repeat)]
+    result = {key: statistics.median(run[key] for run in runs) for key in runs[0] if key not in ('failed', 'failed_repos')}
+    result['exit_code'] = max(run['exit_code'] for run in runs)
+    # Any failed run fails the size, whatever the median
+    result['failed'] = any(run['failed'] for run in runs)
+    result['failed_repos'] = max(run['failed_repos'] if run['failed_repos'] is not None else size for run in runs)
+    result['repos'] = size
+
+    return result
+
+
+def compare(results, baseline, threshold):
+    """
+    Regressions of results over the baseline
+    :return: list of (repos, metric, baseline value, current value)
+    """
+    baseline_by_size = {entry['repos']: entry for entry in baseline['results']}
+    regressions = []
+    for result in results:
+        previous = baseline_by_size.get(result['repos'])
+        if previous is None:
+            continue
+        for metric in GATED_METRICS:
+            if metric in previous and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append((result['repos'], metric, previous[metric], result[metric]))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='maintainer_stats.py benchmarks against the offline mock GitHub')
+    parser.add_argument('--sizes', default='10,100,1000', help='org sizes, comma separated (default: %(default)s)')
+    parser.add_argument('--prs', type=int, default=10, help='PRs per repo (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='synthetic data seed (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per size, the median is kept (default: 1)')
+    parser.add_argument('--latency', type=float, default=0, help='mock latency per request, ms (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0, help='mock latency jitter, +/- ms (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of mock 502 responses (default: 0)')
+    parser.add_argument('--rate-limit', type=int, default=mock_github.DEFAULT_RATE_LIMIT,
+                        help='mock rate limit points per token (default: %(default)s)')
+    parser.add_argument('--node-limit', type=int, help='mock GraphQL node limit per query (default: no limit)')
+    parser.add_argument('--args', default='', help='extra maintainer_stats.py arguments, e.g. "-w 8 --batch-size 25"')
+    parser.add_argument('--script', default=DEFAULT_SCRIPT, help='collector script (default: maintainer_stats.py)')
+    parser.add_argument('--output', help='write the results as JSON (usable as a later --baseline)')
+    parser.add_argument('--baseline', help='results JSON of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed growth of %s over the baseline (default: %%(default)s)' % '/'.join(GATED_METRICS))
+    parser.add_argument('-v', '--verbose', action='store_true', help='show the collector output')
+    args = parser.parse_args()
+
+    mock_args = dict(latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+                     rate_limit=args.rate_limit, seed=args.seed, node_limit=args.node_limit)
+    extra_args = shlex.split(args.args)
+    results = []
+    print(f"{'repos':>6} {'wall s':>8} {'RSS MB':>8} {'requests':>9} {'GQL cost':>9} {'304':>6} {'events':>8} {'failed':>7} {'exit':>5}")
+    for size in (int(size) for size in args.sizes.split(',')):
+        result = run_size(args, size, extra_args, mock_args)
+        results.append(result)
+        print(f"{size:>6} {result['wall_s']:>8.2f} {result['peak_rss_mb']:>8.1f} {result['requests']:>9} "
+              f"{result['graphql_cost']:>9} {result['not_modified']:>6} {result['events']:>8} {result['failed_repos']:>7} {result['exit_code']:>5}",
+              flush=True)
+
+    report = dict(args=args.args, prs=args.prs, latency_ms=args.latency, error_rate=args.error_rate, results=results)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    failed = any(result['failed'] for result in results)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for repos, metric, previous, current in regressions:
+            print(f"REGRESSION {repos} repos: {metric} {previous} -> {current}")
+        failed = failed or bool(regressions)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Persistent conditional-request (ETag / Last-Modified) cache for the GitHub REST API v3
+
+Responses are stored on disk (SQLite) keyed by URL plus the token they were fetched with. Later requests for the
+same URL are sent with If-None-Match / If-Modified-Since, and a 304 Not Modified (which GitHub does not count
+against the rate limit) is answered from the stored body. Endpoints with a TTL override are served straight from
+disk while the entry is younger than the TTL. A caller that sent its own validators (e.g. PyGithub's update()) and
+already holds the stored version gets a 304 back instead of the body, so it can still tell a change apart.
+The cache is capped in size, evicting least recently used entries.
+
+Conditional requests:
+https://developer.github.com/v3/#conditional-requests
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import requests
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_CACHE_SIZE_MB = 100
+# TTL override pattern of the contributor count requests (see --contributors-refresh)
+CONTRIBUTORS_URL = r'/contributors$'
+# Body headers that no longer describe the stored (already decoded) body
+DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+class HttpCache(object):
+    """
+    On-disk LRU cache of GET responses with their validators
+    """
+    def __init__(self, cache_dir, max_size_mb=DEFAULT_CACHE_SIZE_MB, ttl=None):
+        """
+        Initialize the HttpCache class object
+        :param cache_dir: directory holding the cache database
+        :type cache_dir: str
+        :param max_size_mb: cap on the stored bodies, in MB
+        :type max_size_mb: float
+        :param ttl: {url regex: seconds} entries served without revalidation while younger than seconds
+        :type ttl: dict
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.ttl = [(re.compile(pattern), seconds) for pattern, seconds in (ttl or {}).items()]
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'http_cache.sqlite'), check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.db.commit()
+
+    @staticmethod
+    def parse_ttl(values):
+        """
+        {url regex: seconds} from command line PATTERN=SECONDS values
+        """
+        ttl = {}
+        for value in values or []:
+            pattern, _, seconds = value.rpartition('=')
+            ttl[pattern] = float(seconds)
+
+        return ttl
+
+    @staticmethod
+    def key(url, params=None, authorization=None):
+        """
+        Cache key for a URL (and query parameters) fetched with a given token
+        The token itself is never stored, only a digest of it
+        """
+        scope = hashlib.sha256((authorization or '').encode()).hexdigest()
+        query = json.dumps(sorted((params or {}).items()))
+        return hashlib.sha256(f"{url}|{query}|{scope}".encode()).hexdigest()
+
+    def ttl_for(self, url):
+        """
+        TTL override in seconds for a URL, None if the endpoint is always revalidated
+        """
+        for pattern, seconds in self.ttl:
+            if pattern.search(url):
+                return seconds
+        return None
+
+    def get(self, key):
+        """
+        Stored entry for a key, None if absent
+        """
+        with self.lock:
+            row = self.db.execute("SELECT url, etag, last_modified, headers, body, stored_at FROM responses WHERE key = ?",
+                                  (key,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+
+        url, etag, last_modified, headers, body, stored_at = row
+        return dict(url=url, etag=etag, last_modified=last_modified, headers=json.loads(headers), body=body,
+                    stored_at=stored_at)
+
+    def is_fresh(self, entry):
+        """
+        True if the entry can be served without revalidation (TTL override not yet expired)
+        """
+        ttl = self.ttl_for(entry['url'])
+        return ttl is not None and time.time() - entry['stored_at'] < ttl
+
+    def put(self, key, url, response):
+        """
+        Store a 200 response, if it carries a validator or its endpoint has a TTL override
+        """
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if etag is None and last_modified is None and self.ttl_for(url) is None:
+            return
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in DROPPED_HEADERS}
+        body = response.content
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (key, url, etag, last_modified, json.dumps(headers), body, len(body), now, now))
+            self.evict()
+            self.db.commit()
+
+    def refresh(self, key):
+        """
+        Restart the TTL of an entry that was just revalidated with a 304
+        """
+        with self.lock:
+            self.db.execute("UPDATE responses SET stored_at = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+
+    def evict(self):
+        """
+        Drop least recently used entries until the stored bodies fit the size cap (caller holds the lock)
+        """
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_size:
+                break
+
+    @staticmethod
+    def is_current(entry, headers):
+        """
+        True if the request's own If-None-Match / If-Modified-Since validators name the stored version
+        """
+        if entry['etag'] and headers.get('If-None-Match'):
+            return headers['If-None-Match'] == entry['etag']
+        return bool(entry['last_modified']) and headers.get('If-Modified-Since') == entry['last_modified']
+
+    @staticmethod
+    def to_response(entry, not_modified=False):
+        """
+        Rebuild a requests.Response from a stored entry
+        :param not_modified: answer with a bodyless 304, for a caller that already holds the stored version
+        :type not_modified: bool
+        """
+        response = requests.Response()
+        response.status_code, response.reason = (304, 'Not Modified') if not_modified else (200, 'OK')
+        response.url = entry['url']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = 'utf-8'
+        response._content = b'' if not_modified else entry['body']
+
+        return response
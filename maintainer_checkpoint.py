@@ -0,0 +1,119 @@
+"""
+Checkpoint journal of a collection run (--resume)
+
+Every repo is appended to an NDJSON journal under the state directory as soon as it is collected, with its
+results, or with its error when its collection failed. A run started with --resume skips the repos the journal
+records as done and re-emits their stored results, so a run that died partway only spends quota on the repos it
+had not finished (including the failed ones, which are retried). A run that finished without failures ends the
+journal with a completion record, after which --resume starts over instead of re-emitting the finished run.
+"""
+import json
+import os
+import threading
+import time
+
+
+class Journal(object):
+    """
+    Append-only NDJSON journal of the repos collected by a run
+    """
+    def __init__(self, state_dir, org, resume=False, name='checkpoint'):
+        """
+        Initialize the Journal class object
+        :param state_dir: directory holding the journal
+        :type state_dir: str
+        :param org: organization the repos belong to, entries of other organizations are ignored
+        :type org: str
+        :param resume: keep the entries of the previous run, otherwise the journal is started over
+        :type resume: bool
+        :param name: journal file name, without extension (e.g. one per shard)
+        :type name: str
+        """
+        os.makedirs(state_dir, exist_ok=True)
+        self.org = org
+        self.lock = threading.Lock()
+        self.path = os.path.join(state_dir, name + '.ndjson')
+        self.entries = self.load() if resume else {}
+        self.journal = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        if resume and self.journal.tell() and not self.ends_with_newline():
+            # Terminate a last line cut short by a crash, so the next entry starts on its own line
+            self.journal.write('\n')
+
+    def load(self):
+        """
+        Latest entry of every repo of the organization, {repo: entry}
+        """
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line cut short by a crash
+                    continue
+                if entry.get('org') != self.org:
+                    continue
+                if entry.get('status') == 'complete':
+                    # The previous run finished, nothing to resume
+                    entries = {}
+                else:
+                    entries[entry['repo']] = entry
+
+        return entries
+
+    def ends_with_newline(self):
+        """
+        True if the journal file ends with a complete line
+        """
+        with open(self.path, 'rb') as journal:
+            journal.seek(-1, os.SEEK_END)
+            return journal.read(1) == b'\n'
+
+    def completed(self):
+        """
+        {repo: results} of the repos already collected
+        """
+        return {repo: entry['results'] for repo, entry in self.entries.items() if entry['status'] == 'done'}
+
+    def append(self, entry):
+        """
+        Append one entry, on disk before the next repo is collected
+        """
+        entry = dict(entry, org=self.org, at=time.time())
+        with self.lock:
+            self.entries[entry['repo']] = entry
+            self.write(entry)
+
+    def write(self, entry):
+        """
+        Write one line and sync it to disk (called with the lock held)
+        """
+        self.journal.write(json.dumps(entry, sort_keys=True, default=str) + '\n')
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def done(self, results):
+        """
+        Record a collected repo and its results
+        """
+        self.append(dict(repo=results['repo'], status='done', results=results))
+
+    def failed(self, repo, err):
+        """
+        Record a repo whose collection failed, retried by the next --resume (safe from worker threads)
+        """
+        self.append(dict(repo=repo, status='failed', error=repr(err)))
+
+    def close(self, complete=False):
+        """
+        Close the journal file
+        :param complete: the run finished without failures, record it so that the next --resume starts over
+        :type complete: bool
+        """
+        if complete:
+            with self.lock:
+                self.entries = {}
+                self.write(dict(org=self.org, status='complete', at=time.time()))
+        self.journal.close()
@@ -0,0 +1,285 @@
+# -*- coding: UTF-8 -*-
+"""
+Per-repo collection of the maintainer stats, shared by maintainer_stats.py and the long-running modes.
+
+Each repo is collected through its own RepoCollector, which binds private copies of the APIv3/APIv4
+Maintainer objects to that repo, so several repos can be collected at the same time by a worker pool.
+
+With the GraphQL-only backend (--backend graphql), stars, forks and contributors come from APIv4 as well and
+the APIv3 client is only used for the traffic endpoints; without traffic metrics (--no-traffic) there is no
+APIv3 client at all and the traffic fields are left out of the results.
+"""
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Metric groups, in collection and streaming order
+METRIC_GROUPS = ('discovery', 'usage', 'retention', 'health')
+
+# std out report columns, and the result fields they are read from
+REPORT_HEADERS = ['repository', 'total views', 'unique views', 'total clones', 'unique clones', 'total stars', 'total forks',
+                  'contributors', 'total commits', '# Days since Commit', 'open issues', 'open PRs', 'Avg PR Response Time(days)']
+REPORT_FIELDS = ['repo', 'total_views', 'unique_views', 'total_clones', 'unique_cloners', 'total_stars', 'forks_count',
+                 'contributor_count', 'commits', 'time_since_last', 'total_open_issues', 'total_open_pull_reqs',
+                 'total_average_time_for_pr']
+# Distribution fields of the PR response times and open PR ages (see pr_latency_fields)
+PR_LATENCY_FIELDS = ('pr_response_time_median', 'pr_response_time_p90', 'pr_response_time_p99', 'open_pr_ages')
+
+
+class RepoCollector(object):
+    """
+    Collects the metric groups of a single repo
+    """
+    def __init__(self, mtr3, mtr4, repo, seed=None):
+        """
+        Initialize the collector context for one repo
+        :param mtr3: shared Maintainer (APIv3) object, copied and bound to this repo, None without traffic metrics
+        :type mtr3: obj
+        :param mtr4: shared Maintainer (APIv4) object, copied and bound to this repo
+        :type mtr4: obj
+        :param repo: repository name
+        :type repo: str
+        :param seed: result fields already collected in bulk, e.g. by Maintainer.get_batch_metrics or
+                     Maintainer.enumerate_org_repos; only the missing metrics are queried (default: None)
+        :type seed: dict
+        """
+        self.repo = repo
+        self.mtr3 = mtr3.for_repo(repo) if mtr3 else None
+        self.mtr4 = mtr4.for_repo(repo)
+        self.seed = seed or {}
+
+    def collect_discovery(self):
+        """
+        Various Discovery Metrics (NOTE: GitHub APIv3, stars from APIv4 with the GraphQL-only backend)
+        """
+        if self.mtr4.backend == 'graphql':
+            results = dict(total_stars=self.seed['total_stars'] if 'total_stars' in self.seed
+                           else self.mtr4.get_discovery_metrics())
+            if self.mtr3:
+                # Only the traffic endpoints are left, no need to fetch the repository itself
+                repo = self.mtr3.get_repo_handle(lazy=True)
+                results['total_views'], results['unique_views'] = self.mtr3.get_views_count(repo)
+                results['total_referrals'], results['unique_referrals'] = self.mtr3.get_referrer_count(repo)
+                results['views_daily'] = self.mtr3.traffic.get('views', [])
+            return results
+        if 'total_stars' in self.seed:
+            # Only the traffic endpoints are left, no need to fetch the repository itself
+            repo = self.mtr3.get_repo_handle(lazy=True)
+            total_views, unique_views = self.mtr3.get_views_count(repo)
+            total_referrals, unique_referrals = self.mtr3.get_referrer_count(repo)
+            total_stars = self.seed['total_stars']
+        else:
+            total_views, unique_views, total_referrals, unique_referrals, total_stars = self.mtr3.get_discovery_metrics()
+        return dict(total_views=total_views, unique_views=unique_views, total_referrals=total_referrals,
+                    unique_referrals=unique_referrals, total_stars=total_stars,
+                    views_daily=self.mtr3.traffic.get('views', []))
+
+    def collect_usage(self):
+        """
+        Miscellaneous Usage Metrics (NOTE: GitHub APIv3, forks and contributors from APIv4 with the GraphQL-only backend)
+        """
+        if self.mtr4.backend == 'graphql':
+            if 'contributor_count' in self.seed:
+                forks_count, contributor_count = self.seed['forks_count'], self.seed['contributor_count']
+            elif 'forks_count' in self.seed:
+                # Forks are known from the org enumeration, only the contributors are left
+                forks_count, contributor_count = self.seed['forks_count'], self.mtr4.get_contributor_count()
+            else:
+                forks_count, contributor_count = self.mtr4.get_usage_metrics()
+            results = dict(forks_count=forks_count, contributor_count=contributor_count)
+            if self.mtr3:
+                repo = self.mtr3.get_repo_handle(lazy=True)
+                results['total_clones'], results['unique_cloners'] = self.mtr3.get_clone_count(repo)
+                results['clones_daily'] = self.mtr3.traffic.get('clones', [])
+            return results
+        if 'forks_count' in self.seed:
+            repo = self.mtr3.get_repo_handle(lazy=True)
+            total_clones, unique_cloners = self.mtr3.get_clone_count(repo)
+            contributor_count = self.mtr3.get_contributor_count(repo)
+            forks_count = self.seed['forks_count']
+        else:
+            total_clones, unique_cloners, forks_count, contributor_count = self.mtr3.get_usage_metrics()
+        return dict(total_clones=total_clones, unique_cloners=unique_cloners, forks_count=forks_count,
+                    contributor_count=contributor_count, clones_daily=self.mtr3.traffic.get('clones', []))
+
+    def collect_retention(self):
+        """
+        Assorted Retention Metrics (NOTE: GitHub APIv4)
+        """
+        if 'commits' in self.seed:
+            commits, time_since_last = self.seed['commits'], self.seed['time_since_last']
+        else:
+            commits, time_since_last = self.mtr4.get_retention_metrics()
+        return dict(commits=commits, time_since_last=time_since_last)
+
+    def collect_health(self):
+        """
+        Disparate Project Health Metrics (NOTE: GitHub APIv4)
+        """
+        if 'total_average_time_for_pr' in self.seed:
+            total_open_issues, total_open_pull_reqs, total_average_time_for_pr = \
+                self.seed['total_open_issues'], self.seed['total_open_pull_reqs'], self.seed['total_average_time_for_pr']
+        elif 'total_open_issues' in self.seed:
+            # Counts are known, only the Average PR Response Time is left
+            total_open_issues, total_open_pull_reqs = self.seed['total_open_issues'], self.seed['total_open_pull_reqs']
+            open_pull_requests = None
+            if not total_open_pull_reqs:
+                open_pull_requests = {'nodes': [], 'pageInfo': {'hasNextPage': False, 'endCursor': None}}
+            total_average_time_for_pr = self.mtr4.get_pr_response_time(open_pull_requests)
+        else:
+            total_open_issues, total_open_pull_reqs, total_average_time_for_pr = self.mtr4.get_project_health_metrics()
+        results = dict(total_open_issues=total_open_issues, total_open_pull_reqs=total_open_pull_reqs,
+                       total_average_time_for_pr=total_average_time_for_pr)
+        if 'total_average_time_for_pr' in self.seed:
+            # The distributions were computed with the batch
+            results.update({field: self.seed[field] for field in PR_LATENCY_FIELDS if field in self.seed})
+        else:
+            results.update(pr_latency_fields(self.mtr4.pr_aggregates))
+
+        return results
+
+    def collect(self, groups=METRIC_GROUPS):
+        """
+        Collect the requested metric groups
+        :param groups: metric group names (default: all of METRIC_GROUPS)
+        :type groups: tuple
+        :return: dict of result fields, including 'repo'
+        """
+        results = dict(repo=self.repo)
+        # Per-repo per-group timings, requests and GraphQL cost (see maintainer_instrument.py)
+        instruments = self.mtr4.transport.instruments
+        for group in groups:
+            with instruments.collecting(self.repo, group) if instruments else contextlib.nullcontext():
+                results.update(getattr(self, 'collect_' + group)())
+
+        return results
+
+
+def collect_repos(mtr3, mtr4, repo_list, workers=1, seeds=None, claim=None, on_error=None):
+    """
+    Collect every repo in repo_list with a bounded worker pool
+    :param mtr3: Maintainer (APIv3) object
+    :param mtr4: Maintainer (APIv4) object
+    :param repo_list: repository names
+    :param workers: number of repos collected at the same time (default: 1)
+    :param seeds: {repo: result fields already collected in bulk} (default: None)
+    :param claim: callable claiming a repo before it is collected, repos it returns False for are skipped
+                  (e.g. maintainer_shard.ClaimDir.claim) (default: None, every repo is collected)
+    :param on_error: callable(repo, exception) a failed repo is reported to before it is skipped
+                     (default: None, the first failure aborts the collection)
+    :return: generator of result dicts, in repo_list order
+    """
+    seeds = seeds or {}
+
+    def collect(repo):
+        if claim is not None and not claim(repo):
+            return None
+        try:
+            return RepoCollector(mtr3, mtr4, repo, seeds.get(repo)).collect()
+        except Exception as err:
+            if on_error is None:
+                raise
+            on_error(repo, err)
+            return None
+
+    if workers <= 1:
+        for repo in repo_list:
+            results = collect(repo)
+            if results is not None:
+                yield results
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # map() hands results back in submission order, whichever repo finishes first
+        for results in executor.map(collect, repo_list):
+            if results is not None:
+                yield results
+
+
+def pr_latency_fields(aggregates):
+    """
+    Result fields of the PR latency aggregates (Maintainer.pr_aggregates): the distribution of the PR response
+    times (every stored PR's in incremental mode) and of the open PR ages; none when nothing was aggregated
+    """
+    if not aggregates:
+        return {}
+    fields = {'pr_response_time_' + stat: aggregates[stat] for stat in ('median', 'p90', 'p99')}
+    fields['open_pr_ages'] = aggregates['open_ages']
+
+    return fields
+
+
+def batch_seeds(batch_metrics):
+    """
+    Seed result fields from Maintainer.get_batch_metrics results
+    """
+    seeds = {}
+    for repo, metrics in batch_metrics.items():
+        if metrics:
+            (commits, time_since_last), (total_open_issues, total_open_pull_reqs, total_average_time_for_pr) = metrics[:2]
+            seeds[repo] = dict(commits=commits, time_since_last=time_since_last, total_open_issues=total_open_issues,
+                               total_open_pull_reqs=total_open_pull_reqs, total_average_time_for_pr=total_average_time_for_pr)
+            seeds[repo].update(pr_latency_fields(metrics[2]))
+            if len(metrics) > 3:
+                # Stars, forks and contributors of the GraphQL-only backend
+                seeds[repo]['total_stars'], seeds[repo]['forks_count'], seeds[repo]['contributor_count'] = metrics[3]
+
+    return seeds
+
+
+def report_row(results):
+    """
+    std out report row for one repo's results
+    """
+    return [results.get(field) for field in REPORT_FIELDS]
+
+
+# Initial State signal suffix of every scalar result field (see repo_signals)
+FIELD_SIGNALS = {'total_views': '_total_views', 'unique_views': '_unique_views', 'total_stars': '_total_stars',
+                 'total_clones': '_total_clones', 'unique_cloners': '_unique_clones', 'forks_count': '_total_forks',
+                 'contributor_count': '_total_contributors', 'commits': '_total_commits',
+                 'time_since_last': '_time_elapsed_commits', 'total_open_issues': '_total_open_issues',
+                 'total_open_pull_reqs': '_total_open_prs', 'total_average_time_for_pr': '_PR_response_time'}
+
+def repo_signals(results, group):
+    """
+    Initial State signals (name, value) of one metric group for one repo's results
+    The traffic signals are left out when the traffic metrics were not collected (--no-traffic).
+    """
+    repo = results['repo']
+    if group == 'discovery':
+        # Iterate through referring sites until a full list is compiled into individual signals
+        signals = []
+        if 'total_views' in results:
+            signals += [(repo + "_total_refer_from" + key, val) for key, val in results['total_referrals'].items()]
+            signals += [(repo + "_unique_refer_from_" + key, val) for key, val in results['unique_referrals'].items()]
+            signals += [(repo + "_total_views", results['total_views']),
+                        (repo + "_unique_views", results['unique_views'])]
+        signals += [(repo + "_total_stars", results['total_stars'])]
+    elif group == 'usage':
+        signals = []
+        if 'total_clones' in results:
+            signals += [(repo + "_total_clones", results['total_clones']),
+                        (repo + "_unique_clones", results['unique_cloners'])]
+        signals += [(repo + "_total_forks", results['forks_count']),
+                    (repo + "_total_contributors", results['contributor_count'])]
+    elif group == 'retention':
+        signals = [(repo + "_total_commits", results['commits']),
+                   (repo + "_time_elapsed_commits", results['time_since_last'])]
+    else:
+        signals = [(repo + "_total_open_issues", results['total_open_issues']),
+                   (repo + "_total_open_prs", results['total_open_pull_reqs']),
+                   (repo + "_PR_response_time", results['total_average_time_for_pr'])]
+
+    return signals
+
+
+def stream_results(streamer, results):
+    """
+    Log every metric group of one repo's results to the Initial State streamer
+    """
+    progress = {'discovery': ("(╯°□°)╯", " "), 'usage': ("︵", ""), 'retention': ("┻━┻", ""), 'health': ("!!", "\t")}
+    for group in METRIC_GROUPS:
+        for signal, value in repo_signals(results, group):
+            streamer.log(signal, value)
+        print(progress[group][0], end=progress[group][1], flush=True)
+        streamer.flush()
@@ -0,0 +1,173 @@
+# -*- coding: UTF-8 -*-
+"""
+Long-running mode of maintainer_stats.py (--daemon)
+
+Instead of collecting every metric of every repo once per cron invocation, a single process keeps the
+GitHub clients (keep-alive connections, repo handles, contributor counts, ETag cache) warm and refreshes each
+metric group on its own interval: stars change minute to minute while the traffic endpoints only update daily.
+Repos are spread evenly across each interval, so refreshes trickle in instead of bursting at the top of the
+interval. SIGTERM/SIGINT stop the scheduler after the refresh in progress, and the streamer is flushed and closed.
+"""
+import heapq
+import signal
+import threading
+import time
+import traceback
+import maintainer_collect
+
+# Default refresh interval of each metric group, in seconds
+DEFAULT_INTERVALS = {'discovery': 15 * 60, 'usage': 6 * 3600, 'retention': 3600, 'health': 30 * 60}
+
+
+def parse_intervals(values):
+    """
+    {group: seconds} from the defaults updated by command line GROUP=SECONDS values
+    """
+    intervals = dict(DEFAULT_INTERVALS)
+    for value in values or []:
+        group, _, seconds = value.partition('=')
+        if group not in intervals:
+            raise ValueError(f"Unknown metric group '{group}', expected one of {', '.join(maintainer_collect.METRIC_GROUPS)}")
+        intervals[group] = float(seconds)
+
+    return intervals
+
+
+class Daemon(object):
+    """
+    Scheduler refreshing every (metric group, repo) pair on the metric group's interval
+    """
+    def __init__(self, mtr3, mtr4, repo_list, streamer=None, intervals=None, debug=False, history=None,
+                 groups=maintainer_collect.METRIC_GROUPS, results=None, lock=None, kept_fields=()):
+        """
+        Initialize the Daemon class object
+        :param mtr3: Maintainer (APIv3) object, kept for the whole run
+        :type mtr3: obj
+        :param mtr4: Maintainer (APIv4) object, kept for the whole run
+        :type mtr4: obj
+        :param repo_list: repository names
+        :type repo_list: list
+        :param streamer: Initial State streamer the refreshed signals are logged to (default: None, report only)
+        :type streamer: obj
+        :param intervals: {group: seconds} refresh interval of each metric group (default: DEFAULT_INTERVALS)
+        :type intervals: dict
+        :param debug: print every refresh
+        :type debug: bool
+        :param history: history store every refresh is appended to (default: None)
+        :type history: maintainer_history.HistoryStore
+        :param groups: metric groups to refresh, e.g. only the traffic groups when the others are kept up to date
+                       by webhooks (default: all of METRIC_GROUPS)
+        :type groups: tuple
+        :param results: {repo: latest result fields} shared with another updater, e.g. the webhook receiver
+                        (default: None, a new one)
+        :type results: dict
+        :param lock: lock guarding the shared results (default: None, a new one)
+        :type lock: threading.Lock
+        :param kept_fields: result fields kept up to date by the other updater, refreshes never overwrite them
+                            (default: none)
+        :type kept_fields: tuple
+        """
+        self.mtr3 = mtr3
+        self.mtr4 = mtr4
+        self.repo_list = list(repo_list)
+        self.streamer = streamer
+        self.intervals = intervals or dict(DEFAULT_INTERVALS)
+        self.debug = debug
+        self.history = history
+        self.groups = groups
+        self.stop_event = threading.Event()
+        # Heap of (due time, sequence, group, repo), sequence keeps the order stable between equal due times
+        self.schedule = []
+        self.sequence = 0
+        # {repo: latest result fields}, kept for the final report
+        self.results = results if results is not None else {}
+        for repo in self.repo_list:
+            self.results.setdefault(repo, dict(repo=repo))
+        self.lock = lock or threading.Lock()
+        self.kept_fields = kept_fields
+
+    def push(self, due, group, repo):
+        """
+        Schedule a refresh of one metric group of one repo
+        """
+        heapq.heappush(self.schedule, (due, self.sequence, group, repo))
+        self.sequence += 1
+
+    def stagger(self, start):
+        """
+        Spread the first refresh of every repo evenly across each group's interval, groups starting with
+        their first repo right away so the dashboard is populated on startup
+        """
+        for group in self.groups:
+            step = self.intervals[group] / max(1, len(self.repo_list))
+            for idx, repo in enumerate(self.repo_list):
+                self.push(start + idx * step, group, repo)
+
+    def stop(self, signum=None, frame=None):
+        """
+        Ask the scheduler to stop after the refresh in progress (also the SIGTERM/SIGINT handler)
+        """
+        if signum is not None:
+            print(f"\nReceived signal {signum}, stopping after the refresh in progress", flush=True)
+        self.stop_event.set()
+
+    def install_signal_handlers(self):
+        """
+        Stop cleanly on SIGTERM (e.g. systemd, docker stop) and SIGINT (Ctrl-C)
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def refresh(self, group, repo):
+        """
+        Collect one metric group of one repo and log its signals to the streamer
+        """
+        collector = maintainer_collect.RepoCollector(self.mtr3, self.mtr4, repo)
+        if group in ('discovery', 'usage') and self.mtr4.backend == 'mixed':
+            # Repo handles are kept between refreshes, bring stars/forks up to date
+            collector.mtr3.refresh_repo_handle()
+        results = collector.collect((group,))
+        with self.lock:
+            results = {field: value for field, value in results.items() if field not in self.kept_fields}
+            self.results[repo].update(results)
+            # Signals of the group with the latest values, including the kept fields
+            latest = dict(self.results[repo])
+        if self.history is not None:
+            self.history.record(results)
+        if self.debug:
+            print(f"refresh(): {group} {repo} {results}")
+        if self.streamer is not None:
+            for signal_name, value in maintainer_collect.repo_signals(latest, group):
+                self.streamer.log(signal_name, value)
+            self.streamer.flush()
+
+    def run(self):
+        """
+        Refresh metric groups as they fall due until stopped
+        :return: {repo: latest result fields}
+        """
+        self.stagger(time.time())
+        print("Daemon started for {0} repos, refresh intervals: {1}".format(
+            len(self.repo_list), ", ".join(f"{group} {round(self.intervals[group])}s" for group in self.groups)),
+            flush=True)
+        while self.schedule and not self.stop_event.is_set():
+            due, _, group, repo = self.schedule[0]
+            # Sleep until the next refresh falls due, waking up right away on a stop request
+            if self.stop_event.wait(max(0.0, due - time.time())):
+                break
+            heapq.heappop(self.schedule)
+            try:
+                self.refresh(group, repo)
+            except Exception as err:
+                # A failed refresh is retried on the next interval, it must not take the daemon down
+                print(f"Refreshing {group} for {repo} failed: {err!r}", flush=True)
+                if self.debug:
+                    traceback.print_exc()
+            # Keep the cadence from the due time, skipping missed intervals if a refresh overran
+            next_due = due + self.intervals[group]
+            while next_due <= time.time():
+                next_due += self.intervals[group]
+            self.push(next_due, group, repo)
+        print("Daemon stopped", flush=True)
+
+        return self.results
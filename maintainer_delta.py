@@ -0,0 +1,163 @@
+"""
+Delta-only emission of the Initial State signals (--delta)
+
+Most signals (stars, forks, commits, referrers...) do not change between two runs, yet every run used to log all
+of them. DeltaFilter wraps the streamer and only forwards a signal when its value differs from the last value
+sent for that key, or when the last send is older than the heartbeat, so unchanged tiles still get a fresh point
+every heartbeat. The last-sent values are kept on disk (SQLite) between runs and as 64-bit digests in memory, so
+comparing tens of thousands of signal keys stays cheap. With a streamer that reports its deliveries (see
+maintainer_emitter.Emitter.on_delivery), a value only becomes the last-sent value once it is delivered, so a
+batch that failed is sent again by the next run instead of being skipped until the heartbeat.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_HEARTBEAT_HOURS = 24
+
+
+def digest(value):
+    """
+    64-bit digest of a signal value
+    """
+    encoded = json.dumps(value, sort_keys=True, default=str).encode()
+    return int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), 'big', signed=True)
+
+
+class LastSentStore(object):
+    """
+    SQLite store of the digest and send time of the last value sent for every signal key, per bucket
+    """
+    def __init__(self, state_dir):
+        """
+        Initialize the LastSentStore class object
+        :param state_dir: directory holding the last-sent database
+        :type state_dir: str
+        """
+        os.makedirs(state_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(state_dir, 'last_sent.sqlite'), check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS last_sent (
+                bucket_key TEXT NOT NULL,
+                key TEXT NOT NULL,
+                digest INTEGER NOT NULL,
+                sent_at REAL NOT NULL,
+                PRIMARY KEY (bucket_key, key)
+            )
+        """)
+        self.db.commit()
+
+    def load(self, bucket_key):
+        """
+        {key: (digest, sent_at)} of every signal sent to a bucket
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT key, digest, sent_at FROM last_sent WHERE bucket_key = ?", (bucket_key,))
+            return {key: (value_digest, sent_at) for key, value_digest, sent_at in rows}
+
+    def save(self, bucket_key, sent):
+        """
+        Record the signals sent since the last save
+        :param sent: {key: (digest, sent_at)}
+        :type sent: dict
+        """
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO last_sent VALUES (?, ?, ?, ?)",
+                                [(bucket_key, key, value_digest, sent_at)
+                                 for key, (value_digest, sent_at) in sent.items()])
+            self.db.commit()
+
+
+class DeltaFilter(object):
+    """
+    Streamer wrapper forwarding only the signals that changed, or whose heartbeat is due
+    """
+    def __init__(self, streamer, store, bucket_key, heartbeat_hours=DEFAULT_HEARTBEAT_HOURS):
+        """
+        Initialize the DeltaFilter class object
+        :param streamer: streamer the changed signals are forwarded to (log/flush/close)
+        :type streamer: obj
+        :param store: last-sent values kept between runs
+        :type store: LastSentStore
+        :param bucket_key: Initial State bucket key the last-sent values are kept for
+        :type bucket_key: str
+        :param heartbeat_hours: hours after which an unchanged value is sent again, 0 to never resend
+                                (default: DEFAULT_HEARTBEAT_HOURS)
+        :type heartbeat_hours: float
+        """
+        self.streamer = streamer
+        self.store = store
+        self.bucket_key = bucket_key
+        self.heartbeat = heartbeat_hours * 3600
+        self.lock = threading.Lock()
+        self.last_sent = store.load(bucket_key)
+        # Signals sent since the last flush, written to the store in one transaction
+        self.dirty = {}
+        # Signals handed to a streamer that reports its deliveries, not delivered yet
+        self.pending = {}
+        self.confirmed = hasattr(streamer, 'on_delivery')
+        if self.confirmed:
+            streamer.on_delivery = self.delivered
+        self.forwarded = 0
+        self.suppressed = 0
+
+    def log(self, key, value, epoch=None):
+        """
+        Forward a signal to the streamer unless it is unchanged and its heartbeat is not due
+        """
+        now = time.time()
+        value_digest = digest(value)
+        with self.lock:
+            last = self.pending.get(key) or self.last_sent.get(key)
+            if last is not None and last[0] == value_digest and (not self.heartbeat or now - last[1] < self.heartbeat):
+                self.suppressed += 1
+                return
+            if self.confirmed:
+                self.pending[key] = (value_digest, now)
+            else:
+                self.last_sent[key] = self.dirty[key] = (value_digest, now)
+            self.forwarded += 1
+        self.streamer.log(key, value, epoch)
+
+    def delivered(self, events, delivered):
+        """
+        Delivery callback of the streamer: the delivered values become the last-sent values, the dropped ones are
+        forgotten so that they are sent again
+        """
+        with self.lock:
+            for event in events:
+                pending = self.pending.get(event['key'])
+                # Replayed events of earlier runs, and values superseded since, are not pending
+                if pending is None or pending[0] != digest(event['value']):
+                    continue
+                del self.pending[event['key']]
+                if delivered:
+                    self.last_sent[event['key']] = self.dirty[event['key']] = pending
+
+    def save(self):
+        """
+        Persist the signals sent since the last save
+        """
+        with self.lock:
+            dirty, self.dirty = self.dirty, {}
+        if dirty:
+            self.store.save(self.bucket_key, dirty)
+
+    def flush(self):
+        """
+        Flush the streamer and persist the signals sent since the last flush
+        """
+        self.streamer.flush()
+        self.save()
+
+    def close(self):
+        """
+        Close the streamer, then persist the last-sent values of everything it delivered
+        """
+        self.streamer.close()
+        self.save()
+        print(f"Delta emission: {self.forwarded} signals sent, {self.suppressed} unchanged signals skipped", flush=True)
@@ -0,0 +1,289 @@
+"""
+Batched, background-flushed emission of the maintainer stats to an Initial State bucket
+
+Drop-in for ISStreamer's Streamer (log/flush/close): log() only queues the event, and a background thread sends
+the events of every repo in large batches to the Initial State events API, so GitHub collection never waits on
+the dashboard endpoint. A batch is sent once it holds batch_size events or its oldest event has lingered for
+linger seconds. Every batch's latency and failures are recorded and reported on close(), and the outcome of every
+batch is passed to the on_delivery callback when one is set (see maintainer_delta.py).
+
+SpooledEmitter persists every event to a write-ahead spool (see maintainer_spool.py) before it is sent, retries
+undelivered batches with backoff, and replays the backlog left by earlier runs.
+
+Initial State events API:
+https://initialstateeventsapi.docs.apiary.io/
+"""
+import queue
+import statistics
+import threading
+import time
+import maintainer_transport
+
+DEFAULT_URL = 'https://groker.init.st/api'
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_LINGER = 1.0
+# Seconds close() keeps retrying a spooled backlog before leaving it to the next run
+DEFAULT_DRAIN_TIMEOUT = 30
+# Events kept in memory before log() blocks, so a dead endpoint cannot grow the queue without bound
+MAX_QUEUED_EVENTS = 100000
+
+
+class Emitter(object):
+    """
+    Queue of Initial State events drained in batches by a background sender thread
+    """
+    def __init__(self, bucket_name, bucket_key, access_key, url=DEFAULT_URL, batch_size=DEFAULT_BATCH_SIZE,
+                 linger=DEFAULT_LINGER, transport=None, debug=False):
+        """
+        Initialize the Emitter class object and start its sender thread
+        :param bucket_name: Initial State bucket name
+        :type bucket_name: str
+        :param bucket_key: Initial State bucket key
+        :type bucket_key: str
+        :param access_key: Initial State access key
+        :type access_key: str
+        :param url: Initial State API base URL, e.g. a local stand-in server (default: DEFAULT_URL)
+        :type url: str
+        :param batch_size: maximum events per request (default: DEFAULT_BATCH_SIZE)
+        :type batch_size: int
+        :param linger: seconds the first queued event waits for more events before its batch is sent
+                       (default: DEFAULT_LINGER)
+        :type linger: float
+        :param transport: HTTP transport the batches are sent through (default: a new maintainer_transport.Transport)
+        :type transport: maintainer_transport.Transport
+        :param debug: print every batch
+        :type debug: bool
+        """
+        self.bucket_name = bucket_name
+        self.url = url.rstrip('/')
+        self.batch_size = batch_size
+        self.linger = linger
+        self.transport = transport or maintainer_transport.Transport(pool_size=1)
+        self.debug = debug
+        self.headers = {'Content-Type': 'application/json', 'Accept-Version': '~0',
+                        'X-IS-AccessKey': access_key, 'X-IS-BucketKey': bucket_key}
+
+        self.queue = queue.Queue(maxsize=MAX_QUEUED_EVENTS)
+        self.closed = threading.Event()
+        # Stats of the sent batches: latency (seconds) of each request, events sent/dropped after a failure
+        self.latencies = []
+        self.sent = 0
+        self.failed = 0
+        self.failures = []
+        # Called by the sender thread with (events, delivered) once a batch is delivered or dropped
+        self.on_delivery = None
+
+        self.bucket_created = False
+        self.thread = threading.Thread(target=self.run, name='iss-emitter', daemon=True)
+        self.thread.start()
+
+    def log(self, key, value, epoch=None):
+        """
+        Queue one event; never waits on the Initial State endpoint
+        """
+        self.queue.put(dict(key=key, value=value, epoch=epoch if epoch is not None else time.time()))
+
+    def flush(self):
+        """
+        No-op kept for Streamer compatibility: batches are sent by the sender thread on size or linger time
+        """
+
+    def close(self):
+        """
+        Send every queued event, stop the sender thread and report the batch stats
+        """
+        self.closed.set()
+        self.thread.join()
+        print(self.report(), flush=True)
+
+    def create_bucket(self):
+        """
+        Create the bucket (a no-op for an existing bucket) before the first batch
+        Calls: POST /api/buckets
+        """
+        response = self.transport.request('POST', self.url + '/buckets', headers=self.headers,
+                                          json={'bucketKey': self.headers['X-IS-BucketKey'], 'bucketName': self.bucket_name})
+        if response.status_code >= 300:
+            raise Exception(f"Bucket creation failed with {response.status_code}: {response.text}")
+        self.bucket_created = True
+
+    def next_batch(self):
+        """
+        Wait for the next batch: up to batch_size events, sent linger seconds after its first event at the latest
+        :return: list of events, empty once closed and drained
+        """
+        batch = []
+        while not batch:
+            try:
+                batch.append(self.queue.get(timeout=0.1))
+            except queue.Empty:
+                if self.closed.is_set():
+                    return batch
+        deadline = time.time() + self.linger
+        while len(batch) < self.batch_size:
+            # Once closed, drain what is left without lingering
+            timeout = 0 if self.closed.is_set() else deadline - time.time()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def send(self, batch):
+        """
+        Send one attempt of a batch of events, recording its latency or error
+        Calls: POST /api/events
+        :return: True if the batch was delivered
+        """
+        start = time.perf_counter()
+        try:
+            if not self.bucket_created:
+                self.create_bucket()
+            response = self.transport.request('POST', self.url + '/events', headers=self.headers, json=batch)
+            if response.status_code >= 300:
+                raise Exception(f"Events request failed with {response.status_code}: {response.text}")
+        except Exception as err:
+            self.failures.append(str(err))
+            print(f"Initial State batch of {len(batch)} events failed: {err}", flush=True)
+            return False
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        self.sent += len(batch)
+        if self.transport.instruments:
+            self.transport.instruments.inc('maintainer_iss_events_total', len(batch), result='sent')
+        if self.debug:
+            print(f"Emitter.send(): {len(batch)} events in {latency * 1000:.0f}ms")
+
+        return True
+
+    def drop(self, batch):
+        """
+        Count the events of a batch given up on, once
+        """
+        self.failed += len(batch)
+        if self.transport.instruments:
+            self.transport.instruments.inc('maintainer_iss_events_total', len(batch), result='failed')
+
+    def notify(self, batch, delivered):
+        """
+        Pass the outcome of a batch to the on_delivery callback
+        """
+        if self.on_delivery:
+            self.on_delivery(batch, delivered)
+
+    def run(self):
+        """
+        Sender thread: send batches until closed and drained
+        """
+        while True:
+            batch = self.next_batch()
+            if not batch:
+                return
+            delivered = self.send(batch)
+            if not delivered:
+                # Retries are left to the transport, a batch that still failed is dropped
+                self.drop(batch)
+            self.notify(batch, delivered)
+
+    def report(self):
+        """
+        One line summary of the sent batches
+        """
+        if not self.latencies:
+            return f"Initial State: {self.sent} events sent, {self.failed} failed"
+        latencies = sorted(self.latencies)
+
+        return "Initial State: {0} events sent in {1} batches, {2} failed; batch latency median {3:.0f}ms, " \
+               "max {4:.0f}ms".format(self.sent, len(latencies), self.failed, statistics.median(latencies) * 1000,
+                                      latencies[-1] * 1000)
+
+
+class SpooledEmitter(Emitter):
+    """
+    Emitter whose events are committed to an EventSpool before delivery and only dropped once accepted
+    A failed batch is retried, or left in the spool for the next run, so it is never counted as failed
+    """
+    def __init__(self, bucket_name, bucket_key, access_key, spool, url=DEFAULT_URL, batch_size=DEFAULT_BATCH_SIZE,
+                 linger=DEFAULT_LINGER, drain_timeout=DEFAULT_DRAIN_TIMEOUT, transport=None, debug=False):
+        """
+        Initialize the SpooledEmitter class object and start its sender thread, which replays any backlog first
+        :param spool: write-ahead spool shared with earlier runs
+        :type spool: maintainer_spool.EventSpool
+        :param drain_timeout: seconds close() keeps retrying the backlog before leaving it to the next run
+                              (default: DEFAULT_DRAIN_TIMEOUT)
+        :type drain_timeout: float
+        (see Emitter for the other parameters)
+        """
+        self.spool = spool
+        self.bucket_key = bucket_key
+        self.drain_timeout = drain_timeout
+        self.wakeup = threading.Event()
+        self.abandon = threading.Event()
+        self.replayed = spool.count(bucket_key)
+        # Failed batches stay in the spool and are retried here, not by the transport
+        super().__init__(bucket_name, bucket_key, access_key, url=url, batch_size=batch_size, linger=linger,
+                         transport=transport or maintainer_transport.Transport(pool_size=1, retries=0), debug=debug)
+
+    def log(self, key, value, epoch=None):
+        """
+        Persist one event, then wake up the sender thread
+        """
+        self.spool.append(self.bucket_key, [dict(key=key, value=value, epoch=epoch if epoch is not None else time.time())])
+        self.wakeup.set()
+
+    def close(self):
+        """
+        Send the spooled events for up to drain_timeout seconds, leaving the rest to the next run
+        """
+        self.closed.set()
+        self.wakeup.set()
+        self.thread.join(self.drain_timeout)
+        if self.thread.is_alive():
+            self.abandon.set()
+            self.thread.join()
+        print(self.report(), flush=True)
+
+    def run(self):
+        """
+        Sender thread: send the oldest spooled events in batches, backing off while the endpoint fails
+        """
+        attempt = 0
+        lingering_since = None
+        while not self.abandon.is_set():
+            rows = self.spool.peek(self.bucket_key, self.batch_size)
+            if not rows:
+                if self.closed.is_set():
+                    return
+                self.wakeup.wait(0.1)
+                self.wakeup.clear()
+                continue
+            if len(rows) < self.batch_size and not self.closed.is_set():
+                # Wait up to linger seconds for a fuller batch
+                lingering_since = lingering_since or time.time()
+                if time.time() - lingering_since < self.linger:
+                    self.wakeup.wait(min(0.1, self.linger))
+                    self.wakeup.clear()
+                    continue
+            lingering_since = None
+
+            events = [event for _, event in rows]
+            if self.send(events):
+                self.spool.delete([row_id for row_id, _ in rows])
+                # A failed batch is not dropped but retried, only its delivery is reported
+                self.notify(events, True)
+                attempt = 0
+            else:
+                self.abandon.wait(maintainer_transport.Transport.backoff(attempt))
+                attempt += 1
+
+    def report(self):
+        """
+        One line summary of the sent batches and the backlog left in the spool
+        """
+        backlog = self.spool.count(self.bucket_key)
+        report = super().report()
+        if self.replayed:
+            report += f", {self.replayed} events replayed from earlier runs"
+
+        return report + (f"; {backlog} events left in the spool for the next run" if backlog else "")
@@ -0,0 +1,178 @@
+"""
+Local time-series history of the collected KPIs (--history)
+
+GitHub's traffic endpoints only serve the last 14 days, so every run appends the per-day views/clones buckets
+and every scalar KPI of every repo to an SQLite store. A day that is seen again by a later run (e.g. today's
+still growing bucket) replaces the earlier observation, so overlapping runs never double count. Range queries
+and rolling-window aggregates are served from the store, to rebuild dashboards or backfill without calling GitHub.
+
+Usage:
+    python maintainer_history.py [--state-dir DIR] REPO METRIC [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--window DAYS]
+"""
+import argparse
+import collections
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+# Per-day traffic metrics, and the result fields holding their buckets
+DAILY_METRICS = {'views': 'views_daily', 'clones': 'clones_daily'}
+# Scalar KPIs recorded from every run's results
+KPI_FIELDS = ('total_views', 'unique_views', 'total_clones', 'unique_cloners', 'total_stars', 'forks_count',
+              'contributor_count', 'commits', 'time_since_last', 'total_open_issues', 'total_open_pull_reqs',
+              'total_average_time_for_pr', 'pr_response_time_median', 'pr_response_time_p90', 'pr_response_time_p99')
+
+
+def to_epoch(day):
+    """
+    Epoch seconds (UTC) of a YYYY-MM-DD day, None passes through
+    """
+    if day is None:
+        return None
+    return datetime.datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+class HistoryStore(object):
+    """
+    SQLite store of per-day traffic buckets and timestamped scalar KPIs, per repo
+    """
+    def __init__(self, state_dir):
+        """
+        Initialize the HistoryStore class object
+        :param state_dir: directory holding the history database
+        :type state_dir: str
+        """
+        os.makedirs(state_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(state_dir, 'history.sqlite'), check_same_thread=False)
+        # The primary keys double as the (repo, metric, time) range query indexes
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS daily (
+                repo TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                day TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                uniques INTEGER NOT NULL,
+                PRIMARY KEY (repo, metric, day)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS kpis (
+                repo TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                collected_at REAL NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (repo, metric, collected_at)
+            ) WITHOUT ROWID;
+        """)
+        self.db.commit()
+
+    def record(self, results, collected_at=None):
+        """
+        Append one repo's results: its per-day traffic buckets and every numeric scalar KPI
+        :param results: result fields of one repo (see maintainer_collect.RepoCollector.collect)
+        :type results: dict
+        :param collected_at: epoch seconds of the collection (default: now)
+        :type collected_at: float
+        """
+        repo = results['repo']
+        collected_at = collected_at or time.time()
+        daily = [(repo, metric, day, count, uniques)
+                 for metric, field in DAILY_METRICS.items() for day, count, uniques in results.get(field) or []]
+        kpis = []
+        for field in KPI_FIELDS:
+            try:
+                kpis.append((repo, field, collected_at, float(results[field])))
+            except (KeyError, TypeError, ValueError):
+                # Not collected by this run (e.g. a single metric group refreshed by --daemon), or not numeric
+                continue
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO daily VALUES (?, ?, ?, ?, ?)", daily)
+            self.db.executemany("INSERT OR REPLACE INTO kpis VALUES (?, ?, ?, ?)", kpis)
+            self.db.commit()
+
+    def query(self, repo, metric, start=None, end=None):
+        """
+        Range query of one metric of one repo, both bounds inclusive
+        :param start: first day (YYYY-MM-DD) (default: <all>)
+        :param end: last day (YYYY-MM-DD) (default: <all>)
+        :return: list of (day, count, uniques) for daily metrics, (collected_at, value) for KPIs
+        """
+        if metric in DAILY_METRICS:
+            sql = "SELECT day, count, uniques FROM daily WHERE repo = ? AND metric = ? AND day >= ? AND day <= ?"
+            bounds = (start or '0000-00-00', end or '9999-99-99')
+        else:
+            sql = "SELECT collected_at, value FROM kpis WHERE repo = ? AND metric = ? AND collected_at >= ? AND collected_at < ?"
+            bounds = (to_epoch(start) or 0, to_epoch(end) + 86400 if end else float('inf'))
+        with self.lock:
+            return self.db.execute(sql + " ORDER BY 1", (repo, metric) + bounds).fetchall()
+
+    def rolling(self, repo, metric, window_days, start=None, end=None):
+        """
+        Rolling-window aggregate of one metric of one repo over the days of the range
+        Daily metrics are summed over the window (e.g. a 28 day view count), KPIs are averaged over the
+        observations in the window
+        :param window_days: window length in days, ending on (and including) each day
+        :type window_days: int
+        :return: list of (day, aggregate), one per day with data
+        """
+        window = datetime.timedelta(days=window_days)
+        # Fetch the days before start too, so the first windows are complete
+        fetch_start = None
+        if start:
+            fetch_start = (datetime.datetime.strptime(start, "%Y-%m-%d") - window).strftime("%Y-%m-%d")
+        if metric in DAILY_METRICS:
+            points = [(datetime.datetime.strptime(day, "%Y-%m-%d"), count)
+                      for day, count, _ in self.query(repo, metric, fetch_start, end)]
+        else:
+            points = [(datetime.datetime.utcfromtimestamp(collected_at), value)
+                      for collected_at, value in self.query(repo, metric, fetch_start, end)]
+
+        aggregates = []
+        in_window = collections.deque()
+        total = 0
+        for idx, (when, value) in enumerate(points):
+            in_window.append((when, value))
+            total += value
+            day_end = datetime.datetime(when.year, when.month, when.day) + datetime.timedelta(days=1)
+            while in_window[0][0] < day_end - window:
+                total -= in_window.popleft()[1]
+            day = when.strftime("%Y-%m-%d")
+            # One aggregate per day, taken after its last point
+            if idx + 1 < len(points) and points[idx + 1][0].strftime("%Y-%m-%d") == day:
+                continue
+            if start and day < start:
+                continue
+            aggregates.append((day, total if metric in DAILY_METRICS else round(total / len(in_window), 2)))
+
+        return aggregates
+
+
+def main():
+    """
+    Query the history store from the command line
+    """
+    parser = argparse.ArgumentParser(description='Maintainer stats history')
+    parser.add_argument('--state-dir', dest='state_dir', default='.maintainer_state',
+                        help='directory holding the history database (default: %(default)s)')
+    parser.add_argument('repo', help='repository name')
+    parser.add_argument('metric', help='views, clones or a KPI field, e.g. total_stars')
+    parser.add_argument('--from', dest='start', metavar='YYYY-MM-DD', help='first day (default: <all>)')
+    parser.add_argument('--to', dest='end', metavar='YYYY-MM-DD', help='last day (default: <all>)')
+    parser.add_argument('--window', type=int, dest='window', metavar='DAYS',
+                        help='print a rolling aggregate over this many days instead of the raw points')
+    args = parser.parse_args()
+
+    store = HistoryStore(args.state_dir)
+    if args.window:
+        rows = store.rolling(args.repo, args.metric, args.window, args.start, args.end)
+    else:
+        rows = store.query(args.repo, args.metric, args.start, args.end)
+    for row in rows:
+        if args.metric not in DAILY_METRICS and not args.window:
+            row = (datetime.datetime.utcfromtimestamp(row[0]).strftime("%Y-%m-%dT%H:%M:%SZ"),) + tuple(row[1:])
+        print(",".join(str(column) for column in row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+"""
+Hot-path instrumentation of a run (--metrics-json, --metrics-prom, --profile)
+
+The shared transport carries one Instruments registry (see maintainer_transport.py), so every GraphQL query, every
+PyGithub call and every Initial State batch is recorded where it is sent: request counts by endpoint and status,
+latency histograms, bytes transferred, retries, cache hits and GraphQL cost. Requests are attributed to the repo
+and metric group being collected by the current thread (see RepoCollector.collect), which gives the per-repo
+per-group timings, requests and quota. Run phases (enumeration, prefetch, collection, streaming) are timed too.
+
+The registry is exported as a JSON summary and as a Prometheus textfile (node_exporter textfile collector) at the
+end of a run, or every --metrics-interval seconds in the long-running modes. With --profile, the run is also
+profiled with cProfile and a phase/repo/endpoint breakdown is printed at the end.
+
+Prometheus text exposition format:
+https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+# Request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DEFAULT_EXPORT_INTERVAL = 60
+# URL paths are reduced to their endpoint, so every repo shares the same label values
+ENDPOINT_PATTERNS = ((re.compile(r'/repos/[^/]+/[^/]+'), '/repos/:owner/:repo'), (re.compile(r'/orgs/[^/]+'), '/orgs/:org'),
+                     (re.compile(r'/users/[^/]+'), '/users/:user'))
+# Requests sent outside of a repo collection (org enumeration, batch prefetch, rate limit queries)
+NO_REPO = '(run)'
+
+
+def endpoint_of(url):
+    """
+    Endpoint label of a request URL, e.g. /repos/:owner/:repo/traffic/views
+    """
+    path = urlparse(url).path
+    for pattern, replacement in ENDPOINT_PATTERNS:
+        path = pattern.sub(replacement, path, count=1)
+
+    return path
+
+
+class Histogram(object):
+    """
+    Cumulative bucket histogram, with the sum, count and maximum of the observed values
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Observations per bucket, the last one is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        idx = 0
+        while idx < len(self.buckets) and value > self.buckets[idx]:
+            idx += 1
+        self.counts[idx] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q quantile (the maximum for the +Inf bucket)
+        """
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.buckets[idx], self.max) if idx < len(self.buckets) else self.max
+
+        return self.max
+
+    def to_dict(self):
+        return dict(count=self.count, sum=round(self.sum, 6), max=round(self.max, 6), p50=self.quantile(0.5),
+                    p90=self.quantile(0.9), p99=self.quantile(0.99))
+
+
+def format_labels(labels):
+    """
+    Prometheus label set of a sorted (name, value) tuple
+    """
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in labels)
+
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class Instruments(object):
+    """
+    Thread-safe registry of the counters, gauges and histograms of a run
+    """
+    def __init__(self, json_path=None, prometheus_path=None):
+        """
+        Initialize the Instruments class object
+        :param json_path: file the JSON summary is exported to (default: None)
+        :type json_path: str
+        :param prometheus_path: Prometheus textfile the metrics are exported to (default: None)
+        :type prometheus_path: str
+        """
+        self.json_path = json_path
+        self.prometheus_path = prometheus_path
+        self.lock = threading.Lock()
+        self.started = time.time()
+        # {(name, sorted label tuple): value}
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        # {repo: {'seconds': {group: seconds}, 'requests': n, 'bytes': n, 'graphql_cost': n}}
+        self.repos = {}
+        # {phase: seconds}, in the order the phases first ran
+        self.phases = {}
+        # Repo and metric group being collected by the current thread
+        self.context = threading.local()
+        self.exporter = None
+        self.stop = threading.Event()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def repo_stats(self, repo):
+        """
+        Per-repo stats entry (caller holds the lock)
+        """
+        stats = self.repos.get(repo)
+        if stats is None:
+            stats = self.repos[repo] = dict(seconds={}, requests=0, bytes=0, graphql_cost=0)
+
+        return stats
+
+    @contextlib.contextmanager
+    def collecting(self, repo, group):
+        """
+        Time one metric group of one repo; requests sent meanwhile by this thread are attributed to the repo
+        """
+        self.context.repo = repo
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.context.repo = None
+            self.observe('maintainer_collect_seconds', seconds, group=group)
+            with self.lock:
+                stats = self.repo_stats(repo)
+                stats['seconds'][group] = stats['seconds'].get(group, 0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Time one phase of the run, phases entered several times accumulate
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    def timed(self, iterable, name):
+        """
+        Iterate over iterable, timing the wait for each item as phase name (e.g. a collecting generator)
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def request(self, client, url, status, seconds, sent, received):
+        """
+        Record one HTTP request
+        :param client: 'github' or 'initialstate'
+        :param status: HTTP status code, or the exception class name of a failed connection
+        :param sent: request body bytes
+        :param received: response body bytes (as transferred when Content-Length is known)
+        """
+        endpoint = endpoint_of(url)
+        self.inc('maintainer_http_requests_total', client=client, endpoint=endpoint, status=status)
+        self.observe('maintainer_http_request_seconds', seconds, client=client, endpoint=endpoint)
+        self.inc('maintainer_http_sent_bytes_total', sent, client=client)
+        self.inc('maintainer_http_received_bytes_total', received, client=client)
+        repo = getattr(self.context, 'repo', None)
+        if client == 'github':
+            with self.lock:
+                stats = self.repo_stats(repo or NO_REPO)
+                stats['requests'] += 1
+                stats['bytes'] += received
+
+    def graphql_cost(self, cost):
+        """
+        Record the rate limit cost of one GraphQL query
+        """
+        self.inc('maintainer_graphql_cost_total', cost)
+        with self.lock:
+            self.repo_stats(getattr(self.context, 'repo', None) or NO_REPO)['graphql_cost'] += cost
+
+    def counter_value(self, name, **match):
+        """
+        Sum of a counter over the label sets matching every given label
+        """
+        with self.lock:
+            return sum(value for (counter, labels), value in self.counters.items()
+                       if counter == name and all(dict(labels).get(key) == val for key, val in match.items()))
+
+    def summary(self):
+        """
+        JSON-serializable summary of every instrument
+        """
+        def grouped(values):
+            result = {}
+            for (name, labels), value in sorted(values.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+                result.setdefault(name, []).append(dict(labels=dict(labels), value=value))
+            return result
+
+        with self.lock:
+            histograms = {}
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+                histograms.setdefault(name, []).append(dict(labels=dict(labels), **histogram.to_dict()))
+            return dict(started=self.started, elapsed=round(time.time() - self.started, 3),
+                        phases={name: round(seconds, 3) for name, seconds in self.phases.items()},
+                        counters=grouped(self.counters), gauges=grouped(self.gauges), histograms=histograms,
+                        repos={repo: dict(stats, seconds={group: round(seconds, 3) for group, seconds in stats['seconds'].items()})
+                               for repo, stats in sorted(self.repos.items())})
+
+    def prometheus(self):
+        """
+        Every instrument in the Prometheus text exposition format (per-repo stats are left to the JSON summary)
+        """
+        lines = []
+        with self.lock:
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (metric, labels), value in sorted(values.items(), key=lambda item: str(item[0][1])):
+                        if metric == name:
+                            lines.append(f"{name}{format_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: str(item[0][1])):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+            lines.append("# TYPE maintainer_phase_seconds gauge")
+            for name, seconds in self.phases.items():
+                lines.append(f"maintainer_phase_seconds{format_labels((('phase', name),))} {round(seconds, 6)}")
+
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        """
+        Write the JSON summary and the Prometheus textfile, each replaced atomically so readers never see half a file
+        """
+        for path, render in ((self.json_path, lambda: json.dumps(self.summary(), indent=2)),
+                             (self.prometheus_path, self.prometheus)):
+            if not path:
+                continue
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as output:
+                output.write(render())
+            os.replace(temp_path, path)
+
+    def start_export(self, interval=DEFAULT_EXPORT_INTERVAL):
+        """
+        Export every interval seconds from a background thread, until stop_export()
+        """
+        if not (self.json_path or self.prometheus_path):
+            return
+
+        def run():
+            while not self.stop.wait(interval):
+                self.export()
+
+        self.exporter = threading.Thread(target=run, name='instruments-export', daemon=True)
+        self.exporter.start()
+
+    def stop_export(self):
+        """
+        Stop the background export and export one last time
+        """
+        self.stop.set()
+        if self.exporter:
+            self.exporter.join()
+        self.export()
+
+    def profile_report(self, top=10):
+        """
+        Phase, repo and endpoint breakdown of the run (--profile)
+        """
+        summary = self.summary()
+        lines = ["", "Run phases:"]
+        total = summary['elapsed'] or 1
+        for name, seconds in summary['phases'].items():
+            lines.append(f"  {name:<24}{seconds:>10.2f}s {100 * seconds / total:>6.1f}%")
+        lines.append(f"  {'total':<24}{summary['elapsed']:>10.2f}s")
+
+        repos = summary['repos']
+        for title, key in (("Slowest repos", lambda item: sum(item[1]['seconds'].values())),
+                           ("Most expensive repos (GraphQL cost, requests)", lambda item: (item[1]['graphql_cost'], item[1]['requests']))):
+            lines.append(f"\n{title}:")
+            for repo, stats in sorted(repos.items(), key=key, reverse=True)[:top]:
+                groups = ' '.join(f"{group}={seconds:.2f}s" for group, seconds in stats['seconds'].items())
+                lines.append(f"  {repo:<40}{sum(stats['seconds'].values()):>8.2f}s {stats['requests']:>6} requests "
+                             f"{stats['graphql_cost']:>5} cost {stats['bytes'] / 1024:>8.1f}KiB  {groups}")
+
+        lines.append("\nRequests by endpoint:")
+        for entry in sorted(summary['histograms'].get('maintainer_http_request_seconds', []),
+                            key=lambda entry: entry['sum'], reverse=True):
+            labels = entry['labels']
+            lines.append(f"  {labels['client'] + ' ' + labels['endpoint']:<56}{entry['count']:>7} requests "
+                         f"{entry['sum']:>9.2f}s p50 {entry['p50'] * 1000:>6.0f}ms p99 {entry['p99'] * 1000:>6.0f}ms")
+
+        return '\n'.join(lines)
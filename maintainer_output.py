@@ -0,0 +1,155 @@
+# -*- coding: UTF-8 -*-
+"""
+Streaming report output of the maintainer stats (--output ndjson|csv)
+
+Each repo's results are written as soon as the repo is collected, one line per repo and flushed, so downstream
+tools can consume a large run while it is still going and memory does not grow with the repo count. Every result
+field is written, including the referrer dicts and the per-day traffic buckets (JSON encoded in CSV cells).
+NDJSON lines use the --shard-output format, so they can also be combined with maintainer_shard.py merge.
+
+The columnar table printed at the end of the run is kept by a ReportRows collection; with --top it only keeps the
+N highest repos by one field, so the std out summary stays bounded too.
+"""
+import csv
+import heapq
+import itertools
+import json
+import sys
+import maintainer_collect
+
+OUTPUT_FORMATS = ('ndjson', 'csv')
+# Rows of the columnar summary when a streaming --output is written and --top is not given
+DEFAULT_TOP = 20
+# CSV columns: the std out report fields first, then the fields only the streaming output carries
+CSV_FIELDS = (maintainer_collect.REPORT_FIELDS + ['total_referrals', 'unique_referrals'] +
+              list(maintainer_collect.PR_LATENCY_FIELDS) + ['views_daily', 'clones_daily'])
+
+
+class Sink(object):
+    """
+    Streaming output of the repo results to a file or std out
+    """
+    def __init__(self, output, owned=True):
+        """
+        Initialize the Sink class object
+        :param output: text file object the results are written to (files opened with newline='')
+        :type output: obj
+        :param owned: close the output with the sink, False for std out which is only flushed
+        :type owned: bool
+        """
+        self.output = output
+        self.owned = owned
+
+    def close(self):
+        """
+        Close the output file
+        """
+        if self.owned:
+            self.output.close()
+        else:
+            self.output.flush()
+
+
+class NdjsonSink(Sink):
+    """
+    Writes every repo's results as one JSON object per line
+    """
+    def write(self, results):
+        """
+        Write one repo's results, flushed so readers see the repo right away
+        """
+        self.output.write(json.dumps(results, sort_keys=True, default=str) + '\n')
+        self.output.flush()
+
+
+class CsvSink(Sink):
+    """
+    Writes every repo's results as one CSV row of CSV_FIELDS, nested values JSON encoded
+    """
+    def __init__(self, output, owned=True):
+        """
+        Initialize the CsvSink class object, the header row is written right away
+        """
+        super().__init__(output, owned)
+        self.writer = csv.writer(output)
+        self.writer.writerow(CSV_FIELDS)
+        self.output.flush()
+
+    def write(self, results):
+        """
+        Write one repo's results, fields the run did not collect are left empty
+        """
+        row = []
+        for field in CSV_FIELDS:
+            value = results.get(field)
+            row.append(json.dumps(value, sort_keys=True) if isinstance(value, (dict, list, tuple)) else value)
+        self.writer.writerow(row)
+        self.output.flush()
+
+
+def open_sink(output_format, path=None):
+    """
+    Streaming sink of one output format
+    :param output_format: one of OUTPUT_FORMATS
+    :type output_format: str
+    :param path: output file, truncated; None or '-' for std out
+    :type path: str
+    :return: Sink
+    """
+    owned = path not in (None, '-')
+    output = open(path, 'w', encoding='utf-8', newline='') if owned else sys.stdout
+    sink_class = CsvSink if output_format == 'csv' else NdjsonSink
+
+    return sink_class(output, owned)
+
+
+def sort_key(value):
+    """
+    Numeric ordering of a result field, e.g. commits are reported as strings; missing values sort last
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('-inf')
+
+
+class ReportRows(object):
+    """
+    Rows of the std out report, either every repo in collection order or the top N repos by one field
+    """
+    def __init__(self, top=0, field='total_stars'):
+        """
+        Initialize the ReportRows class object
+        :param top: number of rows kept, 0 for every repo
+        :type top: int
+        :param field: result field the top rows are picked by, highest first
+        :type field: str
+        """
+        self.top = top
+        self.field = field
+        self.rows = []
+        # Ties keep the earliest repo
+        self.counter = itertools.count()
+
+    def add(self, results):
+        """
+        Add one repo's results, a bounded report drops its lowest row once it is full
+        """
+        row = maintainer_collect.report_row(results)
+        if not self.top:
+            self.rows.append(row)
+            return
+        entry = (sort_key(results.get(self.field)), -next(self.counter), row)
+        if len(self.rows) < self.top:
+            heapq.heappush(self.rows, entry)
+        else:
+            heapq.heappushpop(self.rows, entry)
+
+    def report_data(self):
+        """
+        Report rows, the top rows sorted highest first
+        """
+        if not self.top:
+            return self.rows
+
+        return [row for _, _, row in sorted(self.rows, reverse=True)]
@@ -0,0 +1,98 @@
+"""
+Persisted per-PR state for the incremental Average PR Response Time (see Maintainer.get_pr_response_time_incremental)
+
+Every PR's start/end events are stored once computed, together with the PR's updatedAt and a per-repo watermark,
+so later runs only fetch the PRs updated since the last run and the aggregates cover every PR in history.
+"""
+import array
+import maintainer_statistics
+import os
+import sqlite3
+import threading
+
+
+class PRStateStore(object):
+    """
+    SQLite store of computed PR response times, per repo
+    """
+    def __init__(self, state_dir):
+        """
+        Initialize the PRStateStore class object
+        :param state_dir: directory holding the state database
+        :type state_dir: str
+        """
+        os.makedirs(state_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(state_dir, 'pr_state.sqlite'), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS pull_requests (
+                repo TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                updated_at TEXT NOT NULL,
+                start_at TEXT,
+                end_at TEXT,
+                duration REAL,
+                PRIMARY KEY (repo, number)
+            );
+            CREATE INDEX IF NOT EXISTS pull_requests_duration ON pull_requests (repo, duration);
+            CREATE TABLE IF NOT EXISTS watermarks (
+                repo TEXT PRIMARY KEY,
+                updated_at TEXT NOT NULL
+            );
+        """)
+        self.db.commit()
+
+    def watermark(self, repo):
+        """
+        updatedAt of the most recently updated PR already stored for a repo, None on the first run
+        """
+        with self.lock:
+            row = self.db.execute("SELECT updated_at FROM watermarks WHERE repo = ?", (repo,)).fetchone()
+
+        return row[0] if row else None
+
+    def update(self, repo, pull_requests, watermark):
+        """
+        Store the computed events of updated PRs and move the repo watermark forward
+        :param pull_requests: (number, updated_at, start_at, end_at, duration) tuples
+        :type pull_requests: list
+        :param watermark: newest updatedAt seen, None if no PR was fetched
+        :type watermark: str
+        """
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO pull_requests VALUES (?, ?, ?, ?, ?, ?)",
+                                [(repo,) + tuple(pull_request) for pull_request in pull_requests])
+            if watermark:
+                self.db.execute("INSERT OR REPLACE INTO watermarks VALUES (?, ?)", (repo, watermark))
+            self.db.commit()
+
+    def record_event(self, repo, number, updated_at, start_at=None, end_at=None):
+        """
+        Update one PR from a single start or end event (e.g. a pull_request webhook), keeping its other event
+        :param start_at: review requested/reopened/ready for review createdAt, None to keep the stored one
+        :type start_at: str
+        :param end_at: merged/review dismissed createdAt, None to keep the stored one
+        :type end_at: str
+        """
+        with self.lock:
+            row = self.db.execute("SELECT start_at, end_at FROM pull_requests WHERE repo = ? AND number = ?",
+                                  (repo, number)).fetchone()
+            start_at = start_at or (row[0] if row else None)
+            end_at = end_at or (row[1] if row else None)
+            duration = None
+            if start_at and end_at:
+                duration = max(0, (maintainer_statistics.to_epoch(end_at) - maintainer_statistics.to_epoch(start_at))/86400)
+            self.db.execute("INSERT OR REPLACE INTO pull_requests VALUES (?, ?, ?, ?, ?, ?)",
+                            (repo, number, updated_at, start_at, end_at, duration))
+            self.db.commit()
+
+    def aggregates(self, repo):
+        """
+        Response time aggregates (in days) over every stored PR with both a start and an end event
+        :return: dict of count, total, mean, median, p90, p99
+        """
+        with self.lock:
+            durations = array.array('d', (row[0] for row in self.db.execute(
+                "SELECT duration FROM pull_requests WHERE repo = ? AND duration IS NOT NULL", (repo,))))
+
+        return maintainer_statistics.summarize(durations)
@@ -0,0 +1,201 @@
+"""
+Adaptive page sizes of the nested APIv4 connections (see Maintainer.run_adaptive in maintainer_v4.py)
+
+GitHub checks every query against a node limit (the first/last of each connection, multiplied by the page sizes
+of its parent connections) and charges one point per 100 connection requests; heavy nested selections such as
+the timelineItems of every recent PR also time out (502) or fail with RESOURCE_LIMITS_EXCEEDED.
+
+Each adaptive query declares its shape: the connections it pages through, with the query variable and the knob
+(e.g. timeline_items) each page size comes from. Before a query is sent, its node count and cost are estimated
+from the page sizes and the outermost pages are cut until it fits MAX_QUERY_NODES/MAX_QUERY_COST, so an oversized
+query becomes more, smaller pages. A query that still fails is retried with a knob halved (outermost first,
+fetching more pages loses nothing; inner timelines are only cut once the pages are at their minimum), and the
+smaller size is remembered for that repo. Learned sizes are kept in SQLite under --state-dir, so heavy repos
+start from sizes that worked; after RELEARN_AFTER_DAYS the defaults are tried again. Repos that never failed
+keep the largest pages, i.e. the fewest requests.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# GitHub maximum of first/last on any connection
+MAX_PAGE_SIZE = 100
+# Budget of a single query: estimated nodes (GitHub rejects queries over 500,000, heavy ones time out long before)
+# and estimated rate limit points
+MAX_QUERY_NODES = 25000
+MAX_QUERY_COST = 10
+# Days a size learned from a failure is kept before the default size is tried again
+RELEARN_AFTER_DAYS = 7
+
+# Page size of every knob when nothing was learned for a repo, and the smallest size it is cut to
+DEFAULT_SIZES = {'open_prs': MAX_PAGE_SIZE, 'recent_prs': 5, 'pr_events': MAX_PAGE_SIZE, 'timeline_items': 100}
+MIN_SIZES = {'open_prs': 10, 'recent_prs': 1, 'pr_events': 5, 'timeline_items': 10}
+
+# Query shapes: (query variable, knob, nested connections) of every paged connection, outermost first
+TIMELINE_ITEMS = ('timelineItems', 'timeline_items', ())
+QUERY_SHAPES = {
+    # Open PRs (createdAt), the first page with the health counts and the follow-up pages
+    'open_prs': (('pageSize', 'open_prs', ()),),
+    # Most recent PRs with their response time timelines, paged backwards
+    'pr_timelines': (('pageSize', 'recent_prs', (TIMELINE_ITEMS,)),),
+    # Every PR updated since the last run with its response time timeline (--incremental)
+    'pr_events': (('pageSize', 'pr_events', (TIMELINE_ITEMS,)),),
+    # One repo of the aliased multi-repo query (see Maintainer.build_batch_query)
+    'batch_repo': (('openPrs', 'open_prs', ()), ('recentPrs', 'recent_prs', (TIMELINE_ITEMS,))),
+}
+
+# GitHub error types of queries too large to run, answered with a 200
+LIMIT_ERROR_TYPES = ('RESOURCE_LIMITS_EXCEEDED', 'MAX_NODE_LIMIT_EXCEEDED')
+
+
+class QueryTooLarge(Exception):
+    """
+    Query rejected or timed out because of its size, worth retrying with smaller pages
+    """
+
+
+def is_too_large(result):
+    """
+    Whether a GraphQL response reports a node/resource limit or a timeout of the query
+    """
+    for error in result.get('errors') or []:
+        if error.get('type') in LIMIT_ERROR_TYPES or 'timeout' in (error.get('message') or '').lower():
+            return True
+    return False
+
+
+def knobs(shape):
+    """
+    (variable, knob) of every connection of a shape, outermost first
+    """
+    for variable, knob, children in shape:
+        yield variable, knob
+        yield from knobs(children)
+
+
+def count(shape, sizes, multiplier=1):
+    """
+    Nodes and connection requests of a shape: every connection returns up to its page size of nodes for each node
+    of its parent connections, and is requested once for each of them
+    :return: nodes, requests
+    """
+    nodes, requests = 0, 0
+    for _, knob, children in shape:
+        child_nodes, child_requests = count(children, sizes, multiplier * sizes[knob])
+        nodes += multiplier * sizes[knob] + child_nodes
+        requests += multiplier + child_requests
+
+    return nodes, requests
+
+
+def estimate(shape, sizes, copies=1):
+    """
+    Estimated node count and rate limit cost of a query, the way GitHub computes them
+    :param shape: connections of the query (see QUERY_SHAPES)
+    :param sizes: {knob: page size}
+    :param copies: number of times the shape is repeated, e.g. repos of a batch
+    :return: nodes, cost (connection requests / 100, at least 1)
+    """
+    nodes, requests = count(shape, sizes)
+
+    return nodes * copies, max(1, math.ceil(requests * copies / 100))
+
+
+def max_copies(shape, sizes):
+    """
+    Largest number of times a shape can be repeated in one query (e.g. repos of a batch) within the query budget
+    """
+    nodes, requests = count(shape, sizes)
+
+    return max(1, min(MAX_QUERY_NODES // max(1, nodes), MAX_QUERY_COST * 100 // max(1, requests)))
+
+
+class QuerySizes(object):
+    """
+    Page sizes per repo and knob, learned from failed queries and kept in SQLite between runs
+    """
+    def __init__(self, state_dir=None, defaults=None):
+        """
+        Initialize the QuerySizes class object
+        :param state_dir: directory holding the query size database (default: None, sizes are only kept in memory)
+        :type state_dir: str
+        :param defaults: {knob: page size} overriding DEFAULT_SIZES, e.g. the --recent-prs sample
+        :type defaults: dict
+        """
+        self.defaults = dict(DEFAULT_SIZES, **(defaults or {}))
+        self.lock = threading.Lock()
+        self.db = None
+        # {(repo, knob): (size, failed_at)}
+        self.learned = {}
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+            self.db = sqlite3.connect(os.path.join(state_dir, 'query_sizes.sqlite'), check_same_thread=False)
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS query_sizes (
+                    repo TEXT NOT NULL,
+                    knob TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    failed_at REAL NOT NULL,
+                    PRIMARY KEY (repo, knob)
+                )
+            """)
+            self.db.commit()
+            expired = time.time() - RELEARN_AFTER_DAYS * 86400
+            for repo, knob, size, failed_at in self.db.execute("SELECT * FROM query_sizes WHERE failed_at >= ?",
+                                                               (expired,)):
+                self.learned[(repo, knob)] = (size, failed_at)
+
+    def size(self, repo, knob):
+        """
+        Page size of a knob for a repo: the learned one, never above the default
+        """
+        default = self.defaults[knob]
+        learned = self.learned.get((repo, knob))
+
+        return min(default, learned[0]) if learned else default
+
+    def reduced(self, shape, repo):
+        """
+        Whether a page size of the shape was learned below its default for a repo (a heavy repo)
+        """
+        return any(self.size(repo, knob) < self.defaults[knob] for _, knob in knobs(shape))
+
+    def fit(self, shape, repo=None, caps=None):
+        """
+        Page sizes of a query, cut (outermost first) until its estimate fits MAX_QUERY_NODES/MAX_QUERY_COST
+        :param shape: connections of the query (see QUERY_SHAPES)
+        :param repo: repository the sizes were learned for, None for the defaults
+        :param caps: {knob: upper bound}, e.g. the PRs left to fetch
+        :return: {knob: page size}
+        """
+        sizes = {knob: self.size(repo, knob) for _, knob in knobs(shape)}
+        for knob, cap in (caps or {}).items():
+            sizes[knob] = max(1, min(sizes[knob], cap))
+        while True:
+            nodes, cost = estimate(shape, sizes)
+            if nodes <= MAX_QUERY_NODES and cost <= MAX_QUERY_COST:
+                return sizes
+            knob = next((knob for _, knob in knobs(shape) if sizes[knob] > MIN_SIZES[knob]), None)
+            if knob is None:
+                return sizes
+            sizes[knob] = max(MIN_SIZES[knob], sizes[knob] // 2)
+
+    def shrink(self, shape, repo, sizes):
+        """
+        Learn smaller page sizes for a repo after a query of the given sizes failed
+        The outermost knob above its minimum is halved, so the same data is fetched in more pages
+        :return: whether a size could be cut, False once every knob is at its minimum
+        """
+        knob = next((knob for _, knob in knobs(shape) if sizes[knob] > MIN_SIZES[knob]), None)
+        if knob is None:
+            return False
+        size, failed_at = max(MIN_SIZES[knob], sizes[knob] // 2), time.time()
+        with self.lock:
+            self.learned[(repo, knob)] = (size, failed_at)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO query_sizes VALUES (?, ?, ?, ?)", (repo, knob, size, failed_at))
+                self.db.commit()
+
+        return True
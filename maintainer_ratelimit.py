@@ -0,0 +1,278 @@
+"""
+Rate limit budget shared by the GitHub REST API v3 and GraphQL API v4 clients
+
+The budget is kept live from the X-RateLimit-* headers of every response and from the
+rateLimit { cost remaining resetAt } selection added to every APIv4 query. Requests are throttled
+before they are sent, so a run waits for the reset window instead of failing halfway through.
+
+With several tokens (TokenPool), each token keeps its own budget and every request is sent with the token that
+has the most headroom, failing over to the next one when a token is exhausted.
+
+Rate limiting:
+https://developer.github.com/v3/#rate-limiting
+https://developer.github.com/v4/guides/resource-limitations/
+"""
+import calendar
+import hashlib
+import threading
+import time
+
+# Points/requests kept in hand for other tools sharing the token
+DEFAULT_RESERVE = 50
+# Seconds waited past the advertised reset time before sending again
+RESET_MARGIN = 5
+# Estimated cost of collecting one repo, used to project whether a run fits in the remaining budget
+# (core: repo + views + referrers + clones + contributors, graphql: retention + 2 health queries)
+ESTIMATED_COST_PER_REPO = {'core': 5, 'graphql': 3}
+ESTIMATED_COST_PER_BATCH = {'graphql': 1}
+# APIv3 requests per repo left to the REST client by the GraphQL-only backend (views, clones, referrers)
+ESTIMATED_TRAFFIC_COST_PER_REPO = 3
+
+
+def parse_reset_at(resetAt):
+    """
+    Epoch seconds from a GraphQL resetAt timestamp (e.g. 2019-10-24T03:29:08Z)
+    """
+    return calendar.timegm(time.strptime(resetAt, "%Y-%m-%dT%H:%M:%SZ"))
+
+
+class RateLimitBudget(object):
+    """
+    Live rate limit budget, tracked per API resource ('core' for APIv3, 'graphql' for APIv4)
+    """
+    def __init__(self, reserve=DEFAULT_RESERVE):
+        """
+        Initialize the RateLimitBudget class object
+        :param reserve: points/requests per resource that are never spent
+        :type reserve: int
+        """
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        # resource: {'limit', 'remaining', 'reset' (epoch seconds)}
+        self.resources = {}
+        # resource: points/requests spent during this run
+        self.spent = {}
+
+    def update(self, resource, remaining, reset, limit=None):
+        """
+        Record the budget reported by GitHub for a resource
+        Responses can arrive out of order, so within the same reset window only a lower remaining count is kept
+        """
+        with self.lock:
+            state = self.resources.get(resource)
+            if state is None or reset > state['reset']:
+                self.resources[resource] = dict(limit=limit or remaining, remaining=remaining, reset=reset)
+            else:
+                state['remaining'] = min(state['remaining'], remaining)
+                if limit:
+                    state['limit'] = limit
+
+    def update_from_headers(self, headers, token=None):
+        """
+        Record the budget from the X-RateLimit-* headers of an APIv3 (or APIv4) response
+        :param token: token the request was sent with (only used by TokenPool)
+        """
+        if 'X-RateLimit-Remaining' not in headers:
+            return
+        resource = headers.get('X-RateLimit-Resource', 'core')
+        self.update(resource, int(headers['X-RateLimit-Remaining']), int(headers['X-RateLimit-Reset']),
+                    int(headers.get('X-RateLimit-Limit', 0)) or None)
+        with self.lock:
+            if resource != 'graphql':
+                # APIv4 spending is counted from the query cost instead, see update_from_graphql()
+                self.spent[resource] = self.spent.get(resource, 0) + 1
+
+    def update_from_graphql(self, rate_limit, token=None):
+        """
+        Record the budget from the rateLimit selection of an APIv4 query
+        :param rate_limit: {'cost', 'remaining', 'resetAt'} (limit is optional)
+        :type rate_limit: dict
+        :param token: token the query was sent with (only used by TokenPool)
+        """
+        self.update('graphql', rate_limit['remaining'], parse_reset_at(rate_limit['resetAt']), rate_limit.get('limit'))
+        with self.lock:
+            self.spent['graphql'] = self.spent.get('graphql', 0) + rate_limit.get('cost', 1)
+
+    def acquire(self, resource, cost=1):
+        """
+        Reserve cost points from a resource before a request is sent, sleeping until the reset window
+        when the remaining budget (less the reserve) cannot cover it
+        :return: None, the request is sent with the clients' own token
+        """
+        while True:
+            with self.lock:
+                state = self.resources.get(resource)
+                if state is None or state['remaining'] - cost >= self.reserve:
+                    if state is not None:
+                        # Optimistic reservation, corrected by the next response's headers
+                        state['remaining'] -= cost
+                    return
+                wait = state['reset'] + RESET_MARGIN - time.time()
+                if wait <= 0:
+                    # The window has reset, start again from the full limit
+                    state['remaining'] = state['limit'] - cost
+                    state['reset'] = time.time() + 3600
+                    return
+            print(f"Rate limit budget for {resource} is exhausted, waiting ~{round(wait / 60)}min for the reset", flush=True)
+            time.sleep(wait)
+
+    def remaining(self, resource):
+        """
+        Remaining points/requests for a resource, None until GitHub has reported it
+        """
+        state = self.resources.get(resource)
+        return state['remaining'] if state else None
+
+    def reset_minutes(self, resource):
+        """
+        Minutes until the reset of a resource's window, None until GitHub has reported it
+        """
+        state = self.resources.get(resource)
+        return str(max(0, round((state['reset'] - time.time()) / 60))) if state else None
+
+    def project(self, costs):
+        """
+        Project whether a run fits in the remaining budget
+        :param costs: estimated cost per resource for the whole run
+        :type costs: dict
+        :return: dict of {resource: (estimated cost, remaining budget, fits)} for the resources GitHub has reported
+        """
+        projection = {}
+        for resource, cost in costs.items():
+            remaining = self.remaining(resource)
+            if remaining is not None:
+                projection[resource] = (cost, remaining, cost <= remaining - self.reserve)
+
+        return projection
+
+
+class TokenPool(object):
+    """
+    Pool of GitHub tokens, each with its own RateLimitBudget; every request goes to the token with the most headroom
+    Exposes the RateLimitBudget interface, aggregated over the tokens, so it can replace the single budget
+    """
+    def __init__(self, tokens, reserve=DEFAULT_RESERVE):
+        """
+        Initialize the TokenPool class object
+        :param tokens: GitHub API tokens, duplicates are ignored
+        :type tokens: list
+        :param reserve: points/requests per resource and per token that are never spent
+        :type reserve: int
+        """
+        self.tokens = list(dict.fromkeys(tokens))
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.budgets = {token: RateLimitBudget(reserve) for token in self.tokens}
+        # Scope shared by every token of the pool (e.g. for cache keys), the tokens themselves are never stored
+        self.scope = hashlib.sha256("|".join(sorted(self.tokens)).encode()).hexdigest()
+
+    def headroom(self, token, resource):
+        """
+        Points/requests a token can still spend on a resource before its reserve, infinite until GitHub reported it
+        """
+        state = self.budgets[token].resources.get(resource)
+        if state is None:
+            return float('inf')
+        if state['reset'] + RESET_MARGIN <= time.time():
+            # The window has reset since the last response
+            return state['limit'] - self.reserve
+        return state['remaining'] - self.reserve
+
+    def has_headroom(self, resource, cost=1):
+        """
+        True if any token can send a request on a resource right away
+        """
+        return any(self.headroom(token, resource) >= cost for token in self.tokens)
+
+    def acquire(self, resource, cost=1):
+        """
+        Reserve cost points from the token with the most headroom; when every token is exhausted, wait for the
+        token whose window resets first
+        :return: the token to send the request with
+        """
+        with self.lock:
+            token = max(self.tokens, key=lambda token: self.headroom(token, resource))
+            if self.headroom(token, resource) < cost:
+                token = min(self.tokens, key=lambda token: self.budgets[token].resources[resource]['reset'])
+        self.budgets[token].acquire(resource, cost)
+
+        return token
+
+    def update_from_headers(self, headers, token=None):
+        """
+        Record the budget of the token a response was sent with
+        """
+        if token in self.budgets:
+            self.budgets[token].update_from_headers(headers)
+
+    def update_from_graphql(self, rate_limit, token=None):
+        """
+        Record the budget of the token an APIv4 query was sent with
+        """
+        if token in self.budgets:
+            self.budgets[token].update_from_graphql(rate_limit)
+
+    def remaining(self, resource):
+        """
+        Remaining points/requests for a resource over the reported tokens, None until GitHub has reported one
+        """
+        remaining = [budget.remaining(resource) for budget in self.budgets.values()]
+        remaining = [value for value in remaining if value is not None]
+        return sum(remaining) if remaining else None
+
+    def reset_minutes(self, resource):
+        """
+        Minutes until the first reset of a resource's window among the tokens, None until GitHub has reported one
+        """
+        minutes = [budget.reset_minutes(resource) for budget in self.budgets.values()]
+        minutes = [int(value) for value in minutes if value is not None]
+        return str(min(minutes)) if minutes else None
+
+    @property
+    def spent(self):
+        """
+        {resource: points/requests spent during this run} over every token
+        """
+        spent = {}
+        for budget in self.budgets.values():
+            for resource, value in budget.spent.items():
+                spent[resource] = spent.get(resource, 0) + value
+        return spent
+
+    def project(self, costs):
+        """
+        Project whether a run fits in the remaining budget of the whole pool
+        Tokens GitHub has not reported yet are counted at the limit of the reported ones
+        :return: dict of {resource: (estimated cost, remaining budget, fits)} for the resources GitHub has reported
+        """
+        projection = {}
+        for resource, cost in costs.items():
+            states = [budget.resources.get(resource) for budget in self.budgets.values()]
+            known = [state for state in states if state is not None]
+            if not known:
+                continue
+            remaining = sum(state['remaining'] for state in known) + \
+                max(state['limit'] for state in known) * (len(states) - len(known))
+            projection[resource] = (cost, remaining, cost <= remaining - self.reserve * len(states))
+
+        return projection
+
+
+def estimate_run_cost(repo_count, batch_size=0, backend='mixed', traffic=True):
+    """
+    Estimated cost per resource of collecting repo_count repos
+    :param repo_count: number of repos
+    :param batch_size: APIv4 batch size, 0 if repos are queried one at a time
+    :param backend: 'mixed', or 'graphql' when only the traffic metrics use APIv3
+    :param traffic: whether the traffic metrics are collected
+    """
+    if backend == 'graphql':
+        costs = {'core': ESTIMATED_TRAFFIC_COST_PER_REPO * repo_count if traffic else 0}
+    else:
+        costs = {'core': ESTIMATED_COST_PER_REPO['core'] * repo_count}
+    if batch_size:
+        costs['graphql'] = ESTIMATED_COST_PER_BATCH['graphql'] * -(-repo_count // batch_size)
+    else:
+        costs['graphql'] = ESTIMATED_COST_PER_REPO['graphql'] * repo_count
+
+    return costs
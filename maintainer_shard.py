@@ -0,0 +1,158 @@
+# -*- coding: UTF-8 -*-
+"""
+Sharded collection of the maintainer stats across hosts (--shard i/N) and merge of the shard outputs
+
+Repos are assigned to shards by a stable hash of their name, so every host computes the same partition of the
+repo list (or of the org enumeration) without coordination. Each shard writes its results as NDJSON (one repo
+per line, --shard-output), and the merge entry point combines the shard outputs into one report table and one
+streaming pass to Initial State.
+
+Processes on the same box can also split the work dynamically with --claim-dir: a repo is only collected by the
+process that manages to create its claim file first (O_CREAT | O_EXCL), so idle processes steal the repos the
+busy ones have not reached yet. Use a fresh claim directory per run.
+
+Usage:
+    python maintainer_shard.py merge SHARD_OUTPUT [SHARD_OUTPUT ...] [-s] [-n ISS_NAME -k ISS_BUCKET_KEY -i ISS_KEY]
+"""
+import argparse
+import hashlib
+import json
+import os
+import zlib
+import maintainer_collect
+import maintainer_emitter
+import maintainer_output
+
+
+def parse_shard(value):
+    """
+    (index, count) from a command line i/N value, 0 <= i < N
+    """
+    index, _, count = value.partition('/')
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value}, expected i/N with 0 <= i < N")
+
+    return index, count
+
+
+def shard_of(repo, count):
+    """
+    Shard of a repo, stable across hosts, runs and Python versions (unlike hash())
+    """
+    return zlib.crc32(repo.encode()) % count
+
+
+def partition(repo_list, index, count):
+    """
+    Repos of repo_list assigned to shard index of count, in repo_list order
+    """
+    return [repo for repo in repo_list if shard_of(repo, count) == index]
+
+
+class ClaimDir(object):
+    """
+    Directory of claim files letting several local processes split a repo list between them
+    """
+    def __init__(self, claim_dir):
+        """
+        Initialize the ClaimDir class object
+        :param claim_dir: directory shared by the processes of one run
+        :type claim_dir: str
+        """
+        os.makedirs(claim_dir, exist_ok=True)
+        self.claim_dir = claim_dir
+
+    def claim(self, repo):
+        """
+        Atomically claim a repo, True if this process got it
+        """
+        # Hashed file names keep any repo name a valid, flat file name
+        path = os.path.join(self.claim_dir, hashlib.sha1(repo.encode()).hexdigest() + '.claim')
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as claim_file:
+            claim_file.write(f"{repo} {os.getpid()}\n")
+
+        return True
+
+
+class ShardWriter(maintainer_output.NdjsonSink):
+    """
+    NDJSON writer of one shard's results, one repo per line, flushed so a crashed shard keeps the repos it finished
+    """
+    def __init__(self, path):
+        """
+        Initialize the ShardWriter class object
+        :param path: output file, truncated
+        :type path: str
+        """
+        super().__init__(open(path, 'w', encoding='utf-8'))
+
+
+def read_results(paths):
+    """
+    Results of every shard output, a repo present in several outputs keeps its last line
+    :return: list of result dicts, sorted by repo
+    """
+    merged = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as shard_output:
+            for line in shard_output:
+                if line.strip():
+                    results = json.loads(line)
+                    merged[results['repo']] = results
+
+    return [merged[repo] for repo in sorted(merged)]
+
+
+def merge(args):
+    """
+    Combine shard outputs into one report table and one Initial State streaming pass
+    """
+    results_list = read_results(args.paths)
+    print(f"Merged {len(results_list)} repos from {len(args.paths)} shard outputs")
+
+    if None not in (args.iss_name, args.iss_bucket_key, args.iss_key):
+        streamer = maintainer_emitter.Emitter(args.iss_name, args.iss_bucket_key, args.iss_key, url=args.iss_url)
+        for results in results_list:
+            maintainer_collect.stream_results(streamer, results)
+        print("")
+        streamer.close()
+
+    if not args.small_terminal:
+        from columnar import columnar
+        report_data = [maintainer_collect.report_row(results) for results in results_list]
+        print(columnar(report_data, maintainer_collect.REPORT_HEADERS, row_sep='-', no_borders=True))
+
+
+def main():
+    """
+    Shard tooling entry point
+    """
+    parser = argparse.ArgumentParser(description='Maintainer stats shards')
+    commands = parser.add_subparsers(dest='command')
+    merge_parser = commands.add_parser('merge', help='combine shard outputs into one report and streaming pass')
+    merge_parser.add_argument('paths', nargs='+', help='shard outputs written with --shard-output')
+    merge_parser.add_argument('-s', '--small-terminal', action='store_true', dest='small_terminal',
+                              help='do not print the report table')
+    merge_parser.add_argument('-n', '--ISSBName', dest='iss_name', default=os.environ.get('ISS_BUCKET_NAME', None),
+                              help='Initial State Stream Bucket Name (or env var ISS_BUCKET_NAME) (default: <none>)')
+    merge_parser.add_argument('-k', '--ISSBKey', dest='iss_bucket_key', default=os.environ.get('ISS_BUCKET_KEY', None),
+                              help='Initial State Stream Bucket Key (or env var ISS_BUCKET_KEY) (default: <none>)')
+    merge_parser.add_argument('-i', '--ISSKey', dest='iss_key', default=os.environ.get('ISS_ACCESS_KEY', None),
+                              help='Initial State Stream Access Key (or env var ISS_ACCESS_KEY) (default: <none>)')
+    merge_parser.add_argument('--iss-url', dest='iss_url', default=os.environ.get('ISS_URL', maintainer_emitter.DEFAULT_URL),
+                              help='Initial State API base URL (or env var ISS_URL) (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        merge(args)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
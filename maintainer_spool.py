@@ -0,0 +1,79 @@
+"""
+Write-ahead spool of Initial State events (see maintainer_emitter.SpooledEmitter)
+
+Every event is committed to disk (SQLite) before it is sent and only deleted once the events API has accepted it,
+so events survive a slow or unavailable dashboard endpoint and a later run replays the backlog. Each event keeps
+the epoch it was logged with, so a batch that is resent after an ambiguous failure overwrites the same data points
+instead of adding new ones.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+
+class EventSpool(object):
+    """
+    SQLite queue of undelivered Initial State events, per bucket
+    """
+    def __init__(self, state_dir):
+        """
+        Initialize the EventSpool class object
+        :param state_dir: directory holding the spool database
+        :type state_dir: str
+        """
+        os.makedirs(state_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(state_dir, 'event_spool.sqlite'), check_same_thread=False)
+        # WAL keeps appends cheap while the sender reads, and survives a crash without losing committed events
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bucket_key TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                epoch REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_bucket_key ON events (bucket_key, id)")
+        self.db.commit()
+
+    def append(self, bucket_key, events):
+        """
+        Persist events before they are sent
+        :param events: dicts of key, value, epoch
+        :type events: list
+        """
+        with self.lock:
+            self.db.executemany("INSERT INTO events (bucket_key, key, value, epoch) VALUES (?, ?, ?, ?)",
+                                [(bucket_key, event['key'], json.dumps(event['value']), event['epoch'])
+                                 for event in events])
+            self.db.commit()
+
+    def peek(self, bucket_key, limit):
+        """
+        Oldest undelivered events of a bucket, without removing them
+        :return: list of (id, event dict)
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT id, key, value, epoch FROM events WHERE bucket_key = ? ORDER BY id LIMIT ?",
+                                   (bucket_key, limit)).fetchall()
+
+        return [(row_id, dict(key=key, value=json.loads(value), epoch=epoch)) for row_id, key, value, epoch in rows]
+
+    def delete(self, ids):
+        """
+        Drop delivered events
+        """
+        with self.lock:
+            self.db.executemany("DELETE FROM events WHERE id = ?", [(row_id,) for row_id in ids])
+            self.db.commit()
+
+    def count(self, bucket_key):
+        """
+        Number of undelivered events of a bucket
+        """
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM events WHERE bucket_key = ?", (bucket_key,)).fetchone()[0]
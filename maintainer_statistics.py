@@ -0,0 +1,159 @@
+"""
+Bulk timestamp parsing and PR latency statistics
+
+PR timestamps (open PR createdAt, timeline start/end events) are collected into compact arrays and parsed in one
+pass instead of one datetime.strptime() per item: with NumPy installed, the strings become one fixed-width array
+converted to datetime64 in C and every reduction is vectorized; without it, timestamps are parsed with the
+(C implemented) datetime.fromisoformat into an array('d'). Both paths return the same values.
+
+Statistics are in days: mean, median, nearest-rank p90/p99 and the distribution of open PR ages over AGE_BUCKETS.
+"""
+import array
+import datetime
+import math
+import statistics
+import time
+
+try:
+    import numpy
+except ImportError:
+    # Optional: the standard library path is used instead
+    numpy = None
+
+EPOCH = datetime.datetime(1970, 1, 1)
+# Upper bounds (days) of the open PR age distribution buckets, the last bucket is open ended
+AGE_BUCKETS = (1, 7, 30, 90, 365)
+
+
+def to_epoch(timestamp):
+    """
+    Epoch seconds of one GitHub timestamp (2019-10-24T03:29:08Z, UTC)
+    """
+    return (datetime.datetime.fromisoformat(timestamp[:19]) - EPOCH).total_seconds()
+
+
+def parse_timestamps(timestamps):
+    """
+    Epoch seconds of GitHub timestamps, parsed in bulk
+    :param timestamps: iterable of timestamp strings
+    :type timestamps: iterable
+    :return: numpy float64 array, or array('d') without NumPy
+    """
+    if numpy is not None:
+        # Fixed width strings cut at 19 characters drop the 'Z', then one datetime64 conversion in C
+        values = numpy.array(timestamps if isinstance(timestamps, list) else list(timestamps), dtype='U19')
+        return values.astype('datetime64[s]').astype('float64')
+
+    return array.array('d', (to_epoch(timestamp) for timestamp in timestamps))
+
+
+def ages(timestamps, now=None):
+    """
+    Days elapsed since each timestamp, against a single clock reading
+    :param timestamps: iterable of timestamp strings, e.g. open PR createdAt
+    :type timestamps: iterable
+    :param now: epoch seconds to measure against (default: time.time())
+    :type now: float
+    """
+    now = time.time() if now is None else now
+    epochs = parse_timestamps(timestamps)
+    if numpy is not None:
+        return (now - epochs) / 86400
+
+    return array.array('d', ((now - epoch) / 86400 for epoch in epochs))
+
+
+def durations(bounds):
+    """
+    Days between the start and end of each (start, end) pair, negative durations count as 0
+    :param bounds: iterable of (start timestamp, end timestamp) pairs, both set
+    :type bounds: iterable
+    """
+    starts, ends = [], []
+    for start, end in bounds:
+        starts.append(start)
+        ends.append(end)
+    start_epochs, end_epochs = parse_timestamps(starts), parse_timestamps(ends)
+    if numpy is not None:
+        return numpy.maximum(0, (end_epochs - start_epochs) / 86400)
+
+    return array.array('d', (max(0, (end - start) / 86400) for start, end in zip(start_epochs, end_epochs)))
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of an ascending sequence of values
+    """
+    if not len(values):
+        return 0
+    return float(values[max(0, math.ceil(pct / 100 * len(values)) - 1)])
+
+
+def summarize(values):
+    """
+    Aggregates (in days) of an array of durations or ages
+    :return: dict of count, total, mean, median, p90, p99 (rounded to 2 decimals, 0 when empty)
+    """
+    count = len(values)
+    if not count:
+        return dict(count=0, total=0, mean=0, median=0, p90=0, p99=0)
+    if numpy is not None:
+        ordered = numpy.sort(numpy.asarray(values, dtype='float64'))
+        total, median = float(ordered.sum()), float(numpy.median(ordered))
+    else:
+        ordered = sorted(values)
+        total, median = math.fsum(ordered), statistics.median(ordered)
+
+    return dict(count=count, total=total, mean=round(total / count, 2), median=round(median, 2),
+                p90=round(percentile(ordered, 90), 2), p99=round(percentile(ordered, 99), 2))
+
+
+def age_distribution(values, buckets=AGE_BUCKETS):
+    """
+    Number of ages in each bucket, e.g. {'<1d': 3, '1-7d': 5, ..., '>365d': 1}
+    """
+    labels = [f"<{buckets[0]}d"] + [f"{low}-{high}d" for low, high in zip(buckets, buckets[1:])] + [f">{buckets[-1]}d"]
+    if numpy is not None:
+        counts = numpy.bincount(numpy.searchsorted(numpy.asarray(buckets, dtype='float64'),
+                                                   numpy.asarray(values, dtype='float64'), side='right'),
+                                minlength=len(labels))
+        return {label: int(count) for label, count in zip(labels, counts)}
+    counts = [0] * len(labels)
+    for value in values:
+        idx = 0
+        while idx < len(buckets) and value >= buckets[idx]:
+            idx += 1
+        counts[idx] += 1
+
+    return dict(zip(labels, counts))
+
+
+def concatenate(first, second):
+    """
+    One array of the values of two arrays from this module
+    """
+    if numpy is not None:
+        return numpy.concatenate((numpy.asarray(first, dtype='float64'), numpy.asarray(second, dtype='float64')))
+
+    return array.array('d', first) + array.array('d', second)
+
+
+def pr_latency_stats(open_prs=(), bounds=(), now=None):
+    """
+    PR latency statistics of a repo from any iterable of PR events
+    The response time mixes the age of every open PR with the start-to-end duration of every finished PR, as the
+    Average PR Response Time always has.
+    :param open_prs: open PR nodes (with createdAt) or createdAt strings
+    :type open_prs: iterable
+    :param bounds: (start, end) timestamp pairs of the finished PRs, see maintainer_v4.pr_timeline_bounds
+    :type bounds: iterable
+    :param now: epoch seconds the open PR ages are measured against (default: time.time())
+    :type now: float
+    :return: dict of the response time aggregates (count, total, mean, median, p90, p99) with the open PR ages
+             distribution under 'open_ages'
+    """
+    open_ages = ages((pr if isinstance(pr, str) else pr['createdAt'] for pr in open_prs), now)
+    stats = summarize(concatenate(open_ages, durations(bounds)))
+    stats['open_ages'] = age_distribution(open_ages)
+
+    return stats
@@ -14,11 +14,27 @@ https://developer.github.com/v4/
 
 """
 import argparse
-import maintainer_v3
+import cProfile
+import itertools
+import maintainer_cache
+import maintainer_checkpoint
+import maintainer_collect
+import maintainer_daemon
+import maintainer_delta
+import maintainer_emitter
+import maintainer_history
+import maintainer_instrument
+import maintainer_output
+import maintainer_querysize
+import maintainer_ratelimit
+import maintainer_shard
+import maintainer_spool
+import maintainer_transport
 import maintainer_v4
+import maintainer_webhook
 import os.path
-from columnar import columnar
-from ISStreamer.Streamer import Streamer
+import pstats
+import sys
 
 __name__ = '__main__'
 
@@ -47,9 +63,38 @@ def process_arguments():
                         nargs='+', dest='gh_repos', 
                         help='specific repo or list of repos (e.g. tpinux (default: <none>)')
 
+    parser.add_argument('-a', '--all-repos', action='store_true', dest='all_repos',
+                        help='collect every repo of the org instead of --repo, enumerated through paginated APIv4 '
+                             'queries that also fetch stars, forks, open issue/PR counts and commit history')
+
+    parser.add_argument('--include-archived', action='store_true', dest='include_archived',
+                        help='with --all-repos, keep archived repos (default: false)')
+
+    parser.add_argument('--include-forks', action='store_true', dest='include_forks',
+                        help='with --all-repos, keep forks (default: false)')
+
+    parser.add_argument('--visibility', choices=['public', 'private', 'internal'], dest='visibility',
+                        help='with --all-repos, keep only repos of this visibility (default: <all>)')
+
+    parser.add_argument('--topic', action='append', dest='topics',
+                        help='with --all-repos, keep only repos with this topic (repeatable, any match) (default: <all>)')
+
+    parser.add_argument('--pushed-since', dest='pushed_since', metavar='YYYY-MM-DD',
+                        help='with --all-repos, keep only repos pushed since this date (default: <all>)')
+
     parser.add_argument('-t ', '--token',
-                        action='store', dest='gh_token', default=os.environ.get('GITHUB_TOKEN', None),
-                        help='GitHub API token (or env var GITHUB_TOKEN) (default: environment variable)')
+                        action='append', dest='gh_tokens',
+                        help='GitHub API token (or env var GITHUB_TOKEN); repeat to spread the run over a pool of '
+                             'tokens, each request going to the token with the most rate limit headroom '
+                             '(default: environment variable)')
+
+    parser.add_argument('--token-file', dest='token_file',
+                        help='file with one GitHub API token per line, added to the token pool (default: <none>)')
+
+    parser.add_argument('--api-url', dest='api_url',
+                        default=os.environ.get('GITHUB_API_URL', maintainer_transport.DEFAULT_API_URL),
+                        help='GitHub API base URL, e.g. GitHub Enterprise or a local stand-in server '
+                             '(or env var GITHUB_API_URL) (default: %(default)s)')
 
     parser.add_argument('-n ' '--ISSBName ',
                         action='store', dest='iss_name', default=os.environ.get('ISS_BUCKET_NAME', None),
@@ -63,6 +108,34 @@ def process_arguments():
                         action='store', dest='iss_key', default=os.environ.get('ISS_ACCESS_KEY', None),
                         help='Initial State Stream Access Key (or env var ISS_ACCESS_KEY) (default: <none>')
 
+    parser.add_argument('--iss-url', dest='iss_url', default=os.environ.get('ISS_URL', maintainer_emitter.DEFAULT_URL),
+                        help='Initial State API base URL, e.g. a local stand-in server (or env var ISS_URL) '
+                             '(default: %(default)s)')
+
+    parser.add_argument('--iss-batch-size', type=int, dest='iss_batch_size', default=maintainer_emitter.DEFAULT_BATCH_SIZE,
+                        help='maximum Initial State events per request, across repos (default: %(default)s)')
+
+    parser.add_argument('--iss-linger', type=float, dest='iss_linger', default=maintainer_emitter.DEFAULT_LINGER,
+                        help='seconds queued Initial State events wait for a fuller batch before they are sent '
+                             '(default: %(default)s)')
+
+    parser.add_argument('--spool', action='store_true', dest='spool',
+                        help='persist every Initial State event under --state-dir before it is sent; undelivered '
+                             'events are retried and replayed by the next run (default: false)')
+
+    parser.add_argument('--spool-drain-timeout', type=float, dest='spool_drain_timeout',
+                        default=maintainer_emitter.DEFAULT_DRAIN_TIMEOUT,
+                        help='with --spool, seconds spent delivering the backlog at the end of a run before it is '
+                             'left to the next run (default: %(default)s)')
+
+    parser.add_argument('--delta', action='store_true', dest='delta',
+                        help='send only the Initial State signals whose value changed since it was last sent; '
+                             'last-sent values are kept under --state-dir (default: false)')
+
+    parser.add_argument('--heartbeat', type=float, dest='heartbeat', default=maintainer_delta.DEFAULT_HEARTBEAT_HOURS,
+                        help='with --delta, hours after which an unchanged signal is sent again, 0 to never resend '
+                             '(default: %(default)s)')
+
     parser.add_argument('-d ', '--debug ',
                         action='store_true', dest='debug',
                         help='enable debug logging (default: false)')
@@ -70,16 +143,191 @@ def process_arguments():
     parser.add_argument('-s','--small-terminal', action='store_true', dest='small_terminal',
                         help='disallow columnar from reporting for small terminals (e.g. Github actions)')
 
-    return parser.parse_args()
+    parser.add_argument('--output', choices=maintainer_output.OUTPUT_FORMATS, dest='output',
+                        help='stream every repo result (all fields, e.g. the referring sites) as soon as it is '
+                             'collected, as NDJSON or CSV, to --output-file (default: <none>)')
+
+    parser.add_argument('--output-file', dest='output_file', metavar='FILE',
+                        help='file --output is written to; with std out, the progress and summary go to std err '
+                             '(default: std out)')
+
+    parser.add_argument('--top', type=int, dest='top',
+                        help='keep only the N highest repos by --top-by in the columnar report (default: every repo, '
+                             '%d with --output)' % maintainer_output.DEFAULT_TOP)
+
+    parser.add_argument('--top-by', choices=maintainer_collect.REPORT_FIELDS[1:], dest='top_by', default='total_stars',
+                        metavar='FIELD', help='result field the --top repos are picked by (default: %(default)s)')
+
+    parser.add_argument('--batch-size', type=int, dest='batch_size', default=0,
+                        help='query APIv4 metrics for several repos per request, starting with this many repos per batch; '
+                             'later batches are sized from the reported query cost (default: 0, one repo per request)')
+
+    parser.add_argument('-w', '--workers', type=int, dest='workers', default=1,
+                        help='number of repos to collect concurrently (default: 1)')
+
+    parser.add_argument('--pool-size', type=int, dest='pool_size', default=maintainer_transport.DEFAULT_POOL_SIZE,
+                        help='keep-alive HTTP connections shared by the GitHub clients (default: %(default)s, at least --workers)')
+
+    parser.add_argument('--timeout', type=float, dest='timeout', default=maintainer_transport.DEFAULT_TIMEOUT,
+                        help='timeout per GitHub request, in seconds (default: %(default)s)')
+
+    parser.add_argument('--retries', type=int, dest='retries', default=maintainer_transport.DEFAULT_RETRIES,
+                        help='retries with exponential backoff for transient GitHub failures (default: %(default)s)')
+
+    parser.add_argument('--rate-limit-reserve', type=int, dest='rate_limit_reserve',
+                        default=maintainer_ratelimit.DEFAULT_RESERVE,
+                        help='rate limit points left untouched per API; requests wait for the reset window '
+                             'instead of spending them (default: %(default)s)')
+
+    parser.add_argument('--cache-dir', dest='cache_dir', default=None,
+                        help='directory for the on-disk ETag cache of APIv3 responses; unchanged resources are '
+                             'revalidated with free 304s (default: <none>, no caching)')
+
+    parser.add_argument('--cache-size', type=float, dest='cache_size', default=maintainer_cache.DEFAULT_CACHE_SIZE_MB,
+                        help='size cap of the ETag cache in MB, least recently used entries are evicted '
+                             '(default: %(default)s)')
+
+    parser.add_argument('--cache-ttl', action='append', dest='cache_ttl', metavar='PATTERN=SECONDS',
+                        help='serve APIv3 URLs matching PATTERN from the cache without revalidation for SECONDS, '
+                             'e.g. traffic/views=3600 (repeatable)')
+
+    parser.add_argument('--list-org-repos', action='store_true', dest='list_org_repos',
+                        help='resolve every repo from the paginated org repo listing (100 repos per request) '
+                             'instead of one request per repo (default: false)')
+
+    parser.add_argument('--contributors-refresh', type=float, dest='contributors_refresh', default=0,
+                        help='hours a repo contributor count is reused before it is fetched again; kept across runs '
+                             'with --cache-dir (default: 0, every run)')
+
+    parser.add_argument('--light', action='store_true', dest='light',
+                        help='fetch only the fields the metrics are computed from (e.g. createdAt of open PRs) '
+                             '(default: false)')
+
+    parser.add_argument('--recent-prs', type=int, dest='recent_prs', default=maintainer_querysize.DEFAULT_SIZES['recent_prs'],
+                        choices=range(1, maintainer_querysize.MAX_PAGE_SIZE + 1), metavar='N',
+                        help='most recent PRs whose timelines the Avg PR Response Time is computed from, 1-100; the '
+                             'page sizes of these nested queries adapt to each repo and are learned under --state-dir '
+                             '(default: %(default)s)')
+
+    parser.add_argument('--backend', choices=['mixed', 'graphql'], dest='backend', default='mixed',
+                        help='graphql: query stars, forks and contributors (approximated by the mentionable users) with '
+                             'the APIv4 metrics, in one query per repo or per --batch-size batch, and keep APIv3 for '
+                             'the traffic endpoints only (default: %(default)s)')
+
+    parser.add_argument('--no-traffic', action='store_false', dest='traffic',
+                        help='skip the traffic metrics (views, clones, referrers); no APIv3 client (PyGithub) is '
+                             'loaded at all. Implies --backend graphql (default: false)')
+
+    parser.add_argument('--state-dir', dest='state_dir', default='.maintainer_state',
+                        help='directory for state kept between runs (default: %(default)s)')
+
+    parser.add_argument('--incremental', action='store_true', dest='incremental',
+                        help='compute the Avg PR Response Time over every PR in history, fetching only the PRs '
+                             'updated since the last run; per-PR events are kept under --state-dir (default: false)')
+
+    parser.add_argument('--webhook', action='store_true', dest='webhook',
+                        help='collect every metric once, then keep them up to date from GitHub webhooks (stars, forks, '
+                             'pushes, issues, PRs) received on --webhook-port; only the traffic metrics are still polled '
+                             'on their --interval. Implies --incremental (default: false)')
+
+    parser.add_argument('--webhook-port', type=int, dest='webhook_port', default=maintainer_webhook.DEFAULT_PORT,
+                        help='port of the webhook receiver (default: %(default)s)')
+
+    parser.add_argument('--webhook-secret', dest='webhook_secret', default=os.environ.get('GITHUB_WEBHOOK_SECRET', None),
+                        help='secret the webhook payloads are signed with (or env var GITHUB_WEBHOOK_SECRET) '
+                             '(default: environment variable)')
+
+    parser.add_argument('--history', action='store_true', dest='history',
+                        help='append every KPI and the per-day views/clones buckets (GitHub keeps 14 days) to a '
+                             'history store under --state-dir, see maintainer_history.py (default: false)')
+
+    parser.add_argument('--shard', dest='shard', metavar='i/N',
+                        help='collect only shard i (0 <= i < N) of the repo list, partitioned by a stable hash of the '
+                             'repo names (default: <none>, every repo)')
+
+    parser.add_argument('--shard-output', dest='shard_output', metavar='FILE',
+                        help='write every repo result to FILE as NDJSON, to be combined with '
+                             'python maintainer_shard.py merge FILE... (default: <none>)')
+
+    parser.add_argument('--claim-dir', dest='claim_dir', metavar='DIR',
+                        help='split the repo list between processes of the same box: a repo is only collected by the '
+                             'process that claims it first in DIR; use a fresh DIR per run (default: <none>)')
+
+    parser.add_argument('--resume', action='store_true', dest='resume',
+                        help='skip the repos the checkpoint journal under --state-dir records as collected by the '
+                             'previous run and re-emit their results; failed repos are retried, a run that finished '
+                             'without failures is not resumed (default: false)')
+
+    parser.add_argument('--daemon', action='store_true', dest='daemon',
+                        help='keep running and refresh each metric group on its own interval (see --interval), '
+                             'spreading repos across the interval; stops on SIGTERM/SIGINT (default: false)')
+
+    parser.add_argument('--interval', action='append', dest='intervals', metavar='GROUP=SECONDS',
+                        help='with --daemon, refresh interval of a metric group (discovery, usage, retention, health) '
+                             '(repeatable) (default: discovery=900 usage=21600 retention=3600 health=1800)')
+
+    parser.add_argument('--metrics-json', dest='metrics_json', metavar='FILE',
+                        help='write a JSON summary of the run instrumentation (request counts, latency histograms, '
+                             'bytes, retries, GraphQL cost, per-repo per-group timings) to FILE at the end of the run')
+    parser.add_argument('--metrics-prom', dest='metrics_prom', metavar='FILE',
+                        help='write the run instrumentation to FILE in the Prometheus text format, e.g. for the '
+                             'node_exporter textfile collector')
+    parser.add_argument('--metrics-interval', type=float, dest='metrics_interval',
+                        default=maintainer_instrument.DEFAULT_EXPORT_INTERVAL,
+                        help='with --daemon or --webhook, seconds between exports of --metrics-json/--metrics-prom '
+                             '(default: %(default)s)')
+    parser.add_argument('--profile', action='store_true', dest='profile',
+                        help='profile the run with cProfile (main thread; saved as profile.pstats under --state-dir) '
+                             'and print the phase, slowest/most expensive repo and endpoint breakdown (default: false)')
+
+    args = parser.parse_args()
+
+    # Token pool: every -t plus every line of --token-file, the first token also authenticates the clients
+    tokens = args.gh_tokens or []
+    if args.token_file:
+        with open(args.token_file) as token_file:
+            tokens += [line.strip() for line in token_file if line.strip() and not line.startswith('#')]
+    if not tokens and os.environ.get('GITHUB_TOKEN'):
+        tokens = [os.environ['GITHUB_TOKEN']]
+    args.gh_tokens = tokens
+    args.gh_token = tokens[0] if tokens else None
+
+    return args
 
 if __name__ is '__main__':
     # Parse options
     args = process_arguments()
-
+    if not args.traffic:
+        # Every metric left is available from APIv4
+        args.backend = 'graphql'
+    if args.top is None:
+        args.top = maintainer_output.DEFAULT_TOP if args.output else 0
+
+    # Streaming report output, every repo is written as soon as it is collected
+    sink = maintainer_output.open_sink(args.output, args.output_file) if args.output else None
+    if sink and not sink.owned:
+        # std out only carries the streamed results
+        sys.stdout = sys.stderr
+    if args.webhook:
+        # PR response time events from webhooks are kept in the PR state store
+        args.incremental = True
+
+    # Hot-path instrumentation, recorded by the shared transport (see maintainer_instrument.py)
+    instruments = maintainer_instrument.Instruments(args.metrics_json, args.metrics_prom)
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    # Shared keep-alive connection pool for both GitHub APIs
+    transport = maintainer_transport.Transport.from_args(args, instruments)
     # Initialize Maintainer GraphQL APIv4 class
-    mtr4 = maintainer_v4.Maintainer(args)
-    # Initialize Maintainer REST APIv3 class
-    mtr3 = maintainer_v3.Maintainer(args)
+    mtr4 = maintainer_v4.Maintainer(args, transport)
+    # Initialize Maintainer REST APIv3 class, only needed (and PyGithub only imported) for the traffic metrics
+    if args.traffic:
+        import maintainer_v3
+        mtr3 = maintainer_v3.Maintainer(args, transport)
+    else:
+        mtr3 = None
 
     # Populate local variables
     repo_list = args.gh_repos
@@ -89,104 +337,210 @@ if __name__ is '__main__':
 
     # Initial State the Initial State Streamer class
     if None not in (iss_key, iss_bucket_name, iss_bucket_key):
-        streamer = Streamer(bucket_name=iss_bucket_name, bucket_key=iss_bucket_key, access_key=iss_key)
+        # Events of every repo are queued and sent in batches by a background thread
+        if args.spool:
+            # Persisted under --state-dir before delivery, backlog of earlier runs is replayed first
+            streamer = maintainer_emitter.SpooledEmitter(iss_bucket_name, iss_bucket_key, iss_key,
+                                                         maintainer_spool.EventSpool(args.state_dir), url=args.iss_url,
+                                                         batch_size=args.iss_batch_size, linger=args.iss_linger,
+                                                         drain_timeout=args.spool_drain_timeout, debug=args.debug,
+                                                         transport=maintainer_transport.Transport(
+                                                             pool_size=1, retries=0, instruments=instruments,
+                                                             client='initialstate'))
+        else:
+            streamer = maintainer_emitter.Emitter(iss_bucket_name, iss_bucket_key, iss_key, url=args.iss_url,
+                                                  batch_size=args.iss_batch_size, linger=args.iss_linger, debug=args.debug,
+                                                  transport=maintainer_transport.Transport(
+                                                      pool_size=1, instruments=instruments, client='initialstate'))
+        if args.delta:
+            # Only the signals that changed since the last run (or whose heartbeat is due) are sent
+            streamer = maintainer_delta.DeltaFilter(streamer, maintainer_delta.LastSentStore(args.state_dir),
+                                                    iss_bucket_key, args.heartbeat)
     else:
         if args.debug:
             print('!!! Initial State Streamer not initialized!!!!')
             print('Bucket Name {0}, Bucket Key {1}, Access Key {2}'.format(iss_bucket_name, iss_bucket_key, iss_key))
 
-     # Prep the std out report columns
-    report_data = []
-    headers = ['repository', 'total views', 'unique views', 'total clones', 'unique clones', 'total stars', 'total forks',
-                'contributors','total commits', '# Days since Commit', 'open issues', 'open PRs', 'Avg PR Response Time(days)']
-
-     # Go Forth, retrieve the data from GitHub API spigots
-    for repo in repo_list:
-        print("Retrieving results for... {0}\{1}".format(args.gh_org, repo), end="\t", flush=True)
-        mtr3.repo, mtr4.repo = repo, repo
-        # Various Discovery Metrics (NOTE: GitHub APIv3)
-        total_views, unique_views, total_referrals, unique_referrals, total_stars = mtr3.get_discovery_metrics()
-        # Miscellaneous Usage Metrics (NOTE: GitHub APIv3)
-        total_clones, unique_cloners, forks_count, contributor_count = mtr3.get_usage_metrics()
-        # Assorted Retention Metrics (NOTE: GitHub APIv4)
-        commits, time_since_last = mtr4.get_retention_metrics()
-        # Disparate Project Health Metrics (NOTE: GitHub APIv4)
-        total_open_issues, total_open_pull_reqs, total_average_time_for_pr = mtr4.get_project_health_metrics()
-        # Rate Limit Left
-        remaining_rate_limit, resetAt_rate_limit = mtr4.get_rate_limit()
-
-        # Populate Report Data
-        repo_data = [repo, total_views, unique_views, total_clones, unique_cloners, total_stars, forks_count,
-                    contributor_count, commits, time_since_last, total_open_issues, total_open_pull_reqs, total_average_time_for_pr]
-        report_data.append(repo_data)
+     # Local time-series history of every KPI and per-day traffic bucket
+    history = maintainer_history.HistoryStore(args.state_dir) if args.history else None
+
+     # Prep the std out report columns, bounded to the --top repos
+    report = maintainer_output.ReportRows(args.top, args.top_by)
+    headers = maintainer_collect.REPORT_HEADERS
+
+     # Organization-wide mode: enumerate every repo (with its cheap metrics) through paginated APIv4 queries
+    seeds = {}
+    if args.all_repos:
+        print("Enumerating repos for... {0}".format(args.gh_org), end="\t", flush=True)
+        with instruments.phase('enumerate'):
+            seeds = dict(mtr4.enumerate_org_repos(include_archived=args.include_archived, include_forks=args.include_forks,
+                                                  visibility=args.visibility, topics=args.topics,
+                                                  pushed_since=args.pushed_since))
+        repo_list = list(seeds)
+        print("[DONE] ({0} repos)".format(len(repo_list)))
+
+     # Multi-host mode: keep only this shard's repos, every host computes the same partition
+    if args.shard:
+        shard_index, shard_count = maintainer_shard.parse_shard(args.shard)
+        repo_list = maintainer_shard.partition(repo_list, shard_index, shard_count)
+        print("Shard {0}: {1} repos".format(args.shard, len(repo_list)))
+    shard_writer = maintainer_shard.ShardWriter(args.shard_output) if args.shard_output else None
+    claim_dir = maintainer_shard.ClaimDir(args.claim_dir) if args.claim_dir else None
+
+     # Bulk-resolve the APIv3 repo handles from the org listing
+    if args.list_org_repos and mtr3 and args.backend == 'mixed':
+        print("Listing repos for... {0}".format(args.gh_org), end="\t", flush=True)
+        with instruments.phase('list repos'):
+            mtr3.load_repo_handles()
         print("[DONE]")
 
-        """
-        Initial State Signal Creation and Streamer Logging
-        """
-        # Check if Initial State Streamer was created based on args provided (iss_key, iss_bucket etc.)
-        # If not, don't try to create stream data.
-        if not 'streamer' in dir():
-            continue
-
-        print("Streaming results for...  {1}\{2} to Initial State Bucket ({0})".format(iss_bucket_name, args.gh_org, repo), end="\t", flush=True)
-        # Create ISS Traffic Signals
-        iss_total_views = repo + "_total_views"
-        iss_unique_views = repo + "_unique_views"
-        # Iterate through referring sites until a full list is compiled into individual signals
-        for key,val in total_referrals.items():
-            streamer.log(repo + "_total_refer_from" + key, val)
-        for key,val in unique_referrals.items():
-            streamer.log(repo + "_unique_refer_from_" + key, val)
-        iss_starcount = repo + "_total_stars"
-        # Stream the ISS Traffic Signals
-        streamer.log(iss_total_views, total_views)
-        streamer.log(iss_unique_views, unique_views)
-        streamer.log(iss_starcount, total_stars)
-        print("(╯°□°)╯", end=" ", flush=True)
-        streamer.flush()
-
-        # Create ISS Usage Signals
-        iss_total_clones = repo + "_total_clones"
-        iss_unique_clones = repo + "_unique_clones"
-        iss_forkcount = repo + "_total_forks"
-        iss_contributors = repo + "_total_contributors"
-        # Stream the ISS Usage Signals
-        streamer.log(iss_total_clones, total_clones)
-        streamer.log(iss_unique_clones, unique_cloners)
-        streamer.log(iss_forkcount, forks_count)
-        streamer.log(iss_contributors, contributor_count)
-        print("︵", end="", flush=True)
-        streamer.flush
-
-        # Create ISS Retention Signals
-        iss_commits = repo + "_total_commits"
-        iss_time_since_commit = repo + "_time_elapsed_commits"
-        # Stream the ISS Retention Signals
-        streamer.log(iss_commits, commits)
-        streamer.log(iss_time_since_commit, time_since_last)
-        print("┻━┻", end="", flush=True)
-        streamer.flush()
-
-        # Create the ISS Project Health Signals
-        iss_total_issues = repo + "_total_open_issues"
-        iss_total_prs = repo + "_total_open_prs"
-        iss_pr_resolution_time = repo + "_PR_response_time"
-        # Stream the ISS Project Health Signals
-        streamer.log(iss_total_issues, total_open_issues)
-        streamer.log(iss_total_prs, total_open_pull_reqs)
-        streamer.log(iss_pr_resolution_time, total_average_time_for_pr)
-        print("!!", end="\t", flush=True)
-        streamer.flush()
+     # Seed the rate limit budget (APIv3 /rate_limit is free) and project whether the whole run fits
+    with instruments.phase('rate limit'):
+        if mtr3:
+            mtr3.get_rate_limit()
+        mtr4.get_rate_limit()
+    batch_size = args.batch_size or (maintainer_v4.DEFAULT_BATCH_SIZE if args.backend == 'graphql' else 0)
+    projection = transport.budget.project(maintainer_ratelimit.estimate_run_cost(len(repo_list), batch_size,
+                                                                                 args.backend, args.traffic))
+    for resource, (cost, remaining, fits) in projection.items():
+        if args.debug or not fits:
+            print(f"Projected {resource} rate limit cost: ~{cost} of {remaining} remaining", end="")
+            print("" if fits else f", the run will wait for the reset in ~{transport.budget.reset_minutes(resource)}min")
+
+     # Push mode: webhooks update the metrics incrementally, only the traffic metrics are still polled
+    if args.webhook:
+        receiver = maintainer_webhook.WebhookReceiver(mtr3, mtr4, repo_list, args.webhook_secret,
+                                                      streamer if 'streamer' in dir() else None, history, args.debug)
+        print("Collecting the baseline for... {0}\{1} repos".format(args.gh_org, len(repo_list)), end="\t", flush=True)
+        with instruments.phase('collect'):
+            receiver.seed(args.workers)
         print("[DONE]")
+        server = receiver.serve(port=args.webhook_port)
+        # The daemon polls the traffic metrics into the receiver's results, leaving the webhook fields alone
+        daemon = maintainer_daemon.Daemon(mtr3, mtr4, repo_list, streamer if 'streamer' in dir() else None,
+                                          maintainer_daemon.parse_intervals(args.intervals), args.debug, history,
+                                          groups=('discovery', 'usage'), results=receiver.results, lock=receiver.lock,
+                                          kept_fields=maintainer_webhook.WEBHOOK_FIELDS)
+        daemon.install_signal_handlers()
+        instruments.start_export(args.metrics_interval)
+        latest_results = daemon.run()
+        server.shutdown()
+        for repo in repo_list:
+            report.add(latest_results[repo])
+            if sink:
+                sink.write(latest_results[repo])
+     # Long-running mode: refresh each metric group on its own schedule until SIGTERM/SIGINT
+    elif args.daemon:
+        daemon = maintainer_daemon.Daemon(mtr3, mtr4, repo_list, streamer if 'streamer' in dir() else None,
+                                          maintainer_daemon.parse_intervals(args.intervals), args.debug, history)
+        daemon.install_signal_handlers()
+        instruments.start_export(args.metrics_interval)
+        latest_results = daemon.run()
+        for repo in repo_list:
+            report.add(latest_results[repo])
+            if sink:
+                sink.write(latest_results[repo])
+    else:
+         # Checkpoint journal: every repo is recorded as soon as it is collected, --resume skips the finished ones
+        journal = maintainer_checkpoint.Journal(args.state_dir, args.gh_org, args.resume,
+                                                'checkpoint-' + args.shard.replace('/', 'of') if args.shard else 'checkpoint')
+        resumed = journal.completed()
+        pending = [repo for repo in repo_list if repo not in resumed]
+        if resumed:
+            print("Resuming: {0} repos already collected, {1} left".format(len(repo_list) - len(pending), len(pending)))
+        failures = []
+
+        def record_failure(repo, err):
+            # One failed repo must not abort the run, it is journaled and retried by the next --resume
+            print("\nCollecting {0}\{1} failed: {2}".format(args.gh_org, repo, err), flush=True)
+            failures.append(repo)
+            instruments.inc('maintainer_repos_total', result='failed')
+            journal.failed(repo, err)
+
+         # Multi-repo mode: prefetch the APIv4 metrics with one aliased query per batch of repos
+         # (always with the GraphQL-only backend, stars/forks/contributors included)
+         # NOTE: the prefetch is only a shortcut, when it fails every repo is collected (and isolated) on its own
+        if batch_size and pending:
+            print("Retrieving APIv4 results in batches for... {0}\{1} repos".format(args.gh_org, len(pending)), end="\t", flush=True)
+            try:
+                with instruments.phase('prefetch'):
+                    batch_metrics = mtr4.get_batch_metrics(pending, counts=args.backend == 'graphql')
+            except Exception as err:
+                print("[FAILED: {0}], collecting the repos one by one".format(err), flush=True)
+            else:
+                for repo, seed in maintainer_collect.batch_seeds(batch_metrics).items():
+                    seeds.setdefault(repo, {}).update(seed)
+                print("[DONE]")
+
+         # Go Forth, retrieve the data from GitHub API spigots (the resumed results are re-emitted first)
+         # NOTE: with --workers, repos are collected concurrently but still reported and streamed in repo_list order
+        collected = maintainer_collect.collect_repos(mtr3, mtr4, pending, args.workers, seeds,
+                                                     claim_dir.claim if claim_dir else None, record_failure)
+        for results in itertools.chain((resumed[repo] for repo in repo_list if repo in resumed),
+                                       instruments.timed(collected, 'collect')):
+            repo = results['repo']
+            if repo not in resumed:
+                journal.done(results)
+                instruments.inc('maintainer_repos_total', result='collected')
+            print("Retrieving results for... {0}\{1}".format(args.gh_org, repo), end="\t", flush=True)
+
+            # Populate Report Data
+            report.add(results)
+            if sink:
+                sink.write(results)
+            if history and repo not in resumed:
+                history.record(results)
+            if shard_writer:
+                shard_writer.write(results)
+            print("[DONE]")
+
+            """
+            Initial State Signal Creation and Streamer Logging
+            """
+            # Check if Initial State Streamer was created based on args provided (iss_key, iss_bucket etc.)
+            # If not, don't try to create stream data.
+            if not 'streamer' in dir():
+                continue
+
+            print("Streaming results for...  {1}\{2} to Initial State Bucket ({0})".format(iss_bucket_name, args.gh_org, repo), end="\t", flush=True)
+            with instruments.phase('stream'):
+                maintainer_collect.stream_results(streamer, results)
+            print("[DONE]")
+    if not args.daemon and not args.webhook:
+        journal.close(complete=not failures)
+        if failures:
+            print("{0} repos failed, rerun with --resume to retry them: {1}".format(len(failures), " ".join(failures)))
+    if shard_writer:
+        shard_writer.close()
+    if sink:
+        sink.close()
     # Close ISS Streamer
     if 'streamer' in dir():
-        streamer.close()
+        with instruments.phase('close streamer'):
+            streamer.close()
+
+    # Rate Limit Left (kept live from every response, no extra query needed)
+    remaining_rate_limit = transport.budget.remaining('graphql')
+    resetAt_rate_limit = transport.budget.reset_minutes('graphql')
 
     # Report the results to std out with columnar
     if not args.small_terminal:
-        table=columnar(report_data, headers, row_sep='-', no_borders=True, justify=['l','c','c','c','c','c','c','c','c','c','c','c','c','c'])
+        from columnar import columnar
+        table=columnar(report.report_data(), headers, row_sep='-', no_borders=True, justify=['l','c','c','c','c','c','c','c','c','c','c','c','c','c'])
         print(table)
 
     print(f"Rate Limit remaining: {remaining_rate_limit}, will reset in ~{resetAt_rate_limit}min")
 
+    # Export the run instrumentation (--metrics-json/--metrics-prom), and the profile breakdown (--profile)
+    for resource in ('core', 'graphql'):
+        if transport.budget.remaining(resource) is not None:
+            instruments.set('maintainer_rate_limit_remaining', transport.budget.remaining(resource), resource=resource)
+    instruments.stop_export()
+    if args.profile:
+        profiler.disable()
+        os.makedirs(args.state_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(args.state_dir, 'profile.pstats'))
+        print(instruments.profile_report())
+        print("\nTop functions by cumulative time (main thread, full profile in {0}):".format(
+            os.path.join(args.state_dir, 'profile.pstats')))
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
@@ -0,0 +1,246 @@
+"""
+Shared HTTP transport for the GitHub REST API v3 (PyGithub) and GraphQL API v4 clients
+
+A single pooled requests.Session keeps connections alive between calls, so every query after the first one
+skips the TCP+TLS handshake. Transient failures (5xx, 429, secondary rate limits) are retried with jittered
+exponential backoff, honoring GitHub's Retry-After header when it is sent. Every request is paced by the
+shared rate limit budget (see maintainer_ratelimit.py), which is updated from the response headers. GET requests
+are sent conditionally through the on-disk ETag cache when one is configured (see maintainer_cache.py).
+With a token pool (see maintainer_ratelimit.TokenPool), each request is authorized with the token the pool picks.
+Every request, retry and cache hit is recorded by the instruments registry when one is set (see maintainer_instrument.py).
+
+Best practices for integrators (secondary rate limits, Retry-After):
+https://developer.github.com/v3/guides/best-practices-for-integrators/
+"""
+import email.utils
+import maintainer_cache
+import maintainer_ratelimit
+import random
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# GitHub API base URL, overridden to run against GitHub Enterprise or a local stand-in server (see benchmarks/)
+DEFAULT_API_URL = 'https://api.github.com'
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 30
+DEFAULT_RETRIES = 5
+# Backoff before retry n is a random delay in [0, min(BACKOFF_MAX, BACKOFF_BASE * 2**n)] seconds
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Gateway errors GitHub answers a query it could not resolve in time with, retried like timeouts
+TIMEOUT_STATUS_CODES = (502, 504)
+
+
+class Transport(object):
+    """
+    Pooled keep-alive HTTP session with retry/backoff
+    """
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, budget=None,
+                 cache=None, debug=False, instruments=None, client='github'):
+        """
+        Initialize the Transport class object
+        :param pool_size: number of keep-alive connections kept per host
+        :type pool_size: int
+        :param timeout: connect/read timeout per request, in seconds
+        :type timeout: float
+        :param retries: number of retries for transient failures
+        :type retries: int
+        :param budget: rate limit budget that paces every request, or token pool that also picks each
+                       request's token (default: no pacing)
+        :type budget: maintainer_ratelimit.RateLimitBudget or maintainer_ratelimit.TokenPool
+        :param cache: conditional-request cache for GET requests (default: no caching)
+        :type cache: maintainer_cache.HttpCache
+        :param debug: print every retry
+        :type debug: bool
+        :param instruments: registry every request is recorded in (default: no instrumentation)
+        :type instruments: maintainer_instrument.Instruments
+        :param client: client label of the recorded requests, 'github' or 'initialstate'
+        :type client: str
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.budget = budget
+        self.cache = cache
+        self.debug = debug
+        self.instruments = instruments
+        self.client = client
+
+        self.session = requests.Session()
+        # pool_block keeps the number of open connections at pool_size when more threads than that are working
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+
+    @classmethod
+    def from_args(cls, args, instruments=None):
+        """
+        Build the Transport from the command line arguments
+        :param args: command line arguments aggregated by argparse
+        :type args: obj
+        :param instruments: registry every request is recorded in (default: no instrumentation)
+        :type instruments: maintainer_instrument.Instruments
+        """
+        tokens = getattr(args, 'gh_tokens', None) or []
+        if len(tokens) > 1:
+            budget = maintainer_ratelimit.TokenPool(tokens, reserve=args.rate_limit_reserve)
+        else:
+            budget = maintainer_ratelimit.RateLimitBudget(reserve=args.rate_limit_reserve)
+        cache = None
+        if args.cache_dir:
+            ttl = maintainer_cache.HttpCache.parse_ttl(args.cache_ttl)
+            if args.contributors_refresh:
+                # Contributor counts change slowly, keep them across runs for the refresh interval
+                ttl.setdefault(maintainer_cache.CONTRIBUTORS_URL, args.contributors_refresh * 3600)
+            cache = maintainer_cache.HttpCache(args.cache_dir, args.cache_size, ttl)
+        return cls(pool_size=max(args.pool_size, args.workers), timeout=args.timeout, retries=args.retries,
+                   budget=budget, cache=cache, debug=args.debug, instruments=instruments)
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request through the pooled session, retrying transient failures
+        Returns the last requests.Response; connection errors are re-raised once retries are exhausted
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if self.cache and method.upper() == 'GET':
+            return self.conditional_request(method, url, **kwargs)
+
+        return self.send(method, url, **kwargs)
+
+    def conditional_request(self, method, url, **kwargs):
+        """
+        GET through the ETag cache: fresh entries are served from disk, stale ones are revalidated with
+        If-None-Match / If-Modified-Since and a 304 is answered with the stored body
+        A request whose own validators name the stored version is answered with a 304 instead of the body
+        """
+        headers = dict(kwargs.get('headers') or {})
+        # With a token pool the request's token is only picked when it is sent, cache entries are shared by the pool
+        scope = getattr(self.budget, 'scope', None) or headers.get('Authorization')
+        key = self.cache.key(url, kwargs.get('params'), scope)
+        entry = self.cache.get(key)
+        # e.g. PyGithub's update() of a handle it already holds, which only reports a change on a 200
+        current = bool(entry) and self.cache.is_current(entry, headers)
+        if entry and self.cache.is_fresh(entry):
+            if self.instruments:
+                self.instruments.inc('maintainer_http_cache_total', result='fresh')
+            return self.cache.to_response(entry, not_modified=current)
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+            kwargs['headers'] = headers
+
+        response = self.send(method, url, **kwargs)
+        if response.status_code == 304 and entry:
+            if self.instruments:
+                self.instruments.inc('maintainer_http_cache_total', result='revalidated')
+            self.cache.refresh(key)
+            return self.cache.to_response(entry, not_modified=current)
+        if response.status_code == 200:
+            self.cache.put(key, url, response)
+
+        return response
+
+    def send(self, method, url, timeout_retries=None, **kwargs):
+        """
+        Send a request through the pooled session, retrying transient failures
+        The token the request was sent with (token pool only) is kept in response.token
+        :param timeout_retries: retries of timeouts and 502/504s, capped by the transport's retries (default: the
+                                transport's retries), e.g. 0 for a query that is resized instead of resent
+        :type timeout_retries: int
+        """
+        resource = 'graphql' if url.endswith('/graphql') else 'core'
+        timeout_retries = self.retries if timeout_retries is None else min(self.retries, timeout_retries)
+        attempt = 0
+        while True:
+            token = self.budget.acquire(resource) if self.budget else None
+            if token:
+                kwargs['headers'] = dict(kwargs.get('headers') or {}, Authorization=f"token {token}")
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if self.instruments:
+                    self.instruments.request(self.client, url, err.__class__.__name__, time.perf_counter() - start, 0, 0)
+                if attempt >= (timeout_retries if isinstance(err, requests.Timeout) else self.retries):
+                    raise
+                delay = self.backoff(attempt)
+                reason = err.__class__.__name__
+            else:
+                if self.instruments:
+                    self.record(url, response, time.perf_counter() - start)
+                response.token = token
+                if self.budget:
+                    self.budget.update_from_headers(response.headers, token)
+                retries = timeout_retries if response.status_code in TIMEOUT_STATUS_CODES else self.retries
+                if attempt >= retries or not self.is_retryable(response):
+                    return response
+                delay = self.retry_after(response)
+                if token and response.headers.get('X-RateLimit-Remaining') == '0' and self.budget.has_headroom(resource):
+                    # This token is exhausted, fail over to another one right away
+                    delay = 0
+                elif delay is None:
+                    delay = self.backoff(attempt)
+                reason = response.status_code
+
+            if self.debug:
+                print(f"Transport: {method} {url} failed ({reason}), retry {attempt + 1}/{self.retries} in {delay:.1f}s")
+            if self.instruments:
+                self.instruments.inc('maintainer_http_retries_total', client=self.client, reason=reason)
+            time.sleep(delay)
+            attempt += 1
+
+    def record(self, url, response, seconds):
+        """
+        Record one response in the instruments registry, with its body sizes as sent over the wire
+        """
+        body = getattr(getattr(response, 'request', None), 'body', None)
+        received = response.headers.get('Content-Length')
+        self.instruments.request(self.client, url, response.status_code, seconds, len(body or b''),
+                                 int(received) if received else len(response.content))
+
+    @staticmethod
+    def is_retryable(response):
+        """
+        Transient server errors, 429s, exhausted rate limits and 403 secondary (abuse) rate limits are worth retrying
+        """
+        if response.status_code in RETRY_STATUS_CODES:
+            return True
+        if response.status_code == 403:
+            if response.headers.get('X-RateLimit-Remaining') == '0':
+                return True
+            return 'Retry-After' in response.headers or 'secondary rate limit' in response.text.lower() \
+                or 'abuse' in response.text.lower()
+        return False
+
+    @staticmethod
+    def retry_after(response):
+        """
+        Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or until X-RateLimit-Reset
+        when the rate limit is exhausted, None if neither applies
+        """
+        value = response.headers.get('Retry-After')
+        if value is None:
+            if response.headers.get('X-RateLimit-Remaining') == '0' and 'X-RateLimit-Reset' in response.headers:
+                wait = int(response.headers['X-RateLimit-Reset']) - time.time()
+                return max(0.0, wait + maintainer_ratelimit.RESET_MARGIN)
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time()) if retry_at else None
+
+    @staticmethod
+    def backoff(attempt):
+        """
+        Full-jitter exponential backoff for retry number attempt (starting at 0)
+        """
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
@@ -1,33 +1,184 @@
+import copy
 import datetime
 import json
+import maintainer_transport
+import re
 import requests
+import threading
+import time
 from github import Github
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester, RequestsResponse
 from pprint import pprint
 
+# Contributors are listed one per page, so the page number of the rel="last" link is the contributor count
+LAST_PAGE_LINK = re.compile(r'[?&]page=(\d+)[^>]*>;\s*rel="last"')
+
+
+def install_transport(transport):
+    """
+    Route every PyGithub request through the shared transport, so APIv3 calls reuse the same keep-alive
+    connection pool and retry/backoff as the APIv4 queries
+    :param transport: shared pooled HTTP transport
+    :type transport: maintainer_transport.Transport
+    """
+    def getresponse(connection):
+        url = "%s://%s:%s%s" % (connection.protocol, connection.host, connection.port, connection.url)
+        response = transport.request(connection.verb, url, headers=connection.headers, data=connection.input,
+                                     timeout=connection.timeout, verify=connection.verify, allow_redirects=False)
+        return RequestsResponse(response)
+
+    http_class = type('TransportHTTPConnection', (HTTPRequestsConnectionClass,), dict(getresponse=getresponse))
+    https_class = type('TransportHTTPSConnection', (HTTPSRequestsConnectionClass,), dict(getresponse=getresponse))
+    Requester.injectConnectionClasses(http_class, https_class)
+
+
 class Maintainer(object):
     """
     Contains functionality for reporting maintainer stats from target org or repo URL
     """
-    def __init__(self, args):
+    def __init__(self, args, transport=None):
         """
         Initialize the Maintainer (APIv3) class object
         :param args: command line arguments aggregated by argparse
         :type args: obj
+        :param transport: shared pooled HTTP transport (default: a new one built from args)
+        :type transport: maintainer_transport.Transport
         """
-        self.gh = Github(args.gh_token)
+        self.transport = transport or maintainer_transport.Transport.from_args(args)
+        install_transport(self.transport)
+        self.api_url = getattr(args, 'api_url', maintainer_transport.DEFAULT_API_URL).rstrip('/')
+        # NOTE: the injected connection classes open a connection object per request, so one PyGithub
+        # client (and the repo handles it creates) can be shared by concurrent workers
+        self.gh = Github(args.gh_token, base_url=self.api_url, timeout=self.transport.timeout, per_page=100)
+
+        # Repo handles shared by every for_repo() copy: the organization is resolved once per run and
+        # each repository once per repo
+        self._lock = threading.Lock()
+        self._org = []
+        self._handles = {}
+        # {repo: (contributor count, fetched at)}, refreshed every contributors_refresh seconds
+        self._contributors = {}
+        self.contributors_refresh = args.contributors_refresh * 3600
+        # {'views'|'clones': per-day buckets} of the last traffic queries, private to each for_repo() copy
+        self.traffic = {}
 
         # Command-Line arguments
+        self.token = args.gh_token
         self.repo = args.gh_repos
         self.org_name = args.gh_org
         self.debug = args.debug
 
+    def for_repo(self, repo):
+        """
+        Return a copy of this Maintainer bound to a single repo, so that several repos can be
+        collected concurrently
+        :param repo: repository name
+        :type repo: str
+        """
+        mtr = copy.copy(self)
+        mtr.repo = repo
+        mtr.traffic = {}
+
+        return mtr
+
+    def get_organization(self):
+        """
+        Query to resolve the organization, once per run
+        Calls: GET /orgs/:org
+        Return: github.Organization.Organization
+        """
+        with self._lock:
+            if not self._org:
+                self._org.append(self.gh.get_organization(self.org_name))
+
+        return self._org[0]
+
+    def get_repo_handle(self, lazy=False):
+        """
+        Query to resolve the current repository, once per repo; the handle exposes stargazers_count,
+        forks_count and the traffic endpoints to every metric group
+        Calls: GET /repos/:owner/:repo (none if lazy, until a repository attribute is read)
+        Return: github.Repository.Repository
+        """
+        handle = self._handles.get(self.repo)
+        if handle is None:
+            if lazy:
+                handle = self.gh.get_repo(f"{self.org_name}/{self.repo}", lazy=True)
+            else:
+                handle = self.get_organization().get_repo(self.repo)
+            self._handles[self.repo] = handle
+
+        return handle
+
+    def refresh_repo_handle(self):
+        """
+        Query to bring a repo handle kept between collections up to date (e.g. stargazers_count in --daemon mode);
+        PyGithub revalidates it with its ETag, so an unchanged repository costs a free 304
+        Calls: GET /repos/:owner/:repo
+        Return: True if the repository changed
+        """
+        changed = self.get_repo_handle(lazy=True).update()
+        if self.debug:
+            print("refresh_repo_handle():")
+            print(changed)
+
+        return changed
+
+    def load_repo_handles(self):
+        """
+        Query to build the repo handles of the whole organization from the bulk listing, replacing one
+        request per repo with one request per 100 repos
+        Calls: GET /orgs/:org/repos?per_page=100
+        Return: number of repo handles loaded
+        """
+        for handle in self.get_organization().get_repos():
+            self._handles[handle.name] = handle
+        if self.debug:
+            print("load_repo_handles():")
+            pprint(sorted(self._handles))
+
+        return len(self._handles)
+
+    def get_rate_limit(self):
+        """
+        Query to retrieve current core rate limit stats (not counted against the rate limit)
+        Calls: GET /rate_limit
+        Return: remaining requests, minutes until reset
+        """
+        rate_limit = self.gh.get_rate_limit().core
+        if self.debug:
+            print("get_rate_limit(): ")
+            pprint(rate_limit)
+        time_now = datetime.datetime.utcnow()
+        rate_limit_reset = str(round((rate_limit.reset - time_now).total_seconds()/60))
+
+        return rate_limit.remaining, rate_limit_reset
+
     def get_contributor_count(self, repo):
         """
-        Query to retrieve Total Contributor Count stats
-        Calls: GET /repos/:owner/:repo/contributors
-        Return: github.PaginatedList.PaginatedList of github.NamedUser.NamedUser
+        Query to retrieve Total Contributor Count stats, without paging through the contributor list
+        Calls: GET /repos/:owner/:repo/contributors?per_page=1
+        Return: integer, read from the page number of the Link: rel="last" header
         """
-        contributors_count = repo.get_contributors().totalCount
+        cached = self._contributors.get(self.repo)
+        if cached and time.time() - cached[1] < self.contributors_refresh:
+            return cached[0]
+
+        # NOTE: built from the API base, a lazy repo handle only knows its relative url
+        response = self.transport.request('GET', f"{self.api_url}/repos/{self.org_name}/{self.repo}/contributors",
+                                          params={'per_page': 1},
+                                          headers={'Authorization': f"token {self.token}"})
+        if response.status_code == 204:
+            # Empty repository
+            contributors_count = 0
+        elif response.status_code == 200:
+            last_page = LAST_PAGE_LINK.search(response.headers.get('Link', ''))
+            contributors_count = int(last_page.group(1)) if last_page else len(response.json())
+        else:
+            # e.g. 403 for contributor lists too large to compute, let PyGithub raise or page through them
+            contributors_count = repo.get_contributors().totalCount
+        self._contributors[self.repo] = (contributors_count, time.time())
+
         if self.debug:
             print("get_contributor_count():")
             print(contributors_count)
@@ -40,10 +191,11 @@ class Maintainer(object):
         Calls: GET /repos/:owner/:repo/traffic/clones
         Return: None of list of github.Clone.Clone
         """
-        contents = repo.get_clones_traffic(per="week")
+        contents = repo.get_clones_traffic(per="day")
         if self.debug:
             print("get_clone_count():")
             pprint(contents)
+        self.traffic['clones'] = self.daily_buckets(contents['clones'])
 
         return contents['count'], contents['uniques']
 
@@ -66,13 +218,22 @@ class Maintainer(object):
         Calls: GET /repos/:owner/:repo/traffic/views
         Return: None or list of github.View.View
         """
-        contents = repo.get_views_traffic(per="week")
+        contents = repo.get_views_traffic(per="day")
         if self.debug:
             print("\nget_views_count():")
             pprint(contents)
+        self.traffic['views'] = self.daily_buckets(contents['views'])
 
         return contents['count'], contents['uniques']
 
+    @staticmethod
+    def daily_buckets(buckets):
+        """
+        Per-day traffic buckets as (YYYY-MM-DD, count, uniques), kept in self.traffic for the history store
+        (GitHub only serves the last 14 days)
+        """
+        return [(bucket.timestamp.strftime("%Y-%m-%d"), bucket.count, bucket.uniques) for bucket in buckets]
+
     def get_referrer_count(self, repo):
         """
         Query to get top referrers
@@ -112,8 +273,7 @@ class Maintainer(object):
         - Referring Sites <see maintainer_v3.py>
         - Number of Github Stars ...DONE
         """
-        gh=self.gh
-        repo = gh.get_organization(self.org_name).get_repo(self.repo)
+        repo = self.get_repo_handle()
 
         total_views, unique_views = self.get_views_count(repo)
         total_referrals, unique_referrals = self.get_referrer_count(repo)
@@ -128,8 +288,7 @@ class Maintainer(object):
         - Number of Unique Cloners <see maintainer_v3.py>
         - Number of Forks <see maintainer_v3.py>
         """
-        gh=self.gh
-        repo = gh.get_organization(self.org_name).get_repo(self.repo)
+        repo = self.get_repo_handle()
 
         total_clones, unique_cloners = self.get_clone_count(repo)
         forks_count = self.get_fork_count(repo)
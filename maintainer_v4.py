@@ -1,22 +1,290 @@
+import copy
 import datetime
 import json
+import maintainer_prstate
+import maintainer_querysize
+import maintainer_statistics
+import maintainer_transport
 import requests
-import statistics
 from pprint import pprint
 
+# Multi-repo (aliased) query sizing. The batch size is adjusted after every batch from the
+# rateLimit cost GitHub reports, aiming for MAX_BATCH_COST points per request.
+DEFAULT_BATCH_SIZE = 10
+MAX_BATCH_SIZE = 50
+MAX_BATCH_COST = 10
+# Transport retries of the timeouts and 502/504s of a resizable query: it is retried smaller instead
+ADAPTIVE_TIMEOUT_RETRIES = 0
+
+# Shared sub-selections for the aliased multi-repo query (see get_batch_metrics)
+# timelineItem strings for pullrequest nodes: https://developer.github.com/v4/enum/pullrequesttimelineitemsitemtype/
+REPO_METRICS_FRAGMENTS = """
+    fragment CommitHistory on Commit {
+        history (first:1) {
+            totalCount
+            edges {
+                node {
+                    ... on Commit {
+                        commitUrl
+                        committedDate
+                    }
+                }
+            }
+        }
+    }
+    fragment OpenPullRequests on Repository {
+        openPullRequests: pullRequests(first: $openPrs, states: OPEN) {
+            totalCount
+            pageInfo {
+                endCursor
+                hasNextPage
+            }
+            nodes {
+                ...OpenPullRequestFields
+            }
+        }
+    }
+    fragment IssueCount on Repository {
+        issues(states:OPEN) {
+            totalCount
+        }
+    }
+    fragment PullRequestTimeline on Repository {
+        recentPullRequests: pullRequests(last: $recentPrs) {
+            totalCount
+            nodes {
+                title
+                timelineItems(last: $timelineItems, itemTypes:[REVIEW_REQUESTED_EVENT, READY_FOR_REVIEW_EVENT, REOPENED_EVENT, MERGED_EVENT, REVIEW_DISMISSED_EVENT]) {
+                    nodes {
+                        ... on ReviewRequestedEvent {
+                            __typename
+                            createdAt
+                            requestedReviewer {
+                                ...ReviewerInfo
+                            }
+                        }
+                        ... on ReadyForReviewEvent {
+                            __typename
+                            createdAt
+                        }
+                        ... on MergedEvent {
+                            __typename
+                            createdAt
+                        }
+                        ... on ReopenedEvent {
+                            __typename
+                            createdAt
+                        }
+                        ... on ReviewDismissedEvent {
+                            __typename
+                            createdAt
+                        }
+                    }
+                }
+            }
+        }
+    }
+    fragment ReviewerInfo on RequestedReviewer {
+        ... on User {
+            login
+        }
+    }
+"""
+
+# Stars, forks and contributors, for the GraphQL-only backend (see get_repo_counts). The contributor count is
+# approximated by the users who can be mentioned in the repo (collaborators and, for org repos, members with access)
+REPO_COUNTS_FRAGMENT = """
+    fragment RepoCounts on Repository {
+        stargazers {
+            totalCount
+        }
+        forkCount
+        mentionableUsers {
+            totalCount
+        }
+    }
+"""
+
+# Fields selected for open PR nodes; light mode fetches only what the metrics are computed from
+OPEN_PULL_REQUEST_FIELDS = """
+    fragment OpenPullRequestFields on PullRequest {
+        id
+        createdAt
+        number
+        title
+    }
+"""
+OPEN_PULL_REQUEST_FIELDS_LIGHT = """
+    fragment OpenPullRequestFields on PullRequest {
+        createdAt
+        number
+    }
+"""
+
+# Follow-up pages of the open PR connection (see paginate), page sizes are picked by maintainer_querysize
+OPEN_PULL_REQUESTS_QUERY = """
+    query($owner: String!, $name: String!, $cursor: String, $pageSize: Int!) {
+        rateLimit {
+            cost
+            remaining
+            resetAt
+        }
+        repository(owner: $owner, name: $name) {
+            pullRequests(first: $pageSize, after: $cursor, states: OPEN) {
+                totalCount
+                pageInfo {
+                    endCursor
+                    hasNextPage
+                }
+                nodes {
+                    ...OpenPullRequestFields
+                }
+            }
+        }
+    }
+"""
+
+# Every repository of an organization, most recently pushed first, with the fields that are cheap to
+# fetch in bulk (see enumerate_org_repos)
+ORG_REPOSITORIES_QUERY = """
+    query($owner: String!, $cursor: String, $pageSize: Int!, $isFork: Boolean) {
+        rateLimit {
+            cost
+            remaining
+            resetAt
+        }
+        organization(login: $owner) {
+            repositories(first: $pageSize, after: $cursor, isFork: $isFork, orderBy: {field: PUSHED_AT, direction: DESC}) {
+                totalCount
+                pageInfo {
+                    endCursor
+                    hasNextPage
+                }
+                nodes {
+                    name
+                    isArchived
+                    isFork
+                    visibility
+                    pushedAt
+                    forkCount
+                    stargazers {
+                        totalCount
+                    }
+                    issues(states:OPEN) {
+                        totalCount
+                    }
+                    pullRequests(states:OPEN) {
+                        totalCount
+                    }
+                    repositoryTopics(first: 20) {
+                        nodes {
+                            topic {
+                                name
+                            }
+                        }
+                    }
+                    defaultBranchRef {
+                        target {
+                            ... on Commit {
+                                history (first:1) {
+                                    totalCount
+                                    edges {
+                                        node {
+                                            ... on Commit {
+                                                commitUrl
+                                                committedDate
+                                            }
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+"""
+
+# Every PR, most recently updated first, with its response time events (see get_pr_response_time_incremental)
+PR_RESPONSE_EVENTS_QUERY = """
+    query($owner: String!, $name: String!, $cursor: String, $pageSize: Int!, $timelineItems: Int!) {
+        rateLimit {
+            cost
+            remaining
+            resetAt
+        }
+        repository(owner: $owner, name: $name) {
+            pullRequests(first: $pageSize, after: $cursor, orderBy: {field: UPDATED_AT, direction: DESC}) {
+                totalCount
+                pageInfo {
+                    endCursor
+                    hasNextPage
+                }
+                nodes {
+                    number
+                    updatedAt
+                    timelineItems(last: $timelineItems, itemTypes:[REVIEW_REQUESTED_EVENT, READY_FOR_REVIEW_EVENT, REOPENED_EVENT, MERGED_EVENT, REVIEW_DISMISSED_EVENT]) {
+                        nodes {
+                            __typename
+                            ... on ReviewRequestedEvent {
+                                createdAt
+                            }
+                            ... on ReadyForReviewEvent {
+                                createdAt
+                            }
+                            ... on MergedEvent {
+                                createdAt
+                            }
+                            ... on ReopenedEvent {
+                                createdAt
+                            }
+                            ... on ReviewDismissedEvent {
+                                createdAt
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+"""
+PR_RESPONSE_EVENTS_PAGE_SIZE = 50
+
+
+def pr_timeline_bounds(items):
+    """
+    Start/end createdAt strings of one PR's timeline items, None for a missing event
+    Start events: review requested, reopened, ready for review; end events: merged, review dismissed
+    (whichever is found last, as in Maintainer.parse_pr_response_time)
+    """
+    pr_create, pr_end = None, None
+    for item in items:
+        typename = item['__typename']
+        if typename in ('ReviewRequestedEvent', 'ReopenedEvent', 'ReadyForReviewEvent'):
+            pr_create = item['createdAt']
+        if typename in ('MergedEvent', 'ReviewDismissedEvent'):
+            pr_end = item['createdAt']
+
+    return pr_create, pr_end
+
+
 class Maintainer(object):
     """
     Contains functionality for reporting maintainer stats from target org or repo URL
     """
-    def __init__(self, args):
+    def __init__(self, args, transport=None):
         """
         Initialize the Maintainer (APIv4) class object
         :param args: command line arguments aggregated by argparse
         :type args: obj
+        :param transport: shared pooled HTTP transport (default: a new one built from args)
+        :type transport: maintainer_transport.Transport
         """
 
+        self.transport = transport or maintainer_transport.Transport.from_args(args)
         self.headers = dict(Authorization=f"token {args.gh_token}",)
-        self.base_url = "https://api.github.com/graphql"
+        self.base_url = getattr(args, 'api_url', maintainer_transport.DEFAULT_API_URL).rstrip('/') + "/graphql"
 
         # Command-Line arguments
         self.debug = args.debug
@@ -25,20 +293,104 @@ class Maintainer(object):
         self.token = args.gh_token
         self.branch = args.gh_branch
         self.org = args.gh_org
+        self.batch_size = args.batch_size or DEFAULT_BATCH_SIZE
+        self.open_pr_fields = OPEN_PULL_REQUEST_FIELDS_LIGHT if args.light else OPEN_PULL_REQUEST_FIELDS
+        # 'graphql': stars, forks and contributors are queried here too, the REST client only serves the traffic
+        self.backend = args.backend
+        # (stars, forks, contributors) of the bound repo, shared by the discovery and usage metric groups
+        self.counts = None
+        # Recent PRs sampled for the Average PR Response Time
+        self.recent_prs = args.recent_prs
+        # Page sizes of the nested connections, learned per repo under --state-dir (see maintainer_querysize.py)
+        self.query_sizes = maintainer_querysize.QuerySizes(
+            args.state_dir, dict(recent_prs=min(args.recent_prs, maintainer_querysize.MAX_PAGE_SIZE)))
+        # Incremental PR response times, persisted under --state-dir
+        self.pr_state = maintainer_prstate.PRStateStore(args.state_dir) if args.incremental else None
+        self.pr_aggregates = None
+        # {repo: {open PR number: createdAt}} of every repo whose open PRs were paged through, when set to a dict
+        # (see maintainer_webhook.py); shared by the for_repo() copies
+        self.open_pr_index = None
 
-    def run_query(self, query, vars=None):
+    def for_repo(self, repo):
+        """
+        Return a copy of this Maintainer bound to a single repo, so that several repos can be
+        collected concurrently
+        :param repo: repository name
+        :type repo: str
+        """
+        mtr = copy.copy(self)
+        mtr.repo = repo
+        mtr.counts = None
+        mtr.pr_aggregates = None
+
+        return mtr
+
+    def run_query(self, query, vars=None, timeout_retries=None):
         """
         Establish connection with GitHub and return requested results
         Returns request as json type
+        Raises maintainer_querysize.QueryTooLarge when the query hits a node/resource limit or times out
+        :param timeout_retries: transport retries of timeouts and 502/504s (default: the transport's retries)
+        :type timeout_retries: int
         """
-        # A simple function to use requests.post to make the API call.
+        # POST through the shared keep-alive session, transient failures are retried by the transport.
         # NOTE: the json= section for using variables in the queries
-        request = requests.post(self.base_url, json={'query': query, 'variables': vars}, headers=self.headers)
+        try:
+            request = self.transport.request('POST', self.base_url, json={'query': query, 'variables': vars},
+                                             headers=self.headers, timeout_retries=timeout_retries)
+        except requests.Timeout as err:
+            raise maintainer_querysize.QueryTooLarge(f"Query timed out: {err}") from err
+        if request.status_code in (502, 504):
+            # GitHub answers queries it could not resolve in time with a 502
+            raise maintainer_querysize.QueryTooLarge(f"Query timed out with code {request.status_code}")
         if request.status_code == 200:
-            return request.json()
+            result = request.json()
+            if maintainer_querysize.is_too_large(result):
+                raise maintainer_querysize.QueryTooLarge(f"Query too large: {result['errors']}")
+            # Every query selects rateLimit { cost remaining resetAt }, keep the shared budget live with it
+            rate_limit = (result.get('data') or {}).get('rateLimit')
+            if rate_limit and self.transport.budget:
+                self.transport.budget.update_from_graphql(rate_limit, getattr(request, 'token', None))
+            if rate_limit and self.transport.instruments:
+                self.transport.instruments.graphql_cost(rate_limit.get('cost') or 0)
+            return result
         else:
             raise Exception("Query failed to run by returning code of {}. {}".format(request.status_code, query))
 
+    def run_adaptive(self, shape, query, variables, caps=None):
+        """
+        Run a query whose page sizes are picked for the bound repo by maintainer_querysize: estimated and cut to
+        fit before sending, halved and retried when the query is too large or times out
+        :param shape: name of the query shape in maintainer_querysize.QUERY_SHAPES
+        :type shape: str
+        :param query: query taking the page sizes of the shape as variables
+        :type query: str
+        :param variables: query variables other than the page sizes
+        :type variables: dict
+        :param caps: {knob: upper bound} of the page sizes, e.g. the PRs left to fetch (default: None)
+        :type caps: dict
+        """
+        connections = maintainer_querysize.QUERY_SHAPES[shape]
+        # A timeout is answered with smaller pages right away, not resent as is by the transport
+        timeout_retries = ADAPTIVE_TIMEOUT_RETRIES
+        while True:
+            sizes = self.query_sizes.fit(connections, self.repo, caps=caps)
+            try:
+                return self.run_query(query, dict(variables, **{variable: sizes[knob]
+                                                                for variable, knob in maintainer_querysize.knobs(connections)}),
+                                      timeout_retries=timeout_retries)
+            except maintainer_querysize.QueryTooLarge as err:
+                if not self.query_sizes.shrink(connections, self.repo, sizes):
+                    if timeout_retries is None:
+                        raise
+                    # At the smallest pages, a last try with the transport retries (the timeout may be transient)
+                    timeout_retries = None
+                    continue
+                if self.debug:
+                    print(f"run_adaptive(): {shape} {self.repo} {sizes} failed ({err}), retrying with smaller pages")
+                if self.transport.instruments:
+                    self.transport.instruments.inc('maintainer_graphql_shrinks_total', shape=shape)
+
     def get_rate_limit(self):
         """
         GraphQL query to retrieve current rate limit stats.
@@ -76,14 +428,102 @@ class Maintainer(object):
         - Referring Sites       <see maintainer_v3.py>
         - Number of Github Stars
         """
+        total_stars, _, _ = self.get_repo_counts()
+
+        return total_stars
 
     def get_usage_metrics(self):
         """
         GraphQL query to retrieve:
         - Number of Clones          <see maintainer_v3.py>
         - Number of Unique Cloners  <see maintainer_v3.py>
-        - Number of Forks           <see maintainer_v3.py>
+        - Number of Forks
+        - Total Contributor Count (approximated by mentionableUsers)
+        """
+        _, forks_count, contributor_count = self.get_repo_counts()
+
+        return forks_count, contributor_count
+
+    def get_repo_counts(self):
+        """
+        GraphQL query to retrieve, once per bound repo:
+        - Number of Github Stars
+        - Number of Forks
+        - Total Contributor Count (approximated by mentionableUsers)
+        """
+        if self.counts is not None:
+            return self.counts
+        query = """
+            query($owner: String!, $name: String!) {
+                rateLimit {
+                    cost
+                    remaining
+                    resetAt
+                }
+                repository(owner: $owner, name: $name) {
+                    ...RepoCounts
+                }
+            }
+        """ + REPO_COUNTS_FRAGMENT
+        variables = {
+            "owner": self.org,
+            "name": self.repo
+        }
+
+        # ACQUIRE
+        result = self.run_query(query, variables)
+
+        # EXTRACT
+        if self.debug:
+            print("get_repo_counts():")
+            pprint(result)
+        self.counts = self.parse_repo_counts(result['data']['repository'])
+
+        return self.counts
+
+    def get_contributor_count(self):
+        """
+        GraphQL query to retrieve only the Total Contributor Count (approximated by mentionableUsers), e.g. when the
+        stars and forks are already known from the org enumeration
+        """
+        if self.counts is not None:
+            return self.counts[2]
+        query = """
+            query($owner: String!, $name: String!) {
+                rateLimit {
+                    cost
+                    remaining
+                    resetAt
+                }
+                repository(owner: $owner, name: $name) {
+                    mentionableUsers {
+                        totalCount
+                    }
+                }
+            }
+        """
+        variables = {
+            "owner": self.org,
+            "name": self.repo
+        }
+
+        # ACQUIRE
+        result = self.run_query(query, variables)
+
+        # EXTRACT
+        if self.debug:
+            print("get_contributor_count():")
+            pprint(result)
+
+        return result['data']['repository']['mentionableUsers']['totalCount']
+
+    @staticmethod
+    def parse_repo_counts(repository):
+        """
+        Transform a repository selected with the RepoCounts fragment into (stars, forks, contributors)
         """
+        return (repository['stargazers']['totalCount'], repository['forkCount'],
+                repository['mentionableUsers']['totalCount'])
 
     def get_retention_metrics(self):
         """
@@ -95,6 +535,11 @@ class Maintainer(object):
         if not self.branch:
             query = """
                 query($owner: String!, $name: String!) {
+                    rateLimit {
+                        cost
+                        remaining
+                        resetAt
+                    }
                     repository(owner: $owner, name: $name) {
                         defaultBranchRef { 
                             target {
@@ -123,6 +568,11 @@ class Maintainer(object):
         else: 
             query = """
                 query($owner: String!, $name: String!, $branch: String!) {
+                    rateLimit {
+                        cost
+                        remaining
+                        resetAt
+                    }
                     repository(owner: $owner, name: $name) {
                         object(expression: $branch) {
                             ... on Commit {
@@ -156,13 +606,22 @@ class Maintainer(object):
             pprint(result)
 
         # EXTRACT
-        total_commit_count, committedDate = 0,0
         if not self.branch:
-            total_commit_count = str(result['data']['repository']['defaultBranchRef']['target']['history']['totalCount'])
-            committedDate = str(result['data']['repository']['defaultBranchRef']['target']['history']['edges'][0]['node']['committedDate'])
+            history = result['data']['repository']['defaultBranchRef']['target']['history']
         else: 
-            total_commit_count = str(result['data']['repository']['object']['history']['totalCount'])
-            committedDate = str(result['data']['repository']['object']['history']['edges'][0]['node']['committedDate'])
+            history = result['data']['repository']['object']['history']
+
+        return self.parse_retention_metrics(history)
+
+    def parse_retention_metrics(self, history):
+        """
+        Transform a Commit history connection into the retention metrics
+        :param history: 'history' selection of a Commit (totalCount + first edge)
+        :type history: dict
+        :return: total commit count, days since last commit
+        """
+        total_commit_count = str(history['totalCount'])
+        committedDate = str(history['edges'][0]['node']['committedDate'])
 
         # TRANSFORM
         # parse commit date into datetime object and calculate the diff.
@@ -186,19 +645,21 @@ class Maintainer(object):
         - Average PR Response Time
         """
         query = """
-            query($owner: String!, $name: String!) {
+            query($owner: String!, $name: String!, $pageSize: Int!) {
+                rateLimit {
+                    cost
+                    remaining
+                    resetAt
+                }
                 repository(owner: $owner, name: $name) {
-                    pullRequests(first: 100, states: OPEN) {
+                    pullRequests(first: $pageSize, states: OPEN) {
                         totalCount
                         pageInfo {
                             endCursor
                             hasNextPage
                         }
                         nodes {
-                            id
-                            createdAt
-                            number
-                            title
+                            ...OpenPullRequestFields
                         }
                     }
                     issues(states:OPEN) {
@@ -206,14 +667,14 @@ class Maintainer(object):
                     }
                 }
             }
-        """
+        """ + self.open_pr_fields
         variables = {
             "owner": self.org,
             "name": self.repo
         }
 
         # ACQUIRE
-        result = self.run_query(query, variables)
+        result = self.run_adaptive('open_prs', query, variables)
 
         # EXTRACT
         if self.debug:
@@ -221,15 +682,40 @@ class Maintainer(object):
             pprint(result)
         total_open_issues = result['data']['repository']['issues']['totalCount']
         total_open_pull_reqs = result['data']['repository']['pullRequests']['totalCount']
-        
+        total_average_time_for_pr = self.get_pr_response_time(result['data']['repository']['pullRequests'])
+
+        return total_open_issues, total_open_pull_reqs, total_average_time_for_pr
+
+    def get_pr_response_time(self, open_pull_requests=None):
+        """
+        GraphQL query2 to retrieve:
+        - Average PR Response Time
+        :param open_pull_requests: first page of the open pullRequests connection already fetched
+                                   (default: None, every page is fetched here)
+        :type open_pull_requests: dict
+        """
+        if open_pull_requests is None:
+            open_pull_requests = {'nodes': [], 'pageInfo': {'hasNextPage': True, 'endCursor': None}}
+        open_prs = self.iter_open_prs(open_pull_requests)
+
+        if self.pr_state is not None:
+            # Incremental mode: only PRs updated since the last run are fetched, see get_pr_response_time_incremental()
+            return self.get_pr_response_time_incremental(open_prs)
+
         # Since we now need the data for pullRequest webhooks in the reverse order, we need to query again with different parameters 
         # ERROR: 'message': 'Field \'pullRequests\' has an argument conflict: {first:"100",states:"OPEN"} or {last:"100"}?'}]}
         #
         # timelineItem strings for pullrequest nodes: https://developer.github.com/v4/enum/pullrequesttimelineitemsitemtype/
+        # The --recent-prs sample is paged backwards, page and timeline sizes are picked by run_adaptive()
         query2 = """
-            query($owner: String!, $name: String!) {
+            query($owner: String!, $name: String!, $cursor: String, $pageSize: Int!, $timelineItems: Int!) {
+                rateLimit {
+                    cost
+                    remaining
+                    resetAt
+                }
                 repository(owner: $owner, name: $name) {
-                    pullRequests(last: 5) {
+                    pullRequests(last: $pageSize, before: $cursor) {
                         totalCount
                         pageInfo {
                             startCursor
@@ -237,7 +723,7 @@ class Maintainer(object):
                         }
                         nodes {
                             title
-                            timelineItems(last: 100, itemTypes:[REVIEW_REQUESTED_EVENT, READY_FOR_REVIEW_EVENT, REOPENED_EVENT, MERGED_EVENT, REVIEW_DISMISSED_EVENT]) {
+                            timelineItems(last: $timelineItems, itemTypes:[REVIEW_REQUESTED_EVENT, READY_FOR_REVIEW_EVENT, REOPENED_EVENT, MERGED_EVENT, REVIEW_DISMISSED_EVENT]) {
                             nodes {
                                 ... on ReviewRequestedEvent {
                                     __typename
@@ -280,88 +766,384 @@ class Maintainer(object):
         }
 
         # ACQUIRE
-        result2 = self.run_query(query2, variables2)
+        nodes, total_count, cursor = [], 0, None
+        while len(nodes) < self.recent_prs:
+            result2 = self.run_adaptive('pr_timelines', query2, dict(variables2, cursor=cursor),
+                                        caps={'recent_prs': self.recent_prs - len(nodes)})
+            if self.debug:
+                pprint(result2)
+            pull_requests = result2['data']['repository']['pullRequests']
+            # Pages come newest last, earlier pages go in front to keep the PRs in order
+            nodes = pull_requests['nodes'] + nodes
+            total_count = pull_requests['totalCount']
+            if not pull_requests['pageInfo']['hasPreviousPage']:
+                break
+            cursor = pull_requests['pageInfo']['startCursor']
+
+        return self.parse_pr_response_time(open_prs, {'totalCount': total_count, 'nodes': nodes})
+
+    def get_pr_response_time_incremental(self, open_prs):
+        """
+        GraphQL query to retrieve the Average PR Response Time over every PR in history, incrementally:
+        PRs are fetched most recently updated first and paging stops at the repo watermark (the newest
+        updatedAt stored by the previous run). Each PR's start/end events are persisted in the PR state store,
+        so PRs that have not changed are never fetched again.
+        :param open_prs: open pullRequest nodes (createdAt), their ages are part of the mean as in the full mode
+        :type open_prs: iterable
+        :return: mean response time in days; mean/median/p90/p99 of the stored PRs are kept in self.pr_aggregates
+        """
+        variables = {
+            "owner": self.org,
+            "name": self.repo
+        }
+        watermark = self.pr_state.watermark(self.repo)
+        newest, updated = None, []
+        for node in self.paginate(PR_RESPONSE_EVENTS_QUERY, variables, ('repository', 'pullRequests'),
+                                  shape='pr_events'):
+            if watermark and node['updatedAt'] <= watermark:
+                break
+            newest = newest or node['updatedAt']
+
+            # TRANSFORM
+            pr_create, pr_end = pr_timeline_bounds(node['timelineItems']['nodes'])
+            diff = None
+            if pr_create and pr_end:
+                # divide by 86400 for days, 3600 for hours
+                diff = max(0, (maintainer_statistics.to_epoch(pr_end) - maintainer_statistics.to_epoch(pr_create))/86400)
+            updated.append((node['number'], node['updatedAt'], pr_create, pr_end, diff))
+            if len(updated) >= PR_RESPONSE_EVENTS_PAGE_SIZE:
+                # Persist as pages go by, the watermark only moves once every updated PR is stored
+                self.pr_state.update(self.repo, updated, None)
+                updated = []
+        self.pr_state.update(self.repo, updated, newest)
+
+        # Open PR ages are mixed into the mean, as in parse_pr_response_time()
+        open_ages = maintainer_statistics.ages(open_pr['createdAt'] for open_pr in open_prs)
+        open_summary = maintainer_statistics.summarize(open_ages)
+        total_time, time_count = open_summary['total'], open_summary['count']
+
+        self.pr_aggregates = self.pr_state.aggregates(self.repo)
+        self.pr_aggregates['open_ages'] = maintainer_statistics.age_distribution(open_ages)
         if self.debug:
-            pprint(result2)
-
-        # TRANSFORM 
-        all_nodes = []
-        open_nodes = []
-        all_times = []
-        time_origin = datetime.datetime(1, 1, 1, 0, 0)
-        open_prs = result['data']['repository']['pullRequests']['nodes']
-        pull_requests = result2['data']['repository']['pullRequests']
-        all_nodes.extend(pull_requests['nodes'])
-        pr_create = time_origin
-        pr_end = time_origin
-        
-        if pull_requests['totalCount'] > 0: 
+            print("get_pr_response_time_incremental(): ")
+            pprint(self.pr_aggregates)
+        total_time += self.pr_aggregates['total']
+        time_count += self.pr_aggregates['count']
+
+        return round(total_time / time_count, 2) if time_count else 0
+
+    def paginate(self, query, variables, path, cursor=None, page_size=100, shape=None):
+        """
+        Generator over the nodes of any connection (issues, pullRequests, timelineItems, ...), fetching one page
+        at a time and following pageInfo.endCursor, so only one page is held in memory
+        With a shape, the page sizes are picked by run_adaptive() instead, and a page that is too large is fetched
+        again from the same cursor with smaller pages
+        :param query: query taking $cursor: String and $pageSize: Int!, selecting totalCount, pageInfo
+                      { endCursor hasNextPage } and nodes on the connection
+        :type query: str
+        :param variables: query variables other than cursor/pageSize
+        :type variables: dict
+        :param path: keys from 'data' to the connection, e.g. ('repository', 'pullRequests')
+        :type path: tuple
+        :param cursor: endCursor of the page already fetched, None to start from the first page
+        :type cursor: str
+        :param page_size: nodes per page (GitHub maximum: 100)
+        :type page_size: int
+        :param shape: name of the query shape in maintainer_querysize.QUERY_SHAPES (default: None, fixed page_size)
+        :type shape: str
+        """
+        while True:
+            # ACQUIRE
+            if shape:
+                result = self.run_adaptive(shape, query, dict(variables, cursor=cursor))
+            else:
+                result = self.run_query(query, dict(variables, cursor=cursor, pageSize=page_size))
+            if self.debug:
+                print(f"paginate({'.'.join(path)}, after: {cursor}): ")
+                pprint(result)
+
+            # EXTRACT
+            connection = result['data']
+            for key in path:
+                connection = connection[key]
+            for node in connection['nodes']:
+                yield node
+
+            if not connection['pageInfo']['hasNextPage']:
+                return
+            cursor = connection['pageInfo']['endCursor']
+
+    def iter_open_prs(self, first_page):
+        """
+        Generator over every open PR node: the first page already fetched, then the remaining pages
+        With open_pr_index set, the open PRs of the repo are indexed once every page went by
+        :param first_page: open pullRequests connection (totalCount, pageInfo, nodes)
+        :type first_page: dict
+        """
+        index = {} if self.open_pr_index is not None else None
+        for node in first_page['nodes']:
+            if index is not None:
+                index[node['number']] = node['createdAt']
+            yield node
+        if first_page['pageInfo']['hasNextPage']:
+            variables = {
+                "owner": self.org,
+                "name": self.repo
+            }
+            for node in self.paginate(OPEN_PULL_REQUESTS_QUERY + self.open_pr_fields, variables,
+                                      ('repository', 'pullRequests'), first_page['pageInfo']['endCursor'],
+                                      shape='open_prs'):
+                if index is not None:
+                    index[node['number']] = node['createdAt']
+                yield node
+        if index is not None:
+            self.open_pr_index[self.repo] = index
+
+    def parse_pr_response_time(self, open_prs, pull_requests):
+        """
+        Transform open PR nodes and the recent PR timelines into the Average PR Response Time
+        The open PR createdAt timestamps are gathered as the nodes stream by (page by page) and parsed in bulk
+        :param open_prs: open pullRequest nodes (createdAt)
+        :type open_prs: iterable
+        :param pull_requests: recent pullRequests connection (totalCount + timelineItems nodes)
+        :type pull_requests: dict
+        :return: mean response time in days; mean/median/p90/p99 and the open PR ages are kept in self.pr_aggregates
+        """
+        # TRANSFORM
+        if pull_requests['totalCount'] > 0:
             # Each PR object has a number of Events: https://developer.github.com/v4/object/pullrequest/
-            # Current iteration for this statistic is simply the mean average time between: 
-            #     Supported Pull Request Start Events: 
-            #         PR Review Requested 
+            # Current iteration for this statistic is simply the mean average time between:
+            #     Supported Pull Request Start Events:
+            #         PR Review Requested
             #         PR Marked Ready for Review
             #         PR Reopened
             #      Supported Pull Request End Events:
-            #         PR Merged 
+            #         PR Merged
             #         PR Declined
-            # 
+            #
             # Other supported events can be added in the future, e.g. Issue Comments, Changes Requested or new Commits..
-            # Timeline Nodes will have to be added to query2 in order to have this data 
+            # Timeline Nodes will have to be added to query2 in order to have this data
             # see https://developer.github.com/v4/union/pullrequesttimelineitem/
-        
-            # Parse through currently open PRs
-            for node in range(len(open_prs)):
-                open_pr_start = datetime.datetime.strptime(open_prs[node]['createdAt'], "%Y-%m-%dT%H:%M:%SZ")
-                open_pr_time_now = datetime.datetime.utcnow()
-                open_diff = open_pr_time_now - open_pr_start
-                all_times.append(open_diff.total_seconds()/86400)
-
-            #  For each pull request fetched 
-            for node in range(len(all_nodes)):
-                # For each event in the pull request's timeline items
-                for item in pull_requests['nodes'][node]['timelineItems']['nodes']:
-                    # Filter through each supported Start/End Event condition and assign start/end times
-                    typename = item['__typename']
-                    if typename == 'ReviewRequestedEvent':
-                        # PR was created and review was requested
-                        pr_create = datetime.datetime.strptime(item['createdAt'], "%Y-%m-%dT%H:%M:%SZ")
-                    if typename == 'ReopenedEvent':
-                        # Override the pr_create string if submitter reopens PR 
-                        pr_create = datetime.datetime.strptime(item['createdAt'], "%Y-%m-%dT%H:%M:%SZ")
-                    if typename == 'ReadyForReviewEvent':
-                        # Override both previous cases if submitter marks the PR as ready for review
-                        # (Start the clock!) 
-                        pr_create = datetime.datetime.strptime(item['createdAt'], "%Y-%m-%dT%H:%M:%SZ")
-                    if typename == 'MergedEvent':
-                        pr_end = datetime.datetime.strptime(item['createdAt'], "%Y-%m-%dT%H:%M:%SZ")
-                    if typename == 'ReviewDismissedEvent':
-                        # Override the pr_end string if maintainer dismisses the PR 
-                        pr_end = datetime.datetime.strptime(item['createdAt'], "%Y-%m-%dT%H:%M:%SZ")
+            bounds = []
+            pr_create, pr_end = None, None
+            for node in pull_requests['nodes']:
+                # A PR without a start (or end) event keeps the one of the previous PR
+                start, end = pr_timeline_bounds(node['timelineItems']['nodes'])
+                pr_create, pr_end = start or pr_create, end or pr_end
                 # If PR was not insta-merged, add time diff to the list for mean calculation
-                if time_origin not in (pr_create, pr_end):
-                    # Transform datetime object into a usable format for calculating a mean
-                    # diff time string format: 2019-10-24T03:29:08Z
-                    if 0 == pr_create or 0 == pr_end:
-                        diff = 0
-                    else:
-                        diff = pr_end - pr_create
-
-                        # divide by 86400 for days, 3600 for hours
-                        diff = diff.total_seconds()/86400
-                    if diff >= 0: 
-                        all_times.append(diff)
-                    else: 
-                        all_times.append(0)
-            # And finally calculate the mean PR resolution times from the list. 
+                if pr_create and pr_end:
+                    bounds.append((pr_create, pr_end))
+            # Open PR ages and start/end durations, parsed and reduced in bulk (see maintainer_statistics.py)
+            self.pr_aggregates = maintainer_statistics.pr_latency_stats(open_prs, bounds)
             if self.debug:
-                print(f"all_times: {all_times}")
-            total_average_time_for_pr = round(statistics.mean(all_times), 2)
+                print(f"total_time: {self.pr_aggregates['total']}, time_count: {self.pr_aggregates['count']}")
+            total_average_time_for_pr = self.pr_aggregates['mean']
         else:
             # Handle case for when no pull requests have been opened yet..
-            total_average_time_for_pr = 0 
+            total_average_time_for_pr = 0
 
-        return total_open_issues, total_open_pull_reqs, total_average_time_for_pr
+        return total_average_time_for_pr
+
+    def build_batch_query(self, repos, counts=False):
+        """
+        Build one aliased query (r0, r1, ...) covering the retention and project health
+        selections for every repo in the batch
+        :param repos: repository names in the batch
+        :type repos: list
+        :param counts: also select the stars, forks and contributors (RepoCounts)
+        :type counts: bool
+        :return: query string, variables
+        """
+        # Default page sizes of the nested connections, the batch size keeps the whole query within budget
+        sizes = self.query_sizes.fit(maintainer_querysize.QUERY_SHAPES['batch_repo'])
+        declarations = ["$owner: String!", "$openPrs: Int!", "$recentPrs: Int!", "$timelineItems: Int!"]
+        variables = {"owner": self.org, "openPrs": sizes['open_prs'], "recentPrs": sizes['recent_prs'],
+                     "timelineItems": sizes['timeline_items']}
+        if self.branch:
+            declarations.append("$branch: String!")
+            variables["branch"] = self.branch
+            history = "object(expression: $branch) { ...CommitHistory }"
+        else:
+            history = "defaultBranchRef { target { ...CommitHistory } }"
+
+        aliases = []
+        for idx, repo in enumerate(repos):
+            declarations.append(f"$name{idx}: String!")
+            variables[f"name{idx}"] = repo
+            aliases.append(f"""
+                r{idx}: repository(owner: $owner, name: $name{idx}) {{
+                    {history}
+                    ...OpenPullRequests
+                    ...IssueCount
+                    ...PullRequestTimeline
+                    {"...RepoCounts" if counts else ""}
+                }}""")
+
+        query = """
+            query({0}) {{
+                {1}
+                rateLimit {{
+                    cost
+                    remaining
+                    resetAt
+                }}
+            }}
+            {2}
+        """.format(", ".join(declarations), "".join(aliases),
+                   REPO_METRICS_FRAGMENTS + self.open_pr_fields + (REPO_COUNTS_FRAGMENT if counts else ""))
+
+        return query, variables
+
+    def get_batch_metrics(self, repos, counts=False):
+        """
+        GraphQL multi-repo query to retrieve, for every repo in one request per batch:
+        - Number of commits
+        - Days since last commit
+        - Number of Open Issues
+        - Number of Open Pull Requests
+        - Average PR Response Time
+        - Number of Github Stars, Number of Forks, Total Contributor Count (with counts)
+        The batch size is re-picked after each batch from the reported rateLimit cost, within the estimated
+        node/cost budget of one query; a batch too large to run is split in two and retried.
+        A batch that fails otherwise, or a repo whose results cannot be parsed (e.g. an empty repo or a missing
+        --branch), maps to None and is left to the per-repo collection instead of aborting the prefetch.
+        :param repos: repository names
+        :type repos: list
+        :param counts: also retrieve the stars, forks and contributors (GraphQL-only backend)
+        :type counts: bool
+        :return: dict of {repo: (retention metrics, project health metrics, PR latency aggregates (see
+                 pr_aggregates)[, (stars, forks, contributors)])},
+                 repos GitHub could not resolve map to None, as do the heavy repos left to the adaptive
+                 per-repo queries
+        """
+        results = {}
+        # Repos that needed smaller pages before are queried on their own, with the page sizes they learned
+        shape = maintainer_querysize.QUERY_SHAPES['batch_repo']
+        pending = []
+        for repo in repos:
+            if self.query_sizes.reduced(shape, repo):
+                results[repo] = None
+            else:
+                pending.append(repo)
+        # Largest batch within the query budget
+        capacity = maintainer_querysize.max_copies(shape, self.query_sizes.fit(shape))
+        self.batch_size = min(self.batch_size, capacity)
+        while pending:
+            batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+            query, variables = self.build_batch_query(batch, counts)
+
+            # ACQUIRE
+            try:
+                result = self.run_query(query, variables, timeout_retries=ADAPTIVE_TIMEOUT_RETRIES)
+            except maintainer_querysize.QueryTooLarge as err:
+                if self.debug:
+                    print(f"get_batch_metrics(): batch of {len(batch)} failed ({err})")
+                if self.transport.instruments:
+                    self.transport.instruments.inc('maintainer_graphql_shrinks_total', shape='batch_repo')
+                if len(batch) == 1:
+                    # Too heavy to batch: smaller pages are learned for it, later runs leave it out of the batches
+                    self.query_sizes.shrink(shape, batch[0], self.query_sizes.fit(shape, batch[0]))
+                    results[batch[0]] = None
+                    continue
+                # Split the batch, both halves go back in front of the queue
+                capacity = self.batch_size = len(batch) // 2
+                pending = batch + pending
+                continue
+            except Exception as err:
+                # The per-repo collection retries them, and isolates the failure to the repo that causes it
+                if self.debug:
+                    print(f"get_batch_metrics(): batch of {len(batch)} failed ({err}), left to the per-repo collection")
+                results.update(dict.fromkeys(batch))
+                continue
+            if self.debug:
+                print("get_batch_metrics(): ")
+                pprint(result)
+
+            # EXTRACT
+            data = result.get('data') or {}
+            for idx, repo in enumerate(batch):
+                repository = data.get(f"r{idx}")
+                if not repository:
+                    results[repo] = None
+                    continue
+                # An empty repo has no default branch, a repo without --branch no object
+                if not self.branch:
+                    target = (repository['defaultBranchRef'] or {}).get('target')
+                else:
+                    target = repository['object']
+                history = (target or {}).get('history')
+                if not history or not history['edges']:
+                    results[repo] = None
+                    continue
+                open_pull_requests = repository['openPullRequests']
+
+                # TRANSFORM
+                try:
+                    retention = self.parse_retention_metrics(history)
+                    mtr = self.for_repo(repo)
+                    if self.pr_state is not None:
+                        total_average_time_for_pr = mtr.get_pr_response_time_incremental(
+                            mtr.iter_open_prs(open_pull_requests))
+                    else:
+                        total_average_time_for_pr = mtr.parse_pr_response_time(mtr.iter_open_prs(open_pull_requests),
+                                                                               repository['recentPullRequests'])
+                except Exception as err:
+                    # e.g. a failed follow-up page of this repo, the other repos of the batch are kept
+                    if self.debug:
+                        print(f"get_batch_metrics(): {repo} failed ({err})")
+                    results[repo] = None
+                    continue
+                health = (repository['issues']['totalCount'], open_pull_requests['totalCount'], total_average_time_for_pr)
+                results[repo] = (retention, health, mtr.pr_aggregates)
+                if counts:
+                    results[repo] += (self.parse_repo_counts(repository),)
+
+            # Size the next batch so its cost lands near MAX_BATCH_COST
+            cost = (data.get('rateLimit') or {}).get('cost')
+            if cost:
+                per_repo_cost = cost / len(batch)
+                self.batch_size = max(1, min(MAX_BATCH_SIZE, capacity, int(MAX_BATCH_COST / per_repo_cost)))
+
+        return results
+
+    def enumerate_org_repos(self, include_archived=False, include_forks=False, visibility=None, topics=None,
+                            pushed_since=None):
+        """
+        GraphQL query to enumerate every repository of the organization, 100 per request, together with:
+        - Number of Github Stars
+        - Number of Forks
+        - Number of Open Issues
+        - Number of Open Pull Requests
+        - Number of commits and Days since last commit (default branch, unless --branch is given)
+        :param include_archived: keep archived repos
+        :param include_forks: keep forks
+        :param visibility: keep only repos of this visibility (PUBLIC, PRIVATE, INTERNAL), None for all
+        :param topics: keep only repos with at least one of these topics, None for all
+        :param pushed_since: keep only repos pushed at or after this ISO date (e.g. 2019-10-01), None for all
+        :return: generator of (repo name, dict of pre-collected result fields)
+        """
+        variables = {
+            "owner": self.org,
+            "isFork": None if include_forks else False
+        }
+        for node in self.paginate(ORG_REPOSITORIES_QUERY, variables, ('organization', 'repositories')):
+            # Repos come most recently pushed first, so nothing after this one can match
+            if pushed_since and (node['pushedAt'] or '') < pushed_since:
+                return
+            if node['isArchived'] and not include_archived:
+                continue
+            if visibility and node['visibility'] != visibility.upper():
+                continue
+            if topics and not set(topics) & {item['topic']['name'] for item in node['repositoryTopics']['nodes']}:
+                continue
+
+            # TRANSFORM
+            seed = dict(total_stars=node['stargazers']['totalCount'], forks_count=node['forkCount'],
+                        total_open_issues=node['issues']['totalCount'], total_open_pull_reqs=node['pullRequests']['totalCount'])
+            branch = node['defaultBranchRef']
+            if not self.branch and branch and branch['target']['history']['edges']:
+                seed['commits'], seed['time_since_last'] = self.parse_retention_metrics(branch['target']['history'])
+            yield node['name'], seed
 
     def get_org_velocity_metrics(self):
         """
@@ -0,0 +1,256 @@
+# -*- coding: UTF-8 -*-
+"""
+Push-based incremental metric updates from GitHub webhooks (--webhook)
+
+Instead of polling every repo for every metric, a local HTTP receiver accepts the repository (or organization)
+webhooks, validates their X-Hub-Signature-256 HMAC, and updates the affected metrics of the repo in place:
+
+- star, fork: total stars/forks, read from the repository object of the payload
+- push (to the tracked branch): total commits and days since the last commit
+- issues, pull_request opened/reopened/closed: open issue/PR counts
+- pull_request review_requested/reopened/ready_for_review/closed (merged), pull_request_review dismissed:
+  PR response time start/end events, kept in the PR state store (see maintainer_prstate.py)
+
+Only the signals that changed are streamed to Initial State. The traffic metrics have no webhook and are still
+polled by the daemon scheduler (see maintainer_daemon.py), which shares the results and their lock with the
+receiver and leaves the WEBHOOK_FIELDS to it. Recorded payloads can be replayed against localhost, signed with the
+same secret.
+
+Webhook events and payloads:
+https://developer.github.com/webhooks/event-payloads/
+"""
+import datetime
+import hashlib
+import hmac
+import json
+import threading
+import maintainer_collect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8080
+# pull_request actions starting and ending the PR response time (see maintainer_v4.pr_timeline_bounds)
+PR_START_ACTIONS = ('review_requested', 'reopened', 'ready_for_review')
+# Result fields kept up to date by the webhook events, the daemon polls must not overwrite them
+WEBHOOK_FIELDS = ('total_stars', 'forks_count', 'commits', 'time_since_last', 'total_open_issues',
+                  'total_open_pull_reqs', 'total_average_time_for_pr', 'pr_response_time_median',
+                  'pr_response_time_p90', 'pr_response_time_p99')
+
+
+def verify_signature(secret, body, signature):
+    """
+    True if the X-Hub-Signature-256 header matches the HMAC-SHA256 of the raw body
+    """
+    if not signature or not signature.startswith('sha256='):
+        return False
+    expected = 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def days_since(timestamp):
+    """
+    Days elapsed since an ISO 8601 timestamp with offset (e.g. 2019-05-15T15:20:30-05:00 or ...Z)
+    """
+    when = datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    diff = datetime.datetime.now(datetime.timezone.utc) - when
+    return round(diff.total_seconds()/86400, 2)
+
+
+class WebhookReceiver(object):
+    """
+    Applies webhook events to the latest metrics of every tracked repo and streams the changed signals
+    """
+    def __init__(self, mtr3, mtr4, repo_list, secret, streamer=None, history=None, debug=False):
+        """
+        Initialize the WebhookReceiver class object
+        :param mtr3: Maintainer (APIv3) object, used for the initial collection
+        :type mtr3: obj
+        :param mtr4: Maintainer (APIv4) object in incremental mode (pr_state set)
+        :type mtr4: obj
+        :param repo_list: tracked repository names, events of other repos are ignored
+        :type repo_list: list
+        :param secret: webhook secret the payloads are signed with
+        :type secret: str
+        :param streamer: Initial State streamer the changed signals are logged to (default: None, report only)
+        :type streamer: obj
+        :param history: history store the changed KPIs are appended to (default: None)
+        :type history: maintainer_history.HistoryStore
+        :param debug: print every event
+        :type debug: bool
+        """
+        if not secret:
+            raise ValueError("A webhook secret is required to validate the payload signatures")
+        self.mtr3 = mtr3
+        self.mtr4 = mtr4
+        self.repo_list = list(repo_list)
+        self.secret = secret
+        self.streamer = streamer
+        self.history = history
+        self.debug = debug
+        # Guards the results, also taken by the daemon polling the traffic metrics
+        self.lock = threading.Lock()
+        # {repo: latest result fields}, {repo: {open PR number: createdAt}}
+        self.results = {}
+        # The open PRs are indexed by the collection as it pages through them (see Maintainer.iter_open_prs)
+        self.open_prs = self.mtr4.open_pr_index = {}
+        self.events = 0
+
+    def seed(self, workers=1):
+        """
+        Collect every metric of every tracked repo once, as the baseline the events are applied to
+        """
+        for results in maintainer_collect.collect_repos(self.mtr3, self.mtr4, self.repo_list, workers):
+            with self.lock:
+                self.results[results['repo']] = results
+                self.open_prs.setdefault(results['repo'], {})
+            if self.history is not None:
+                self.history.record(results)
+            if self.streamer is not None:
+                maintainer_collect.stream_results(self.streamer, results)
+
+    def emit(self, repo, changed):
+        """
+        Stream the signals of the changed result fields only and append them to the history
+        """
+        if self.history is not None:
+            self.history.record(dict(changed, repo=repo))
+        if self.streamer is None:
+            return
+        for field, value in changed.items():
+            if field in maintainer_collect.FIELD_SIGNALS:
+                self.streamer.log(repo + maintainer_collect.FIELD_SIGNALS[field], value)
+        self.streamer.flush()
+
+    def pr_response_time(self, repo):
+        """
+        Average PR Response Time from the PR state store and the open PR ages, as in the incremental polling mode
+        """
+        aggregates = self.mtr4.pr_state.aggregates(repo)
+        total_time, time_count = aggregates['total'], aggregates['count']
+        for created_at in self.open_prs[repo].values():
+            total_time += days_since(created_at)
+            time_count += 1
+
+        return round(total_time / time_count, 2) if time_count else 0, aggregates
+
+    def handle(self, event, payload):
+        """
+        Apply one webhook event to the metrics of its repo
+        :param event: X-GitHub-Event header value
+        :type event: str
+        :param payload: parsed JSON payload
+        :type payload: dict
+        :return: dict of the changed result fields, empty if the event changes no tracked metric
+        """
+        repository = payload.get('repository') or {}
+        repo = repository.get('name')
+        if repo not in self.results:
+            return {}
+        action = payload.get('action')
+        changed = {}
+
+        with self.lock:
+            results = self.results[repo]
+            if event == 'star':
+                changed = dict(total_stars=repository['stargazers_count'])
+            elif event == 'fork':
+                changed = dict(forks_count=repository['forks_count'])
+            elif event == 'push':
+                branch = self.mtr4.branch or repository.get('default_branch')
+                if payload.get('ref') == f"refs/heads/{branch}" and payload.get('head_commit'):
+                    if payload.get('forced'):
+                        # History was rewritten, the commit count cannot be derived from the payload
+                        commits, time_since_last = self.mtr4.for_repo(repo).get_retention_metrics()
+                    else:
+                        commits = str(int(results['commits']) + len(payload.get('commits') or []))
+                        time_since_last = days_since(payload['head_commit']['timestamp'])
+                    changed = dict(commits=commits, time_since_last=time_since_last)
+            elif event == 'issues' and action in ('opened', 'reopened', 'closed', 'deleted', 'transferred'):
+                opened = action in ('opened', 'reopened')
+                if opened or action == 'closed' or payload['issue'].get('state') == 'open':
+                    changed = dict(total_open_issues=max(0, results['total_open_issues'] + (1 if opened else -1)))
+            elif event in ('pull_request', 'pull_request_review'):
+                changed = self.handle_pull_request(repo, event, action, payload['pull_request'])
+
+            results.update(changed)
+            self.events += 1
+        if self.debug:
+            print(f"handle(): {event} {action} {repo} {changed}")
+        if changed:
+            self.emit(repo, changed)
+
+        return changed
+
+    def handle_pull_request(self, repo, event, action, pull_request):
+        """
+        Apply a pull_request / pull_request_review event: open PR count and PR response time events
+        (caller holds the lock)
+        """
+        number, updated_at = pull_request['number'], pull_request['updated_at']
+        open_prs = self.open_prs[repo]
+        count_changed = False
+        if event == 'pull_request' and action in ('opened', 'reopened'):
+            count_changed = number not in open_prs
+            open_prs[number] = pull_request['created_at']
+        elif event == 'pull_request' and action == 'closed':
+            count_changed = open_prs.pop(number, None) is not None
+
+        if event == 'pull_request' and action in PR_START_ACTIONS:
+            self.mtr4.pr_state.record_event(repo, number, updated_at, start_at=updated_at)
+        elif event == 'pull_request' and action == 'closed' and pull_request.get('merged_at'):
+            self.mtr4.pr_state.record_event(repo, number, updated_at, end_at=pull_request['merged_at'])
+        elif event == 'pull_request_review' and action == 'dismissed':
+            self.mtr4.pr_state.record_event(repo, number, updated_at, end_at=updated_at)
+        elif not count_changed:
+            return {}
+
+        total_average_time_for_pr, aggregates = self.pr_response_time(repo)
+        changed = dict(total_average_time_for_pr=total_average_time_for_pr)
+        for stat in ('median', 'p90', 'p99'):
+            changed['pr_response_time_' + stat] = aggregates[stat]
+        if count_changed:
+            changed['total_open_pull_reqs'] = len(open_prs)
+
+        return changed
+
+    def serve(self, host='', port=DEFAULT_PORT):
+        """
+        Start the webhook HTTP server in a background thread
+        :return: the server, stopped with shutdown()
+        """
+        receiver = self
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not verify_signature(receiver.secret, body, self.headers.get('X-Hub-Signature-256')):
+                    self.send_error(401, "Invalid signature")
+                    return
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    self.send_error(400, "Invalid JSON payload")
+                    return
+                try:
+                    changed = receiver.handle(self.headers.get('X-GitHub-Event', ''), payload)
+                except Exception as err:
+                    print(f"Webhook {self.headers.get('X-GitHub-Event')} failed: {err!r}", flush=True)
+                    self.send_error(500, "Event processing failed")
+                    return
+                self.send_response(200 if changed else 202)
+                self.end_headers()
+
+            def do_GET(self):
+                # Health check
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(f"{len(receiver.results)} repos, {receiver.events} events\n".encode())
+
+            def log_message(self, format, *args):
+                if receiver.debug:
+                    super().log_message(format, *args)
+
+        server = ThreadingHTTPServer((host, port), WebhookHandler)
+        threading.Thread(target=server.serve_forever, name='webhook-receiver', daemon=True).start()
+        print(f"Webhook receiver listening on {host or '*'}:{server.server_port}", flush=True)
+
+        return server
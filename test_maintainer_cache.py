@@ -0,0 +1,91 @@
+"""
+Unit tests of maintainer_cache.py
+"""
+import time
+import unittest
+from unittest import mock
+import requests
+import maintainer_cache
+import test_support
+
+URL = 'http://github.test/api/v3/repos/org/repo'
+
+
+def response(body=b'{}', headers=None):
+    result = requests.Response()
+    result.status_code = 200
+    result._content = body
+    result.headers.update(headers or {})
+    return result
+
+
+class HttpCacheTest(test_support.StateDirTestCase):
+    def cache(self, max_size_mb=maintainer_cache.DEFAULT_CACHE_SIZE_MB, ttl=None):
+        return self.open_store(maintainer_cache.HttpCache, max_size_mb, ttl)
+
+    def test_parse_ttl(self):
+        self.assertEqual(maintainer_cache.HttpCache.parse_ttl(['/traffic/views=3600', r'/repos/[^/]+/x=y=5']),
+                         {'/traffic/views': 3600.0, r'/repos/[^/]+/x=y': 5.0})
+        self.assertEqual(maintainer_cache.HttpCache.parse_ttl(None), {})
+
+    def test_key(self):
+        key = maintainer_cache.HttpCache.key
+        self.assertEqual(key(URL, {'a': 1, 'b': 2}, 'token x'), key(URL, {'b': 2, 'a': 1}, 'token x'))
+        # Every token has its own entries
+        self.assertNotEqual(key(URL, None, 'token x'), key(URL, None, 'token y'))
+        self.assertNotIn('token x', key(URL, None, 'token x'))
+
+    def test_stored_with_validators(self):
+        cache = self.cache()
+        cache.put('plain', URL, response())
+        self.assertIsNone(cache.get('plain'))
+        cache.put('etag', URL, response(b'{"a": 1}', {'ETag': '"v1"', 'Content-Encoding': 'gzip'}))
+        entry = cache.get('etag')
+        self.assertEqual((entry['etag'], entry['body']), ('"v1"', b'{"a": 1}'))
+        # The stored body is already decoded
+        self.assertNotIn('Content-Encoding', entry['headers'])
+        self.assertFalse(cache.is_fresh(entry))
+        self.assertEqual(cache.to_response(entry).json(), {'a': 1})
+
+    def test_ttl_override(self):
+        cache = self.cache(ttl={maintainer_cache.CONTRIBUTORS_URL: 60})
+        self.assertEqual(cache.ttl_for(URL + '/contributors'), 60)
+        self.assertIsNone(cache.ttl_for(URL + '/contributors/x'))
+        # Kept without validators, served without revalidation until the TTL expires
+        cache.put('contributors', URL + '/contributors', response())
+        entry = cache.get('contributors')
+        self.assertTrue(cache.is_fresh(entry))
+        with mock.patch.object(maintainer_cache.time, 'time', return_value=time.time() + 61):
+            self.assertFalse(cache.is_fresh(entry))
+            # A revalidation restarts the TTL
+            cache.refresh('contributors')
+            self.assertTrue(cache.is_fresh(cache.get('contributors')))
+
+    def test_lru_eviction(self):
+        # Room for two bodies of 400KB
+        cache = self.cache(max_size_mb=1)
+        body = b'x' * 400 * 1024
+        for key in ('a', 'b'):
+            cache.put(key, URL + '/' + key, response(body, {'ETag': key}))
+            time.sleep(0.01)
+        # 'a' is read, 'b' becomes the least recently used
+        cache.get('a')
+        cache.put('c', URL + '/c', response(body, {'ETag': 'c'}))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_not_modified(self):
+        cache = self.cache()
+        cache.put('etag', URL, response(b'{"a": 1}', {'ETag': '"v1"', 'Last-Modified': 'Wed, 01 Jan 2020 00:00:00 GMT'}))
+        entry = cache.get('etag')
+        self.assertTrue(cache.is_current(entry, {'If-None-Match': '"v1"'}))
+        self.assertFalse(cache.is_current(entry, {'If-None-Match': '"v0"'}))
+        self.assertFalse(cache.is_current(entry, {}))
+        not_modified = cache.to_response(entry, not_modified=True)
+        self.assertEqual((not_modified.status_code, not_modified.content), (304, b''))
+        self.assertEqual(not_modified.headers['ETag'], '"v1"')
+
+
+if __name__ == '__main__':
+    unittest.main()
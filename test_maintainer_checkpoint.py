@@ -0,0 +1,92 @@
+"""
+Unit tests of maintainer_checkpoint.py
+"""
+import json
+import os
+import tempfile
+import unittest
+import maintainer_checkpoint
+
+
+def results(repo):
+    return dict(repo=repo, total_stars=1)
+
+
+def resumed(state_dir):
+    """
+    Entries a --resume run of 'org' starts from
+    """
+    journal = maintainer_checkpoint.Journal(state_dir, 'org', resume=True)
+    journal.close()
+    return journal.entries
+
+
+class JournalTest(unittest.TestCase):
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            journal = maintainer_checkpoint.Journal(state_dir, 'org')
+            journal.done(results('a'))
+            journal.failed('b', ValueError('boom'))
+            journal.done(results('b'))
+            journal.failed('c', ValueError('boom'))
+            journal.close()
+            other = maintainer_checkpoint.Journal(state_dir, 'other', resume=True)
+            other.done(results('d'))
+            other.close()
+
+            # The latest entry of each repo wins, entries of other organizations are ignored
+            entries = resumed(state_dir)
+            self.assertEqual({repo: entry['status'] for repo, entry in entries.items()},
+                             dict(a='done', b='done', c='failed'))
+            self.assertEqual(entries['c']['error'], "ValueError('boom')")
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            journal = maintainer_checkpoint.Journal(state_dir, 'org')
+            journal.done(results('a'))
+            journal.failed('b', ValueError('boom'))
+            # The run dies here, the file is closed without a completion record
+            journal.journal.close()
+            journal = maintainer_checkpoint.Journal(state_dir, 'org', resume=True)
+            self.assertEqual(journal.completed(), dict(a=results('a')))
+            journal.done(results('b'))
+            journal.close()
+            self.assertEqual({repo: entry['status'] for repo, entry in resumed(state_dir).items()}, dict(a='done', b='done'))
+            # Without --resume, the journal is started over
+            journal = maintainer_checkpoint.Journal(state_dir, 'org')
+            journal.close()
+            self.assertEqual(os.path.getsize(journal.path), 0)
+
+    def test_torn_line_repaired(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            journal = maintainer_checkpoint.Journal(state_dir, 'org')
+            journal.done(results('a'))
+            journal.close()
+            with open(journal.path, 'a', encoding='utf-8') as torn:
+                torn.write(json.dumps(dict(org='org', repo='b', status='done', results=results('b')))[:20])
+
+            journal = maintainer_checkpoint.Journal(state_dir, 'org', resume=True)
+            self.assertEqual(list(journal.completed()), ['a'])
+            journal.done(results('c'))
+            journal.close()
+            # The next entry starts on its own line, after the torn one
+            with open(journal.path, encoding='utf-8') as lines:
+                self.assertEqual(len(lines.readlines()), 3)
+            self.assertEqual(sorted(resumed(state_dir)), ['a', 'c'])
+
+    def test_finished_run_not_resumed(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            journal = maintainer_checkpoint.Journal(state_dir, 'org')
+            journal.done(results('a'))
+            journal.close(complete=True)
+            journal = maintainer_checkpoint.Journal(state_dir, 'org', resume=True)
+            self.assertEqual(journal.completed(), {})
+            # Entries after the completion record belong to the next run
+            journal.done(results('b'))
+            journal.failed('c', ValueError('boom'))
+            journal.close(complete=False)
+            self.assertEqual({repo: entry['status'] for repo, entry in resumed(state_dir).items()}, dict(b='done', c='failed'))
+
+
+if __name__ == '__main__':
+    unittest.main()
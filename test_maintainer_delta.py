@@ -0,0 +1,139 @@
+"""
+Unit tests of maintainer_delta.py
+"""
+import time
+import unittest
+from unittest import mock
+import maintainer_delta
+import maintainer_emitter
+import test_support
+
+
+class RecordingStreamer(object):
+    """
+    Streamer keeping the logged signals
+    """
+    def __init__(self):
+        self.logged = []
+        self.closed = False
+
+    def log(self, key, value, epoch=None):
+        self.logged.append((key, value))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class StubTransport(object):
+    """
+    Transport answering every request with the same status code
+    """
+    instruments = None
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def request(self, method, url, **kwargs):
+        return mock.Mock(status_code=self.status_code, text='')
+
+
+class DeltaFilterTest(test_support.StateDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = self.open_store(maintainer_delta.LastSentStore)
+
+    def delta(self, heartbeat_hours=maintainer_delta.DEFAULT_HEARTBEAT_HOURS):
+        return maintainer_delta.DeltaFilter(RecordingStreamer(), self.store, 'bucket', heartbeat_hours)
+
+    def test_digest(self):
+        self.assertEqual(maintainer_delta.digest({'a': 1, 'b': 2}), maintainer_delta.digest({'b': 2, 'a': 1}))
+        self.assertNotEqual(maintainer_delta.digest(1), maintainer_delta.digest('1'))
+
+    def test_only_changes_are_forwarded(self):
+        delta = self.delta()
+        for value in (1, 1, 2, 2):
+            delta.log('repo_total_stars', value)
+        delta.log('repo_total_forks', 1)
+        self.assertEqual(delta.streamer.logged, [('repo_total_stars', 1), ('repo_total_stars', 2), ('repo_total_forks', 1)])
+        self.assertEqual((delta.forwarded, delta.suppressed), (3, 2))
+
+    def test_last_sent_kept_between_runs(self):
+        delta = self.delta()
+        delta.log('repo_total_stars', 1)
+        with mock.patch('builtins.print'):
+            delta.close()
+        self.assertTrue(delta.streamer.closed)
+        delta = self.delta()
+        delta.log('repo_total_stars', 1)
+        delta.log('repo_total_stars', 3)
+        self.assertEqual(delta.streamer.logged, [('repo_total_stars', 3)])
+        # Other buckets have their own last-sent values
+        other = maintainer_delta.DeltaFilter(RecordingStreamer(), self.store, 'other')
+        other.log('repo_total_stars', 1)
+        self.assertEqual(other.streamer.logged, [('repo_total_stars', 1)])
+
+    def test_heartbeat(self):
+        delta = self.delta(heartbeat_hours=1)
+        delta.log('repo_total_stars', 1)
+        later = time.time() + 3601
+        with mock.patch.object(maintainer_delta.time, 'time', return_value=later):
+            delta.log('repo_total_stars', 1)
+        self.assertEqual(len(delta.streamer.logged), 2)
+
+    def test_no_heartbeat(self):
+        delta = self.delta(heartbeat_hours=0)
+        delta.log('repo_total_stars', 1)
+        with mock.patch.object(maintainer_delta.time, 'time', return_value=time.time() + 365 * 86400):
+            delta.log('repo_total_stars', 1)
+        self.assertEqual(len(delta.streamer.logged), 1)
+
+    def emitter_delta(self, status_code):
+        emitter = maintainer_emitter.Emitter('bucket', 'bucket', 'key', linger=0, transport=StubTransport(status_code))
+        return maintainer_delta.DeltaFilter(emitter, self.store, 'bucket')
+
+    def test_committed_on_delivery(self):
+        delta = self.emitter_delta(200)
+        delta.log('repo_total_stars', 1)
+        with mock.patch('builtins.print'):
+            delta.close()
+        self.assertEqual(delta.streamer.sent, 1)
+        delta = self.emitter_delta(200)
+        delta.log('repo_total_stars', 1)
+        self.assertEqual(delta.suppressed, 1)
+        with mock.patch('builtins.print'):
+            delta.close()
+
+    def test_failed_delivery_sent_again(self):
+        delta = self.emitter_delta(500)
+        delta.log('repo_total_stars', 1)
+        with mock.patch('builtins.print'):
+            delta.close()
+        self.assertEqual(delta.streamer.sent, 0)
+        self.assertEqual(self.store.load('bucket'), {})
+        # Not suppressed until the heartbeat: the next run sends it again
+        delta = self.emitter_delta(200)
+        delta.log('repo_total_stars', 1)
+        with mock.patch('builtins.print'):
+            delta.close()
+        self.assertEqual((delta.forwarded, delta.streamer.sent), (1, 1))
+
+    def test_pending_value_not_resent(self):
+        streamer = RecordingStreamer()
+        streamer.on_delivery = None
+        delta = maintainer_delta.DeltaFilter(streamer, self.store, 'bucket')
+        delta.log('repo_total_stars', 1)
+        delta.log('repo_total_stars', 1)
+        self.assertEqual(len(delta.streamer.logged), 1)
+        # A dropped value is forgotten, a delivered one is kept
+        delta.delivered([dict(key='repo_total_stars', value=1, epoch=1.0)], False)
+        delta.log('repo_total_stars', 1)
+        delta.delivered([dict(key='repo_total_stars', value=1, epoch=2.0)], True)
+        self.assertEqual(len(delta.streamer.logged), 2)
+        self.assertEqual(list(delta.last_sent), ['repo_total_stars'])
+
+
+if __name__ == '__main__':
+    unittest.main()
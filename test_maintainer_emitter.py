@@ -0,0 +1,122 @@
+"""
+Unit tests of maintainer_emitter.py, against a fake Initial State sender
+"""
+import threading
+import unittest
+from unittest import mock
+import maintainer_emitter
+import maintainer_spool
+import maintainer_transport
+import test_support
+
+
+class FakeTransport(object):
+    """
+    Transport keeping the event batches it is sent, failing the first failures requests to /events
+    """
+    instruments = None
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+        self.buckets = 0
+        self.received = threading.Event()
+
+    def request(self, method, url, headers=None, json=None):
+        if url.endswith('/buckets'):
+            self.buckets += 1
+            return mock.Mock(status_code=201, text='')
+        if self.failures:
+            self.failures -= 1
+            return mock.Mock(status_code=502, text='Bad Gateway')
+        self.batches.append(json)
+        self.received.set()
+        return mock.Mock(status_code=204, text='')
+
+
+def events(count):
+    return [(f"repo_signal_{idx}", idx) for idx in range(count)]
+
+
+class EmitterTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('builtins.print')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def emitter(self, transport, **kwargs):
+        return maintainer_emitter.Emitter('bucket', 'bucket', 'key', transport=transport, **kwargs)
+
+    def test_batches(self):
+        transport = FakeTransport()
+        emitter = self.emitter(transport, batch_size=3, linger=60)
+        for key, value in events(7):
+            emitter.log(key, value, epoch=1.0)
+        emitter.close()
+        # Full batches go right away, the last one is flushed by close() without lingering
+        self.assertEqual([len(batch) for batch in transport.batches], [3, 3, 1])
+        self.assertEqual(transport.batches[0][0], dict(key='repo_signal_0', value=0, epoch=1.0))
+        self.assertEqual((emitter.sent, emitter.failed, transport.buckets), (7, 0, 1))
+        self.assertFalse(emitter.thread.is_alive())
+
+    def test_linger(self):
+        transport = FakeTransport()
+        emitter = self.emitter(transport, batch_size=100, linger=0.05)
+        emitter.log('repo_total_stars', 1)
+        # Sent once it lingered, before close()
+        self.assertTrue(transport.received.wait(5))
+        self.assertEqual(transport.batches, [[dict(key='repo_total_stars', value=1, epoch=mock.ANY)]])
+        emitter.close()
+
+    def test_dropped_batch_counted_once(self):
+        transport = FakeTransport(failures=1)
+        emitter = self.emitter(transport, batch_size=2, linger=60)
+        delivered = []
+        emitter.on_delivery = lambda batch, ok: delivered.append((len(batch), ok))
+        for key, value in events(3):
+            emitter.log(key, value)
+        emitter.close()
+        self.assertEqual((emitter.sent, emitter.failed, len(emitter.failures)), (1, 2, 1))
+        self.assertEqual(delivered, [(2, False), (1, True)])
+        self.assertIn('2 failed', emitter.report())
+
+
+class SpooledEmitterTest(test_support.StateDirTestCase):
+    def setUp(self):
+        super().setUp()
+        for patcher in (mock.patch('builtins.print'),
+                        mock.patch.object(maintainer_transport.Transport, 'backoff', return_value=0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.spool = self.open_store(maintainer_spool.EventSpool)
+
+    def emitter(self, transport, **kwargs):
+        return maintainer_emitter.SpooledEmitter('bucket', 'bucket', 'key', self.spool, transport=transport, **kwargs)
+
+    def test_retried_batch_not_counted_as_failed(self):
+        transport = FakeTransport(failures=3)
+        emitter = self.emitter(transport, batch_size=10, linger=60)
+        for key, value in events(4):
+            emitter.log(key, value)
+        emitter.close()
+        self.assertEqual((emitter.sent, emitter.failed, len(emitter.failures)), (4, 0, 3))
+        self.assertEqual(self.spool.count('bucket'), 0)
+
+    def test_backlog_left_to_the_next_run(self):
+        transport = FakeTransport(failures=10 ** 6)
+        emitter = self.emitter(transport, batch_size=10, linger=0, drain_timeout=0.1)
+        for key, value in events(4):
+            emitter.log(key, value)
+        emitter.close()
+        self.assertEqual((emitter.sent, emitter.failed), (0, 0))
+        self.assertIn('4 events left in the spool', emitter.report())
+        # Replayed by the next run, oldest first
+        transport = FakeTransport()
+        emitter = self.emitter(transport, batch_size=10, linger=60)
+        emitter.close()
+        self.assertEqual([event['key'] for event in transport.batches[0]], [key for key, _ in events(4)])
+        self.assertEqual(emitter.replayed, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+Unit tests of maintainer_history.py
+"""
+import unittest
+import maintainer_history
+import test_support
+
+DAY = 86400
+JAN_1 = maintainer_history.to_epoch('2020-01-01')
+
+
+class HistoryStoreTest(test_support.StateDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = self.open_store(maintainer_history.HistoryStore)
+
+    def test_to_epoch(self):
+        self.assertEqual(maintainer_history.to_epoch('1970-01-02'), DAY)
+        self.assertIsNone(maintainer_history.to_epoch(None))
+
+    def test_overlapping_days_replace(self):
+        self.store.record(dict(repo='repo', views_daily=[('2020-01-01', 5, 2), ('2020-01-02', 1, 1)]))
+        # The next run sees yesterday again, with today's bucket still growing
+        self.store.record(dict(repo='repo', views_daily=[('2020-01-02', 7, 3), ('2020-01-03', 2, 1)]))
+        self.assertEqual(self.store.query('repo', 'views'),
+                         [('2020-01-01', 5, 2), ('2020-01-02', 7, 3), ('2020-01-03', 2, 1)])
+        self.assertEqual(self.store.query('repo', 'views', '2020-01-02', '2020-01-02'), [('2020-01-02', 7, 3)])
+        self.assertEqual(self.store.query('repo', 'clones'), [])
+
+    def test_kpis(self):
+        self.store.record(dict(repo='repo', total_stars=10, commits='42', time_since_last=None, total_views='n/a'),
+                          collected_at=JAN_1 + 3600)
+        self.store.record(dict(repo='repo', total_stars=11), collected_at=JAN_1 + DAY + 3600)
+        self.assertEqual(self.store.query('repo', 'total_stars'), [(JAN_1 + 3600, 10), (JAN_1 + DAY + 3600, 11)])
+        # Commits are reported as strings, non numeric and missing values are skipped
+        self.assertEqual(self.store.query('repo', 'commits'), [(JAN_1 + 3600, 42)])
+        self.assertEqual(self.store.query('repo', 'time_since_last'), [])
+        self.assertEqual(self.store.query('repo', 'total_views'), [])
+        # Both bounds are inclusive days
+        self.assertEqual(self.store.query('repo', 'total_stars', '2020-01-02', '2020-01-02'), [(JAN_1 + DAY + 3600, 11)])
+
+    def test_rolling_daily_sum(self):
+        days = [(f"2020-01-0{day}", day, 1) for day in range(1, 6)]
+        self.store.record(dict(repo='repo', clones_daily=days))
+        self.assertEqual(self.store.rolling('repo', 'clones', 2),
+                         [('2020-01-01', 1), ('2020-01-02', 3), ('2020-01-03', 5), ('2020-01-04', 7), ('2020-01-05', 9)])
+        # Windows at the start of the range include the days before it
+        self.assertEqual(self.store.rolling('repo', 'clones', 2, start='2020-01-04'), [('2020-01-04', 7), ('2020-01-05', 9)])
+
+    def test_rolling_kpi_average(self):
+        for offset, stars in ((12 * 3600, 10), (DAY + 12 * 3600, 20), (DAY + 18 * 3600, 30)):
+            self.store.record(dict(repo='repo', total_stars=stars), collected_at=JAN_1 + offset)
+        self.assertEqual(self.store.rolling('repo', 'total_stars', 1), [('2020-01-01', 10), ('2020-01-02', 25)])
+        self.assertEqual(self.store.rolling('repo', 'total_stars', 2), [('2020-01-01', 10), ('2020-01-02', 20)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Unit tests of maintainer_instrument.py
+"""
+import json
+import os
+import tempfile
+import unittest
+import maintainer_instrument
+
+
+class EndpointTest(unittest.TestCase):
+    def test_endpoint_of(self):
+        self.assertEqual(maintainer_instrument.endpoint_of('https://api.github.com/repos/org/repo/traffic/views?per=day'),
+                         '/repos/:owner/:repo/traffic/views')
+        self.assertEqual(maintainer_instrument.endpoint_of('https://api.github.com/orgs/org/repos'), '/orgs/:org/repos')
+        self.assertEqual(maintainer_instrument.endpoint_of('https://api.github.com/graphql'), '/graphql')
+
+
+class HistogramTest(unittest.TestCase):
+    def test_observe(self):
+        histogram = maintainer_instrument.Histogram(buckets=(1, 2, 5))
+        for value in (0.5, 1, 1.5, 4, 9):
+            histogram.observe(value)
+        # Bucket upper bounds are inclusive, the last bucket is +Inf
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual((histogram.count, histogram.sum, histogram.max), (5, 16, 9))
+
+    def test_quantile(self):
+        histogram = maintainer_instrument.Histogram(buckets=(1, 2, 5))
+        self.assertEqual(histogram.quantile(0.5), 0.0)
+        for value in (0.5, 0.6, 1.5, 3, 9):
+            histogram.observe(value)
+        self.assertEqual(histogram.quantile(0.4), 1)
+        self.assertEqual(histogram.quantile(0.6), 2)
+        # The +Inf bucket reports the maximum
+        self.assertEqual(histogram.quantile(0.99), 9)
+
+    def test_quantile_capped_at_max(self):
+        histogram = maintainer_instrument.Histogram(buckets=(1, 10))
+        histogram.observe(3)
+        self.assertEqual(histogram.quantile(0.5), 3)
+
+
+class InstrumentsTest(unittest.TestCase):
+    def test_counters_by_label(self):
+        instruments = maintainer_instrument.Instruments()
+        instruments.inc('requests', client='github', status=200)
+        instruments.inc('requests', 2, status=200, client='github')
+        instruments.inc('requests', client='github', status=502)
+        self.assertEqual(instruments.counter_value('requests'), 4)
+        self.assertEqual(instruments.counter_value('requests', status=200), 3)
+        self.assertEqual(instruments.counter_value('requests', status=404), 0)
+
+    def test_requests_attributed_to_repo(self):
+        instruments = maintainer_instrument.Instruments()
+        instruments.request('github', 'https://api.github.com/graphql', 200, 0.1, 10, 100)
+        with instruments.collecting('repo', 'health'):
+            instruments.request('github', 'https://api.github.com/graphql', 200, 0.2, 10, 300)
+            instruments.graphql_cost(2)
+        instruments.request('initialstate', 'https://groker.init.st/api/events', 204, 0.1, 50, 0)
+        repos = instruments.summary()['repos']
+        self.assertEqual(repos[maintainer_instrument.NO_REPO]['requests'], 1)
+        self.assertEqual((repos['repo']['requests'], repos['repo']['bytes'], repos['repo']['graphql_cost']), (1, 300, 2))
+        self.assertIn('health', repos['repo']['seconds'])
+        self.assertEqual(instruments.counter_value('maintainer_http_requests_total', client='initialstate'), 1)
+
+    def test_phases_accumulate(self):
+        instruments = maintainer_instrument.Instruments()
+        for _ in range(2):
+            with instruments.phase('collect'):
+                pass
+        self.assertEqual(list(instruments.phases), ['collect'])
+        self.assertEqual(list(instruments.timed(iter([1, 2]), 'stream')), [1, 2])
+        self.assertIn('stream', instruments.phases)
+
+    def test_prometheus(self):
+        instruments = maintainer_instrument.Instruments()
+        instruments.inc('maintainer_graphql_shrinks_total', shape='open "prs"')
+        instruments.set('maintainer_rate_limit_remaining', 42, resource='graphql')
+        instruments.observe('maintainer_collect_seconds', 0.02, group='health')
+        lines = instruments.prometheus().splitlines()
+        self.assertIn('# TYPE maintainer_graphql_shrinks_total counter', lines)
+        self.assertIn('maintainer_graphql_shrinks_total{shape="open \\"prs\\""} 1', lines)
+        self.assertIn('maintainer_rate_limit_remaining{resource="graphql"} 42', lines)
+        self.assertIn('maintainer_collect_seconds_bucket{group="health",le="0.01"} 0', lines)
+        self.assertIn('maintainer_collect_seconds_bucket{group="health",le="+Inf"} 1', lines)
+        self.assertIn('maintainer_collect_seconds_count{group="health"} 1', lines)
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            json_path, prometheus_path = os.path.join(state_dir, 'run.json'), os.path.join(state_dir, 'run.prom')
+            instruments = maintainer_instrument.Instruments(json_path, prometheus_path)
+            instruments.inc('maintainer_repos_total', result='collected')
+            instruments.stop_export()
+            with open(json_path) as summary:
+                counters = json.load(summary)['counters']
+            self.assertEqual(counters['maintainer_repos_total'], [dict(labels=dict(result='collected'), value=1)])
+            with open(prometheus_path) as textfile:
+                self.assertIn('maintainer_repos_total{result="collected"} 1\n', textfile.read())
+            self.assertEqual(sorted(os.listdir(state_dir)), ['run.json', 'run.prom'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Unit tests of maintainer_output.py
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import maintainer_collect
+import maintainer_output
+
+RESULTS = dict(repo='repo', total_stars=5, commits='42', referrers={'google.com': 3}, views_daily=[('2020-01-01', 5, 2)])
+
+
+class SinkTest(unittest.TestCase):
+    def test_ndjson(self):
+        output = io.StringIO()
+        sink = maintainer_output.NdjsonSink(output, owned=False)
+        sink.write(RESULTS)
+        sink.write(dict(repo='other'))
+        sink.close()
+        lines = output.getvalue().splitlines()
+        self.assertEqual(json.loads(lines[0]), dict(RESULTS, views_daily=[['2020-01-01', 5, 2]]))
+        self.assertEqual(json.loads(lines[1]), dict(repo='other'))
+        # Std out is only flushed
+        self.assertFalse(output.closed)
+
+    def test_csv(self):
+        output = io.StringIO(newline='')
+        sink = maintainer_output.CsvSink(output, owned=False)
+        sink.write(RESULTS)
+        rows = list(csv.DictReader(io.StringIO(output.getvalue(), newline='')))
+        self.assertEqual(list(rows[0]), list(maintainer_output.CSV_FIELDS))
+        self.assertEqual((rows[0]['repo'], rows[0]['total_stars'], rows[0]['commits']), ('repo', '5', '42'))
+        # Nested values are JSON encoded, fields the run did not collect are left empty
+        self.assertEqual(json.loads(rows[0]['views_daily']), [['2020-01-01', 5, 2]])
+        self.assertEqual(rows[0]['total_views'], '')
+        self.assertNotIn('referrers', rows[0])
+
+    def test_open_sink(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = os.path.join(output_dir, 'results.csv')
+            sink = maintainer_output.open_sink('csv', path)
+            self.assertIsInstance(sink, maintainer_output.CsvSink)
+            sink.write(RESULTS)
+            sink.close()
+            self.assertTrue(sink.output.closed)
+            with open(path, newline='') as output:
+                self.assertEqual(len(list(csv.reader(output))), 2)
+        with mock.patch.object(maintainer_output.sys, 'stdout', io.StringIO()) as stdout:
+            sink = maintainer_output.open_sink('ndjson', '-')
+            sink.write(RESULTS)
+            sink.close()
+            self.assertIsInstance(sink, maintainer_output.NdjsonSink)
+            self.assertFalse(stdout.closed)
+            self.assertEqual(json.loads(stdout.getvalue())['repo'], 'repo')
+
+
+class ReportRowsTest(unittest.TestCase):
+    def test_every_repo_in_order(self):
+        report = maintainer_output.ReportRows()
+        for stars in (3, 1, 2):
+            report.add(dict(repo=f"repo-{stars}", total_stars=stars))
+        self.assertEqual([row[0] for row in report.report_data()], ['repo-3', 'repo-1', 'repo-2'])
+        self.assertEqual(len(report.report_data()[0]), len(maintainer_collect.REPORT_FIELDS))
+
+    def test_top(self):
+        report = maintainer_output.ReportRows(top=3, field='commits')
+        for repo, commits in (('a', '10'), ('b', 'n/a'), ('c', '300'), ('d', '25'), ('e', None), ('f', '25'),
+                              ('g', '7')):
+            report.add(dict(repo=repo, commits=commits))
+        # Highest first, numeric order of the string counts, the earliest repo wins a tie
+        self.assertEqual([row[0] for row in report.report_data()], ['c', 'd', 'f'])
+        self.assertEqual(len(report.rows), 3)
+
+    def test_top_keeps_missing_values_last(self):
+        report = maintainer_output.ReportRows(top=2)
+        report.add(dict(repo='a'))
+        report.add(dict(repo='b', total_stars=0))
+        report.add(dict(repo='c'))
+        self.assertEqual([row[0] for row in report.report_data()], ['b', 'a'])
+        self.assertEqual(maintainer_output.sort_key('1.5'), 1.5)
+        self.assertEqual(maintainer_output.sort_key(None), float('-inf'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Unit tests of maintainer_querysize.py
+"""
+import tempfile
+import time
+import unittest
+from unittest import mock
+import maintainer_querysize
+
+SHAPES = maintainer_querysize.QUERY_SHAPES
+
+
+class EstimateTest(unittest.TestCase):
+    def test_count_nested(self):
+        sizes = dict(open_prs=100, recent_prs=5, timeline_items=100)
+        # 100 open PRs, 5 recent PRs and 100 timeline items of each: 3 connections, 5 of them nested
+        self.assertEqual(maintainer_querysize.count(SHAPES['batch_repo'], sizes), (605, 7))
+
+    def test_estimate(self):
+        sizes = dict(pr_events=100, timeline_items=100)
+        self.assertEqual(maintainer_querysize.estimate(SHAPES['pr_events'], sizes), (10100, 2))
+        self.assertEqual(maintainer_querysize.estimate(SHAPES['open_prs'], dict(open_prs=10), copies=3), (30, 1))
+
+    def test_max_copies(self):
+        sizes = dict(open_prs=100, recent_prs=5, timeline_items=100)
+        self.assertEqual(maintainer_querysize.max_copies(SHAPES['batch_repo'], sizes),
+                         maintainer_querysize.MAX_QUERY_NODES // 605)
+        self.assertEqual(maintainer_querysize.max_copies(SHAPES['pr_events'], dict(pr_events=100, timeline_items=1000)), 1)
+
+    def test_is_too_large(self):
+        self.assertTrue(maintainer_querysize.is_too_large({'errors': [{'type': 'MAX_NODE_LIMIT_EXCEEDED'}]}))
+        self.assertTrue(maintainer_querysize.is_too_large({'errors': [{'message': 'Something went wrong: Timeout'}]}))
+        self.assertFalse(maintainer_querysize.is_too_large({'errors': [{'type': 'NOT_FOUND', 'message': 'No repo'}]}))
+        self.assertFalse(maintainer_querysize.is_too_large({'data': {}}))
+
+
+class QuerySizesTest(unittest.TestCase):
+    def test_defaults(self):
+        sizes = maintainer_querysize.QuerySizes(defaults=dict(recent_prs=20))
+        self.assertEqual(sizes.fit(SHAPES['batch_repo']), dict(open_prs=100, recent_prs=20, timeline_items=100))
+        self.assertEqual(sizes.fit(SHAPES['pr_timelines'], 'repo', caps=dict(recent_prs=3)),
+                         dict(recent_prs=3, timeline_items=100))
+
+    def test_fit_cuts_outermost_first(self):
+        sizes = maintainer_querysize.QuerySizes()
+        with mock.patch.object(maintainer_querysize, 'MAX_QUERY_NODES', 1000):
+            self.assertEqual(sizes.fit(SHAPES['pr_events']), dict(pr_events=6, timeline_items=100))
+        with mock.patch.object(maintainer_querysize, 'MAX_QUERY_NODES', 100):
+            # pr_events stops at its minimum, then the timelines are cut
+            self.assertEqual(sizes.fit(SHAPES['pr_events']), dict(pr_events=5, timeline_items=12))
+
+    def test_shrink(self):
+        sizes = maintainer_querysize.QuerySizes()
+        shape = SHAPES['batch_repo']
+        self.assertFalse(sizes.reduced(shape, 'heavy'))
+        self.assertTrue(sizes.shrink(shape, 'heavy', sizes.fit(shape, 'heavy')))
+        self.assertEqual(sizes.fit(shape, 'heavy'), dict(open_prs=50, recent_prs=5, timeline_items=100))
+        self.assertTrue(sizes.reduced(shape, 'heavy'))
+        self.assertFalse(sizes.reduced(shape, 'light'))
+        # Learned sizes only apply to their repo and knob
+        self.assertEqual(sizes.fit(SHAPES['pr_events'], 'heavy'), dict(pr_events=100, timeline_items=100))
+
+    def test_shrink_at_minimum(self):
+        sizes = maintainer_querysize.QuerySizes()
+        minimum = dict(open_prs=maintainer_querysize.MIN_SIZES['open_prs'])
+        self.assertFalse(sizes.shrink(SHAPES['open_prs'], 'repo', minimum))
+
+    def test_learned_sizes_persist(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            sizes = maintainer_querysize.QuerySizes(state_dir)
+            sizes.shrink(SHAPES['pr_events'], 'heavy', dict(pr_events=100, timeline_items=100))
+            sizes.db.close()
+            sizes = maintainer_querysize.QuerySizes(state_dir)
+            self.assertEqual(sizes.size('heavy', 'pr_events'), 50)
+            sizes.db.close()
+
+    def test_learned_sizes_expire(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            sizes = maintainer_querysize.QuerySizes(state_dir)
+            learned_at = time.time() - (maintainer_querysize.RELEARN_AFTER_DAYS + 1) * 86400
+            with mock.patch.object(maintainer_querysize.time, 'time', return_value=learned_at):
+                sizes.shrink(SHAPES['pr_events'], 'heavy', dict(pr_events=100, timeline_items=100))
+            sizes.db.close()
+            sizes = maintainer_querysize.QuerySizes(state_dir)
+            self.assertEqual(sizes.size('heavy', 'pr_events'), 100)
+            sizes.db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+"""
+Unit tests of maintainer_ratelimit.py
+"""
+import unittest
+from unittest import mock
+import maintainer_ratelimit
+
+NOW = 1577836800
+HOUR = 3600
+
+
+def headers(remaining, reset, limit=5000, resource='core'):
+    return {'X-RateLimit-Remaining': str(remaining), 'X-RateLimit-Reset': str(reset), 'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Resource': resource}
+
+
+class Clock(object):
+    """
+    time.time() stand-in, moved forward by time.sleep()
+    """
+    def __init__(self, now=NOW):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class ClockTestCase(unittest.TestCase):
+    """
+    Test case run on a Clock, with the waiting messages silenced
+    """
+    def setUp(self):
+        self.clock = Clock()
+        for name in ('time', 'sleep'):
+            patcher = mock.patch.object(maintainer_ratelimit.time, name, getattr(self.clock, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('builtins.print')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class RateLimitBudgetTest(ClockTestCase):
+    def test_out_of_order_headers(self):
+        budget = maintainer_ratelimit.RateLimitBudget()
+        budget.update_from_headers(headers(4000, NOW + HOUR))
+        # A response sent earlier but answered later does not raise the remaining count of the window
+        budget.update_from_headers(headers(4100, NOW + HOUR))
+        self.assertEqual(budget.remaining('core'), 4000)
+        budget.update_from_headers(headers(3900, NOW + HOUR))
+        self.assertEqual(budget.remaining('core'), 3900)
+        # A later reset is a new window
+        budget.update_from_headers(headers(4999, NOW + 2 * HOUR))
+        self.assertEqual(budget.remaining('core'), 4999)
+        budget.update_from_headers(headers(10, NOW + HOUR))
+        self.assertEqual(budget.remaining('core'), 10)
+        self.assertEqual(budget.spent, {'core': 5})
+        # Responses without rate limit headers are ignored
+        budget.update_from_headers({})
+        self.assertEqual(budget.spent, {'core': 5})
+
+    def test_graphql(self):
+        budget = maintainer_ratelimit.RateLimitBudget()
+        budget.update_from_graphql({'cost': 3, 'remaining': 4990, 'resetAt': '2020-01-01T01:00:00Z'})
+        self.assertEqual(budget.remaining('graphql'), 4990)
+        self.assertEqual(budget.reset_minutes('graphql'), '60')
+        self.assertEqual(budget.spent, {'graphql': 3})
+        # APIv4 responses carry headers too, their spending is counted from the query cost
+        budget.update_from_headers(headers(4989, NOW + HOUR, resource='graphql'))
+        self.assertEqual(budget.spent, {'graphql': 3})
+
+    def test_reserve(self):
+        budget = maintainer_ratelimit.RateLimitBudget(reserve=50)
+        # Nothing reported yet, nothing to wait for
+        self.assertIsNone(budget.acquire('core'))
+        budget.update_from_headers(headers(55, NOW + HOUR))
+        for _ in range(5):
+            budget.acquire('core')
+        self.assertEqual((budget.remaining('core'), self.clock.slept), (50, []))
+        # The reserve is never spent: the next request waits for the reset window
+        budget.acquire('core')
+        self.assertEqual(self.clock.slept, [HOUR + maintainer_ratelimit.RESET_MARGIN])
+
+    def test_reset_window_rollover(self):
+        budget = maintainer_ratelimit.RateLimitBudget(reserve=50)
+        budget.update_from_headers(headers(10, NOW + HOUR))
+        self.clock.now += HOUR + maintainer_ratelimit.RESET_MARGIN
+        # The window has reset without a response reporting it, spending starts again from the limit
+        budget.acquire('core', cost=2)
+        self.assertEqual(budget.remaining('core'), 4998)
+        self.assertEqual(self.clock.slept, [])
+        self.assertEqual(budget.reset_minutes('core'), '60')
+
+    def test_project(self):
+        budget = maintainer_ratelimit.RateLimitBudget(reserve=50)
+        self.assertEqual(budget.project({'core': 100}), {})
+        budget.update_from_headers(headers(200, NOW + HOUR))
+        self.assertEqual(budget.project({'core': 100, 'graphql': 10}), {'core': (100, 200, True)})
+        self.assertEqual(budget.project({'core': 151}), {'core': (151, 200, False)})
+
+
+class TokenPoolTest(ClockTestCase):
+    def test_token_with_most_headroom(self):
+        pool = maintainer_ratelimit.TokenPool(['a', 'b', 'c', 'a'], reserve=50)
+        self.assertEqual(pool.tokens, ['a', 'b', 'c'])
+        pool.update_from_headers(headers(1000, NOW + HOUR), 'a')
+        pool.update_from_headers(headers(3000, NOW + HOUR), 'b')
+        # Tokens GitHub has not reported yet go first
+        self.assertEqual(pool.acquire('core'), 'c')
+        pool.update_from_headers(headers(2000, NOW + HOUR), 'c')
+        self.assertEqual([pool.acquire('core') for _ in range(2)], ['b', 'b'])
+        self.assertEqual(pool.remaining('core'), 1000 + 2998 + 2000)
+        # Responses of unknown tokens are ignored
+        pool.update_from_headers(headers(0, NOW + HOUR), 'other')
+        self.assertEqual(pool.remaining('core'), 5998)
+
+    def test_failover_when_every_token_is_exhausted(self):
+        pool = maintainer_ratelimit.TokenPool(['a', 'b'], reserve=50)
+        pool.update_from_headers(headers(50, NOW + 2 * HOUR), 'a')
+        pool.update_from_headers(headers(50, NOW + HOUR), 'b')
+        self.assertFalse(pool.has_headroom('core'))
+        # The token whose window resets first is waited for
+        self.assertEqual(pool.acquire('core'), 'b')
+        self.assertEqual(self.clock.slept, [HOUR + maintainer_ratelimit.RESET_MARGIN])
+        self.assertTrue(pool.has_headroom('core'))
+        self.assertEqual(pool.reset_minutes('core'), '60')
+
+    def test_window_reset_counts_as_headroom(self):
+        pool = maintainer_ratelimit.TokenPool(['a', 'b'], reserve=50)
+        pool.update_from_headers(headers(50, NOW + HOUR), 'a')
+        pool.update_from_headers(headers(100, NOW + 2 * HOUR), 'b')
+        self.assertEqual(pool.headroom('a', 'core'), 0)
+        self.clock.now += HOUR + maintainer_ratelimit.RESET_MARGIN
+        self.assertEqual(pool.headroom('a', 'core'), 5000 - 50)
+        self.assertEqual(pool.acquire('core'), 'a')
+
+    def test_graphql_and_spent(self):
+        pool = maintainer_ratelimit.TokenPool(['a', 'b'])
+        pool.update_from_graphql({'cost': 2, 'remaining': 4000, 'resetAt': '2020-01-01T01:00:00Z'}, 'a')
+        pool.update_from_graphql({'cost': 3, 'remaining': 3000, 'resetAt': '2020-01-01T01:00:00Z'}, 'b')
+        pool.update_from_headers(headers(4000, NOW + HOUR), 'a')
+        self.assertEqual(pool.remaining('graphql'), 7000)
+        self.assertEqual(pool.spent, {'graphql': 5, 'core': 1})
+
+    def test_project_unreported_tokens(self):
+        pool = maintainer_ratelimit.TokenPool(['a', 'b', 'c'], reserve=50)
+        self.assertEqual(pool.project({'core': 100}), {})
+        pool.update_from_headers(headers(1000, NOW + HOUR, limit=5000), 'a')
+        # The unreported tokens are counted at the limit of the reported one
+        self.assertEqual(pool.project({'core': 10000}), {'core': (10000, 11000, True)})
+        self.assertEqual(pool.project({'core': 10900}), {'core': (10900, 11000, False)})
+
+
+if __name__ == '__main__':
+    unittest.main()
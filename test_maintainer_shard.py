@@ -0,0 +1,60 @@
+"""
+Unit tests of maintainer_shard.py
+"""
+import os
+import tempfile
+import unittest
+import maintainer_shard
+
+REPOS = [f"repo-{idx:05d}" for idx in range(200)]
+
+
+class PartitionTest(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(maintainer_shard.parse_shard('0/4'), (0, 4))
+        self.assertEqual(maintainer_shard.parse_shard('3/4'), (3, 4))
+        for value in ('4/4', '-1/4', '1'):
+            with self.assertRaises(ValueError):
+                maintainer_shard.parse_shard(value)
+
+    def test_shard_of_is_stable(self):
+        # CRC32, the same on every host, run and Python version
+        self.assertEqual(maintainer_shard.shard_of('repo-00001', 4), 2)
+        self.assertEqual(maintainer_shard.shard_of('repo-00001', 1), 0)
+
+    def test_partition_covers_every_repo_once(self):
+        shards = [maintainer_shard.partition(REPOS, index, 4) for index in range(4)]
+        self.assertEqual(sorted(repo for shard in shards for repo in shard), REPOS)
+        self.assertTrue(all(shards))
+        # Repo list order is kept within a shard
+        self.assertTrue(all(shard == sorted(shard) for shard in shards))
+
+
+class ClaimDirTest(unittest.TestCase):
+    def test_claim_once(self):
+        with tempfile.TemporaryDirectory() as claim_dir:
+            first, second = maintainer_shard.ClaimDir(claim_dir), maintainer_shard.ClaimDir(claim_dir)
+            self.assertTrue(first.claim('org/repo with spaces'))
+            self.assertFalse(second.claim('org/repo with spaces'))
+            self.assertTrue(second.claim('other'))
+            self.assertEqual(len(os.listdir(claim_dir)), 2)
+
+
+class ShardOutputTest(unittest.TestCase):
+    def test_read_results(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            paths = [os.path.join(output_dir, f"shard-{index}.ndjson") for index in range(2)]
+            writer = maintainer_shard.ShardWriter(paths[0])
+            writer.write(dict(repo='b', total_stars=1))
+            writer.write(dict(repo='a', total_stars=2))
+            writer.close()
+            writer = maintainer_shard.ShardWriter(paths[1])
+            # A repo collected again (e.g. after a --resume) keeps its last line
+            writer.write(dict(repo='b', total_stars=3))
+            writer.close()
+            self.assertEqual(maintainer_shard.read_results(paths),
+                             [dict(repo='a', total_stars=2), dict(repo='b', total_stars=3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+"""
+Unit tests of maintainer_spool.py
+"""
+import unittest
+import maintainer_spool
+import test_support
+
+EVENTS = [dict(key='repo_total_stars', value=5, epoch=1.5), dict(key='repo_referrers', value={'google': 3}, epoch=2.5),
+          dict(key='repo_time_elapsed_commits', value=0.25, epoch=3.5)]
+
+
+class EventSpoolTest(test_support.StateDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.spool = self.open_store(maintainer_spool.EventSpool)
+
+    def test_peek_oldest_first(self):
+        self.spool.append('bucket', EVENTS)
+        self.spool.append('other', EVENTS[:1])
+        peeked = self.spool.peek('bucket', 2)
+        self.assertEqual([event for _, event in peeked], EVENTS[:2])
+        # Peeking does not remove anything
+        self.assertEqual(self.spool.count('bucket'), 3)
+        self.assertEqual(self.spool.count('other'), 1)
+
+    def test_delete_delivered(self):
+        self.spool.append('bucket', EVENTS)
+        self.spool.delete([row_id for row_id, _ in self.spool.peek('bucket', 2)])
+        self.assertEqual([event for _, event in self.spool.peek('bucket', 10)], EVENTS[2:])
+        self.assertEqual(self.spool.count('missing'), 0)
+
+    def test_survives_reopen(self):
+        self.spool.append('bucket', EVENTS)
+        self.spool.db.close()
+        self.spool = self.open_store(maintainer_spool.EventSpool)
+        # Undelivered events keep their epoch, a replay overwrites the same data points
+        self.assertEqual([event for _, event in self.spool.peek('bucket', 10)], EVENTS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+Unit tests of maintainer_statistics.py, both with NumPy (when installed) and with the standard library path
+"""
+import unittest
+from unittest import mock
+import maintainer_statistics
+
+DAY = 86400
+NOW = maintainer_statistics.to_epoch('2020-01-31T00:00:00Z')
+OPEN_PRS = ['2020-01-30T12:00:00Z', {'createdAt': '2020-01-21T00:00:00Z'}, '2019-01-01T00:00:00Z']
+BOUNDS = [('2020-01-01T00:00:00Z', '2020-01-03T00:00:00Z'), ('2020-01-05T00:00:00Z', '2020-01-05T06:00:00Z'),
+          ('2020-01-10T00:00:00Z', '2020-01-09T00:00:00Z')]
+
+
+class StandardLibraryTest(unittest.TestCase):
+    """
+    Statistics computed without NumPy
+    """
+    def setUp(self):
+        patcher = mock.patch.object(maintainer_statistics, 'numpy', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_timestamps(self):
+        epochs = maintainer_statistics.parse_timestamps(['1970-01-02T00:00:00Z', '2019-10-24T03:29:08Z'])
+        self.assertEqual(list(epochs), [DAY, 1571887748])
+
+    def test_ages(self):
+        ages = maintainer_statistics.ages(['2020-01-30T00:00:00Z', '2020-01-30T12:00:00Z'], now=NOW)
+        self.assertEqual(list(ages), [1, 0.5])
+
+    def test_durations_clamped_at_zero(self):
+        self.assertEqual(list(maintainer_statistics.durations(BOUNDS)), [2, 0.25, 0])
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(maintainer_statistics.percentile(values, 90), 90)
+        self.assertEqual(maintainer_statistics.percentile(values, 99), 99)
+        self.assertEqual(maintainer_statistics.percentile([5], 99), 5)
+        self.assertEqual(maintainer_statistics.percentile([], 50), 0)
+
+    def test_summarize(self):
+        self.assertEqual(maintainer_statistics.summarize([3, 1, 2, 10]),
+                         dict(count=4, total=16, mean=4, median=2.5, p90=10, p99=10))
+        self.assertEqual(maintainer_statistics.summarize([]), dict(count=0, total=0, mean=0, median=0, p90=0, p99=0))
+
+    def test_age_distribution(self):
+        self.assertEqual(maintainer_statistics.age_distribution([0.5, 1, 6.9, 7, 400]),
+                         {'<1d': 1, '1-7d': 2, '7-30d': 1, '30-90d': 0, '90-365d': 0, '>365d': 1})
+
+    def test_pr_latency_stats(self):
+        stats = maintainer_statistics.pr_latency_stats(OPEN_PRS, BOUNDS, now=NOW)
+        # Open PR ages 0.5, 10 and 395 days mixed with the 2, 0.25 and 0 day durations
+        self.assertEqual(stats['count'], 6)
+        self.assertEqual(stats['mean'], round((0.5 + 10 + 395 + 2 + 0.25) / 6, 2))
+        self.assertEqual(stats['median'], 1.25)
+        self.assertEqual(stats['p90'], 395)
+        self.assertEqual(stats['open_ages'], {'<1d': 1, '1-7d': 0, '7-30d': 1, '30-90d': 0, '90-365d': 0, '>365d': 1})
+
+    def test_pr_latency_stats_empty(self):
+        stats = maintainer_statistics.pr_latency_stats(now=NOW)
+        self.assertEqual(stats['count'], 0)
+        self.assertEqual(sum(stats['open_ages'].values()), 0)
+
+
+@unittest.skipIf(maintainer_statistics.numpy is None, "NumPy is not installed")
+class BackendAgreementTest(unittest.TestCase):
+    """
+    The NumPy and the standard library paths return the same values
+    """
+    def both(self, func, *args, **kwargs):
+        with_numpy = func(*args, **kwargs)
+        with mock.patch.object(maintainer_statistics, 'numpy', None):
+            without_numpy = func(*args, **kwargs)
+        return with_numpy, without_numpy
+
+    def test_parse_timestamps(self):
+        with_numpy, without_numpy = self.both(maintainer_statistics.parse_timestamps, [OPEN_PRS[0], OPEN_PRS[2]])
+        self.assertEqual(list(with_numpy), list(without_numpy))
+
+    def test_pr_latency_stats(self):
+        with_numpy, without_numpy = self.both(maintainer_statistics.pr_latency_stats, OPEN_PRS, BOUNDS, now=NOW)
+        self.assertEqual(with_numpy, without_numpy)
+
+    def test_age_distribution(self):
+        with_numpy, without_numpy = self.both(maintainer_statistics.age_distribution, [0, 1, 7, 29.9, 30, 365, 1000])
+        self.assertEqual(with_numpy, without_numpy)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+Unit tests of maintainer_transport.py, against a stubbed HTTP session
+"""
+import json
+import tempfile
+import time
+import unittest
+from unittest import mock
+import requests
+import maintainer_cache
+import maintainer_ratelimit
+import maintainer_transport
+
+URL = 'http://github.test/api/v3/repos/org/repo'
+
+
+def response(status=200, body=None, headers=None):
+    """
+    requests.Response with a JSON body
+    """
+    result = requests.Response()
+    result.status_code = status
+    result._content = json.dumps(body).encode() if body is not None else b''
+    result.headers.update(headers or {})
+    result.encoding = 'utf-8'
+    return result
+
+
+class TransportTest(unittest.TestCase):
+    def setUp(self):
+        # Answers of the stubbed session in order, and the (method, url, headers) of every request sent
+        self.answers = []
+        self.sent = []
+        sleep = mock.patch.object(maintainer_transport.time, 'sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def transport(self, **kwargs):
+        transport = maintainer_transport.Transport(**kwargs)
+        transport.session.request = self.serve
+        return transport
+
+    def serve(self, method, url, **kwargs):
+        self.sent.append((method, url, kwargs.get('headers') or {}))
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def test_server_error_retried(self):
+        self.answers = [response(500), response(503), response(body={'name': 'repo'})]
+        result = self.transport().request('GET', URL)
+        self.assertEqual((result.status_code, result.json()), (200, {'name': 'repo'}))
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_retry_after(self):
+        self.answers = [response(403, {'message': 'You have exceeded a secondary rate limit'}, {'Retry-After': '7'}),
+                        response()]
+        self.assertEqual(self.transport().request('GET', URL).status_code, 200)
+        self.sleep.assert_called_once_with(7.0)
+
+    def test_retry_after_date_and_reset(self):
+        retry_at = time.time() + 30
+        self.assertAlmostEqual(maintainer_transport.Transport.retry_after(
+            response(429, headers={'Retry-After': time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(retry_at))})),
+            30, delta=2)
+        reset = response(403, headers={'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(retry_at))})
+        self.assertTrue(maintainer_transport.Transport.is_retryable(reset))
+        self.assertAlmostEqual(maintainer_transport.Transport.retry_after(reset), 30 + maintainer_ratelimit.RESET_MARGIN,
+                               delta=2)
+
+    def test_forbidden_not_retried(self):
+        self.answers = [response(403, {'message': 'Resource not accessible by integration'}), response(404)]
+        self.assertEqual(self.transport().request('GET', URL).status_code, 403)
+        self.assertEqual(self.transport().request('GET', URL).status_code, 404)
+        self.sleep.assert_not_called()
+
+    def test_gives_up(self):
+        self.answers = [response(502)] * 3
+        self.assertEqual(self.transport(retries=2).request('GET', URL).status_code, 502)
+        self.assertEqual((len(self.sent), self.sleep.call_count), (3, 2))
+        # Connection errors are re-raised once the retries are exhausted
+        self.answers = [requests.ConnectionError('reset by peer')] * 3
+        with self.assertRaises(requests.ConnectionError):
+            self.transport(retries=2).request('GET', URL)
+        self.assertEqual(len(self.sent), 6)
+
+    def test_backoff(self):
+        for attempt in range(10):
+            self.assertLessEqual(maintainer_transport.Transport.backoff(attempt),
+                                 min(maintainer_transport.BACKOFF_MAX, maintainer_transport.BACKOFF_BASE * 2 ** attempt))
+
+    def test_conditional_get(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = maintainer_cache.HttpCache(cache_dir)
+            self.addCleanup(cache.db.close)
+            transport = self.transport(cache=cache)
+            self.answers = [response(body={'stargazers_count': 1}, headers={'ETag': '"v1"'}), response(304)]
+            self.assertEqual(transport.request('GET', URL).json(), {'stargazers_count': 1})
+            # Revalidated with the stored ETag, the 304 is answered with the stored body
+            result = transport.request('GET', URL)
+            self.assertEqual(self.sent[1][2]['If-None-Match'], '"v1"')
+            self.assertEqual((result.status_code, result.json()), (200, {'stargazers_count': 1}))
+            # Other methods are not cached
+            self.answers = [response(201)]
+            self.assertEqual(transport.request('POST', URL).status_code, 201)
+            self.assertNotIn('If-None-Match', self.sent[2][2])
+
+    def test_fresh_entry_not_modified(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = maintainer_cache.HttpCache(cache_dir, ttl={'/repos/': 60})
+            self.addCleanup(cache.db.close)
+            transport = self.transport(cache=cache)
+            self.answers = [response(body={'stargazers_count': 1}, headers={'ETag': '"v1"'})]
+            transport.request('GET', URL)
+            # Served from disk: the body for a caller without it, a 304 for one that holds the same version
+            self.assertEqual(transport.request('GET', URL).json(), {'stargazers_count': 1})
+            self.assertEqual(transport.request('GET', URL, headers={'If-None-Match': '"v1"'}).status_code, 304)
+            self.assertEqual(transport.request('GET', URL, headers={'If-None-Match': '"v0"'}).status_code, 200)
+            self.assertEqual(len(self.sent), 1)
+
+    def test_token_override(self):
+        pool = maintainer_ratelimit.TokenPool(['first', 'second'], reserve=0)
+        transport = self.transport(budget=pool)
+        exhausted = {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(time.time()) + 3600),
+                     'X-RateLimit-Limit': '5000'}
+        self.answers = [response(403, headers=exhausted), response(headers=dict(exhausted, **{'X-RateLimit-Remaining': '99'}))]
+        result = transport.request('GET', URL, headers={'Authorization': 'token own'})
+        # The pool's tokens replace the client's, an exhausted token fails over to the next one right away
+        self.assertEqual([headers['Authorization'] for _, _, headers in self.sent], ['token first', 'token second'])
+        self.assertEqual(result.token, 'second')
+        self.sleep.assert_called_once_with(0)
+        self.assertEqual(pool.remaining('core'), 99)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Unit tests of maintainer_v3.py, against a stubbed HTTP session
+"""
+import argparse
+import json
+import unittest
+from urllib.parse import urlparse
+import requests
+import maintainer_cache
+import maintainer_collect
+import maintainer_transport
+import maintainer_v3
+import test_support
+
+API_URL = 'http://github.test/api/v3'
+CLONES = {'count': 7, 'uniques': 3, 'clones': [{'timestamp': '2020-01-01T00:00:00Z', 'count': 7, 'uniques': 3}]}
+
+
+def response(status=200, body=None, headers=None):
+    """
+    requests.Response with a JSON body
+    """
+    result = requests.Response()
+    result.status_code = status
+    result._content = json.dumps(body).encode() if body is not None else b''
+    result.headers.update(headers or {})
+    result.encoding = 'utf-8'
+    return result
+
+
+class LazyHandleTest(unittest.TestCase):
+    def setUp(self):
+        self.requested = []
+        transport = maintainer_transport.Transport(retries=0)
+        transport.session.request = self.serve
+        args = argparse.Namespace(gh_token='token', gh_repos=None, gh_org='org', debug=False, contributors_refresh=0,
+                                  api_url=API_URL + '/')
+        self.mtr3 = maintainer_v3.Maintainer(args, transport)
+
+    def serve(self, method, url, **kwargs):
+        # PyGithub spells out the port
+        self.requested.append(url.replace(':80/', '/'))
+        path = urlparse(url).path
+        if path.endswith('/traffic/clones'):
+            return response(body=CLONES)
+        if path.endswith('/contributors'):
+            return response(body=[{'login': 'octocat'}],
+                            headers={'Link': f'<{url}?per_page=1&page=42>; rel="last"'})
+        return response(404, {'message': 'Not Found'})
+
+    def test_collect_usage_through_lazy_handle(self):
+        mtr4 = argparse.Namespace(backend='mixed', for_repo=lambda repo: mtr4)
+        collector = maintainer_collect.RepoCollector(self.mtr3, mtr4, 'repo', seed=dict(forks_count=5))
+        results = collector.collect_usage()
+        self.assertEqual((results['total_clones'], results['unique_cloners'], results['forks_count'],
+                          results['contributor_count']), (7, 3, 5, 42))
+        self.assertEqual(results['clones_daily'], [('2020-01-01', 7, 3)])
+        # The repository itself is never fetched, every URL is absolute
+        self.assertEqual([url.split('?')[0] for url in self.requested],
+                         [f"{API_URL}/repos/org/repo/traffic/clones", f"{API_URL}/repos/org/repo/contributors"])
+
+    def test_empty_repo_has_no_contributors(self):
+        self.serve = lambda method, url, **kwargs: response(204)
+        self.mtr3.transport.session.request = self.serve
+        repo = self.mtr3.for_repo('empty')
+        self.assertEqual(repo.get_contributor_count(repo.get_repo_handle(lazy=True)), 0)
+
+
+class RefreshRepoHandleTest(test_support.StateDirTestCase):
+    def setUp(self):
+        super().setUp()
+        transport = maintainer_transport.Transport(retries=0, cache=self.open_store(maintainer_cache.HttpCache))
+        transport.session.request = self.serve
+        args = argparse.Namespace(gh_token='token', gh_repos='repo', gh_org='org', debug=False, contributors_refresh=0,
+                                  api_url=API_URL)
+        self.mtr3 = maintainer_v3.Maintainer(args, transport)
+        self.stars = 1
+        self.statuses = []
+
+    def serve(self, method, url, headers=None, **kwargs):
+        etag = f'"v{self.stars}"'
+        status = 304 if (headers or {}).get('If-None-Match') == etag else 200
+        self.statuses.append(status)
+        return response(status, dict(name='repo', stargazers_count=self.stars) if status == 200 else None,
+                        headers={'ETag': etag})
+
+    def test_unchanged_repo_not_reported(self):
+        self.assertTrue(self.mtr3.refresh_repo_handle())
+        # Revalidated with the handle's ETag: the cache answers the 304 with a 304, not with its stored body
+        self.assertFalse(self.mtr3.refresh_repo_handle())
+        self.stars = 2
+        self.assertTrue(self.mtr3.refresh_repo_handle())
+        self.assertEqual(self.mtr3.get_repo_handle(lazy=True).stargazers_count, 2)
+        self.assertEqual(self.statuses, [200, 304, 200])
+
+
+if __name__ == '__main__':
+    unittest.main()
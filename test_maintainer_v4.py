@@ -0,0 +1,205 @@
+"""
+Unit tests of maintainer_v4.py, against a stubbed HTTP session
+"""
+import argparse
+import json
+import time
+import unittest
+from unittest import mock
+import requests
+import maintainer_querysize
+import maintainer_transport
+import maintainer_v4
+
+API_URL = 'http://github.test/api/v3'
+RESULT = {'data': {'rateLimit': None, 'repository': {'name': 'repo'}}}
+REPOS = [f"repo-{idx}" for idx in range(30)]
+
+
+def response(status=200, body=None):
+    """
+    requests.Response with a JSON body
+    """
+    result = requests.Response()
+    result.status_code = status
+    result._content = json.dumps(body).encode() if body is not None else b''
+    result.encoding = 'utf-8'
+    return result
+
+
+def repository(commits):
+    """
+    Batch query selection of a repo with no PRs, as returned by GitHub
+    """
+    return {'defaultBranchRef': {'target': {'history': {'totalCount': commits,
+                                                        'edges': [{'node': {'committedDate': '2020-01-01T00:00:00Z'}}]}}},
+            'openPullRequests': {'totalCount': 0, 'pageInfo': {'endCursor': None, 'hasNextPage': False}, 'nodes': []},
+            'issues': {'totalCount': commits % 7}, 'recentPullRequests': {'totalCount': 0, 'nodes': []},
+            'stargazers': {'totalCount': commits * 2}, 'forkCount': 1, 'mentionableUsers': {'totalCount': 3}}
+
+
+def maintainer(transport):
+    """
+    APIv4 Maintainer bound to 'repo', query sizes kept in memory
+    """
+    args = argparse.Namespace(gh_token='token', debug=False, gh_user=None, gh_repos='repo', gh_branch=None,
+                              gh_org='org', batch_size=None, light=False, backend='graphql', recent_prs=5,
+                              state_dir=None, incremental=False, api_url=API_URL)
+    return maintainer_v4.Maintainer(args, transport)
+
+
+class RunAdaptiveTest(unittest.TestCase):
+    def setUp(self):
+        self.answers = []
+        self.page_sizes = []
+        transport = maintainer_transport.Transport(retries=3)
+        transport.session.request = self.serve
+        self.mtr4 = maintainer(transport)
+        sleep = mock.patch.object(maintainer_transport.time, 'sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def serve(self, method, url, **kwargs):
+        self.page_sizes.append(kwargs['json']['variables']['pageSize'])
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def run_adaptive(self):
+        return self.mtr4.run_adaptive('open_prs', 'query', {})
+
+    def test_gateway_timeout_shrinks_without_retries(self):
+        self.answers = [response(502), response(504), response(body=RESULT)]
+        self.assertEqual(self.run_adaptive(), RESULT)
+        self.assertEqual(self.page_sizes, [100, 50, 25])
+        self.sleep.assert_not_called()
+
+    def test_timeout_shrinks_without_retries(self):
+        self.answers = [requests.ReadTimeout('read timed out'), response(body=RESULT)]
+        self.assertEqual(self.run_adaptive(), RESULT)
+        self.assertEqual(self.page_sizes, [100, 50])
+        self.sleep.assert_not_called()
+
+    def test_node_limit_shrinks(self):
+        self.answers = [response(body={'errors': [{'type': 'MAX_NODE_LIMIT_EXCEEDED'}]}), response(body=RESULT)]
+        self.assertEqual(self.run_adaptive(), RESULT)
+        self.assertEqual(self.page_sizes, [100, 50])
+
+    def test_smallest_pages_retried_by_the_transport(self):
+        self.mtr4.query_sizes.learned[('repo', 'open_prs')] = (maintainer_querysize.MIN_SIZES['open_prs'], time.time())
+        self.answers = [response(502), response(502), response(body=RESULT)]
+        self.assertEqual(self.run_adaptive(), RESULT)
+        self.assertEqual(self.page_sizes, [10, 10, 10])
+        self.assertEqual(self.sleep.call_count, 1)
+
+    def test_other_errors_still_retried(self):
+        # Only the timeouts are left to the resizing, a 503 is resent as is
+        self.answers = [response(503), response(body=RESULT)]
+        self.assertEqual(self.run_adaptive(), RESULT)
+        self.assertEqual(self.page_sizes, [100, 100])
+        self.assertEqual(self.sleep.call_count, 1)
+
+    def test_plain_query_retries_timeouts(self):
+        self.answers = [response(502), requests.ReadTimeout('read timed out'), response(body=RESULT)]
+        self.assertEqual(self.mtr4.run_query('query', {'pageSize': 1}), RESULT)
+        self.assertEqual(self.sleep.call_count, 2)
+
+
+class BatchMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.mtr4 = maintainer(maintainer_transport.Transport())
+        self.mtr4.run_query = self.run_query
+        self.batches = []
+        # Cost of each repo of a batch, as reported by rateLimit
+        self.repo_cost = 1
+        self.too_large = lambda batch: False
+
+    def run_query(self, query, variables, timeout_retries=None):
+        batch = [variables[f"name{idx}"] for idx in range(len(variables)) if f"name{idx}" in variables]
+        self.batches.append(batch)
+        if self.too_large(batch):
+            raise maintainer_querysize.QueryTooLarge('Query timed out with code 502')
+        data = {f"r{idx}": repository(int(repo.split('-')[1])) for idx, repo in enumerate(batch)}
+        data['rateLimit'] = {'cost': self.repo_cost * len(batch), 'remaining': 4000, 'resetAt': '2020-01-01T00:00:00Z'}
+        return {'data': data}
+
+    def test_build_batch_query(self):
+        query, variables = self.mtr4.build_batch_query(['a', 'b'])
+        self.assertEqual((variables['owner'], variables['name0'], variables['name1']), ('org', 'a', 'b'))
+        self.assertIn('r1: repository(owner: $owner, name: $name1)', query)
+        self.assertIn('defaultBranchRef', query)
+        self.assertNotIn('RepoCounts', query)
+        self.mtr4.branch = 'stable'
+        query, variables = self.mtr4.build_batch_query(['a'], counts=True)
+        self.assertEqual(variables['branch'], 'stable')
+        self.assertIn('object(expression: $branch)', query)
+        self.assertIn('...RepoCounts', query)
+
+    def test_aliases_mapped_to_repos(self):
+        results = self.mtr4.get_batch_metrics(REPOS[:3], counts=True)
+        self.assertEqual(list(results), REPOS[:3])
+        for commits, repo in enumerate(REPOS[:3]):
+            (total_commits, _), health, aggregates, counts = results[repo]
+            self.assertEqual(total_commits, str(commits))
+            self.assertEqual(health, (commits % 7, 0, 0))
+            self.assertIsNone(aggregates)
+            self.assertEqual(counts, (commits * 2, 1, 3))
+
+    def test_partial_errors(self):
+        def run_query(query, variables, timeout_retries=None):
+            result = self.run_query(query, variables)
+            result['data']['r1'] = None
+            result['errors'] = [{'type': 'NOT_FOUND', 'path': ['r1'], 'message': 'Could not resolve to a Repository'}]
+            # An empty repo has no default branch
+            result['data']['r2']['defaultBranchRef'] = None
+            return result
+
+        self.mtr4.run_query = run_query
+        results = self.mtr4.get_batch_metrics(REPOS[:4])
+        self.assertEqual([repo for repo, metrics in results.items() if metrics is None], REPOS[1:3])
+        self.assertEqual(results[REPOS[3]][0][0], '3')
+
+    def test_too_large_batch_split(self):
+        self.too_large = lambda batch: len(batch) > 2
+        self.mtr4.batch_size = 4
+        results = self.mtr4.get_batch_metrics(REPOS[:4])
+        self.assertEqual([len(batch) for batch in self.batches], [4, 2, 2])
+        self.assertTrue(all(results[repo] for repo in REPOS[:4]))
+
+    def test_too_large_repo_left_out(self):
+        self.too_large = lambda batch: REPOS[1] in batch
+        self.mtr4.batch_size = 2
+        results = self.mtr4.get_batch_metrics(REPOS[:3])
+        self.assertEqual(self.batches, [REPOS[:2], REPOS[:1], REPOS[1:2], REPOS[2:3]])
+        self.assertIsNone(results[REPOS[1]])
+        # Smaller pages are learned for it, the next runs collect it on its own
+        self.assertTrue(self.mtr4.query_sizes.reduced(maintainer_querysize.QUERY_SHAPES['batch_repo'], REPOS[1]))
+        self.batches = []
+        self.assertIsNone(self.mtr4.get_batch_metrics(REPOS[:3])[REPOS[1]])
+        self.assertNotIn(REPOS[1], sum(self.batches, []))
+
+    def test_batch_resized_toward_max_cost(self):
+        self.repo_cost = 2
+        self.mtr4.get_batch_metrics(REPOS[:25])
+        self.assertEqual([len(batch) for batch in self.batches], [10] + [maintainer_v4.MAX_BATCH_COST // 2] * 3)
+        # Cheap repos grow the batches up to MAX_BATCH_SIZE, within the node budget of one query
+        self.batches = []
+        self.repo_cost = 0.01
+        self.mtr4.batch_size = 1
+        self.mtr4.get_batch_metrics(REPOS * 4)
+        shape = maintainer_querysize.QUERY_SHAPES['batch_repo']
+        self.assertEqual(max(len(batch) for batch in self.batches),
+                         min(maintainer_v4.MAX_BATCH_SIZE,
+                             maintainer_querysize.max_copies(shape, self.mtr4.query_sizes.fit(shape))))
+
+    def test_failed_batch_left_to_per_repo(self):
+        def run_query(query, variables, timeout_retries=None):
+            raise Exception('Query failed to run by returning code of 500')
+
+        self.mtr4.run_query = run_query
+        self.assertEqual(self.mtr4.get_batch_metrics(REPOS[:3]), dict.fromkeys(REPOS[:3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
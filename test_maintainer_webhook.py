@@ -0,0 +1,141 @@
+"""
+Unit tests of maintainer_webhook.py
+"""
+import hashlib
+import hmac
+import json
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+import maintainer_daemon
+import maintainer_prstate
+import maintainer_webhook
+import test_support
+
+SECRET = 'It\'s a Secret to Everybody'
+
+
+def sign(body, secret=SECRET):
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class FakeMaintainer(object):
+    """
+    APIv4 Maintainer stand-in in incremental mode, serving fixed star counts
+    """
+    backend = 'graphql'
+    branch = None
+    transport = mock.Mock(instruments=None)
+
+    def __init__(self, pr_state):
+        self.pr_state = pr_state
+        self.open_pr_index = None
+
+    def for_repo(self, repo):
+        return self
+
+    def get_discovery_metrics(self):
+        return 1
+
+
+class SignatureTest(unittest.TestCase):
+    def test_verify_signature(self):
+        body = b'{"zen": "Keep it logically awesome."}'
+        self.assertTrue(maintainer_webhook.verify_signature(SECRET, body, sign(body)))
+        self.assertFalse(maintainer_webhook.verify_signature(SECRET, body + b' ', sign(body)))
+        self.assertFalse(maintainer_webhook.verify_signature(SECRET, body, sign(body, 'other secret')))
+        self.assertFalse(maintainer_webhook.verify_signature(SECRET, body, sign(body).replace('sha256=', 'sha1=')))
+        self.assertFalse(maintainer_webhook.verify_signature(SECRET, body, None))
+
+    def test_secret_required(self):
+        with self.assertRaises(ValueError):
+            maintainer_webhook.WebhookReceiver(None, None, ['repo'], '')
+
+
+class ReceiverTest(test_support.StateDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mtr4 = FakeMaintainer(self.open_store(maintainer_prstate.PRStateStore))
+        self.receiver = maintainer_webhook.WebhookReceiver(None, self.mtr4, ['repo'], SECRET)
+        self.receiver.results['repo'] = dict(repo='repo', total_stars=1, forks_count=0, commits='10', time_since_last=3,
+                                             total_open_issues=2, total_open_pull_reqs=1, total_average_time_for_pr=0)
+        self.receiver.open_prs['repo'] = {1: '2020-01-01T00:00:00Z'}
+
+    def test_open_prs_indexed_by_collection(self):
+        self.assertIs(self.mtr4.open_pr_index, self.receiver.open_prs)
+
+    def test_star_and_fork(self):
+        self.assertEqual(self.receiver.handle('star', {'action': 'created',
+                                                       'repository': {'name': 'repo', 'stargazers_count': 2}}),
+                         dict(total_stars=2))
+        self.receiver.handle('fork', {'repository': {'name': 'repo', 'forks_count': 4}})
+        self.assertEqual(self.receiver.results['repo']['forks_count'], 4)
+        # Repos that are not tracked are ignored
+        self.assertEqual(self.receiver.handle('star', {'repository': {'name': 'other', 'stargazers_count': 9}}), {})
+
+    def test_push(self):
+        payload = {'ref': 'refs/heads/main', 'commits': [{}, {}], 'head_commit': {'timestamp': '2020-01-01T00:00:00Z'},
+                   'repository': {'name': 'repo', 'default_branch': 'main'}}
+        changed = self.receiver.handle('push', payload)
+        self.assertEqual(changed['commits'], '12')
+        self.assertGreater(changed['time_since_last'], 0)
+        # Pushes to other branches do not count
+        self.assertEqual(self.receiver.handle('push', dict(payload, ref='refs/heads/topic')), {})
+
+    def test_issues(self):
+        self.receiver.handle('issues', {'action': 'opened', 'issue': {}, 'repository': {'name': 'repo'}})
+        self.receiver.handle('issues', {'action': 'labeled', 'issue': {}, 'repository': {'name': 'repo'}})
+        self.assertEqual(self.receiver.results['repo']['total_open_issues'], 3)
+
+    def test_pull_request_response_time(self):
+        def pull_request(action, number, updated_at, **fields):
+            payload = {'action': action, 'repository': {'name': 'repo'},
+                       'pull_request': dict(number=number, updated_at=updated_at, created_at=updated_at, **fields)}
+            return self.receiver.handle('pull_request', payload)
+
+        self.assertEqual(pull_request('opened', 2, '2020-01-01T00:00:00Z')['total_open_pull_reqs'], 2)
+        pull_request('review_requested', 2, '2020-01-02T00:00:00Z')
+        changed = pull_request('closed', 2, '2020-01-04T00:00:00Z', merged_at='2020-01-04T00:00:00Z')
+        self.assertEqual(changed['total_open_pull_reqs'], 1)
+        self.assertEqual(changed['pr_response_time_median'], 2)
+        self.assertEqual(self.mtr4.pr_state.aggregates('repo')['count'], 1)
+        # Not a response time event, and the PR count is unchanged
+        self.assertEqual(pull_request('labeled', 1, '2020-01-05T00:00:00Z'), {})
+
+    def test_daemon_keeps_webhook_fields(self):
+        daemon = maintainer_daemon.Daemon(None, self.mtr4, ['repo'], groups=('discovery',),
+                                          results=self.receiver.results, lock=self.receiver.lock,
+                                          kept_fields=maintainer_webhook.WEBHOOK_FIELDS)
+        self.receiver.handle('star', {'repository': {'name': 'repo', 'stargazers_count': 7}})
+        daemon.refresh('discovery', 'repo')
+        self.assertEqual(self.receiver.results['repo']['total_stars'], 7)
+        self.assertIs(daemon.results, self.receiver.results)
+
+    def test_serve(self):
+        with mock.patch('builtins.print'):
+            server = self.receiver.serve(host='127.0.0.1', port=0)
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_port}/"
+
+        def post(event, payload, signature=None):
+            body = json.dumps(payload).encode()
+            request = urllib.request.Request(url, body, {'X-GitHub-Event': event,
+                                                         'X-Hub-Signature-256': signature or sign(body)})
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return response.status
+            except urllib.error.HTTPError as err:
+                return err.code
+
+        star = {'repository': {'name': 'repo', 'stargazers_count': 5}}
+        self.assertEqual(post('star', star, signature='sha256=' + '0' * 64), 401)
+        self.assertEqual(self.receiver.results['repo']['total_stars'], 1)
+        self.assertEqual(post('star', star), 200)
+        self.assertEqual(self.receiver.results['repo']['total_stars'], 5)
+        # Accepted, but nothing tracked changed
+        self.assertEqual(post('ping', {'zen': 'Design for failure.'}), 202)
+
+
+if __name__ == '__main__':
+    unittest.main()
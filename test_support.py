@@ -0,0 +1,23 @@
+"""
+Fixtures shared by the unit tests of the stores kept under --state-dir
+"""
+import tempfile
+import unittest
+
+
+class StateDirTestCase(unittest.TestCase):
+    """
+    Test case with a fresh state directory, removed after each test
+    """
+    def setUp(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.state_dir = state_dir.name
+
+    def open_store(self, store_class, *args, **kwargs):
+        """
+        Store opened under the state directory, its database closed after the test
+        """
+        store = store_class(self.state_dir, *args, **kwargs)
+        self.addCleanup(store.db.close)
+        return store